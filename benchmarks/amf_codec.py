@@ -0,0 +1,80 @@
+"""Measures AMF decoding and encoding of typical RTMP payloads: connect command, @setDataFrame onMetaData
+and the same metadata in AMF3
+
+usage: PYTHONPATH=src python benchmarks/amf_codec.py [-n iterations]
+"""
+import getopt
+import sys
+import time
+from tube.rtmp.messages import amf0, amf3
+from tube.rtmp.messages.amf0 import Boolean, EcmaArray, Number, Object, String, StrictArray
+from tube.rtmp.messages.command import Command
+from tube.rtmp.messages.data import Data
+
+
+def _connect() -> bytes:
+    """Returns connect command body the way OBS sends it"""
+    return b''.join([String('connect').to_bytes(),
+                     Number(1.).to_bytes(),
+                     Object({'app': String('live'),
+                             'type': String('nonprivate'),
+                             'flashVer': String('FMLE/3.0 (compatible; FMSc/1.0)'),
+                             'swfUrl': String('rtmp://127.0.0.1:1935/live'),
+                             'tcUrl': String('rtmp://127.0.0.1:1935/live'),
+                             'fpad': Boolean(False),
+                             'capabilities': Number(239.),
+                             'audioCodecs': Number(3575.),
+                             'videoCodecs': Number(252.),
+                             'videoFunction': Number(1.),
+                             'objectEncoding': Number(0.)}).to_bytes()])
+
+
+def _metadata_values() -> dict:
+    return {'duration': 0., 'fileSize': 0., 'width': 1920., 'height': 1080., 'videocodecid': 7.,
+            'videodatarate': 6000., 'framerate': 30., 'audiocodecid': 10., 'audiodatarate': 160.,
+            'audiosamplerate': 48000., 'audiosamplesize': 16., 'audiochannels': 2., 'stereo': True,
+            'encoder': 'obs-output module (libobs version 29.1.3)', 'keyframes': [0., 2., 4., 6., 8., 10.]}
+
+
+def _metadata() -> bytes:
+    """Returns @setDataFrame onMetaData data message body"""
+    values = {}
+    for key, value in _metadata_values().items():
+        if isinstance(value, bool):
+            values[key] = Boolean(value)
+        elif isinstance(value, str):
+            values[key] = String(value)
+        elif isinstance(value, list):
+            values[key] = StrictArray([Number(k) for k in value])
+        else:
+            values[key] = Number(value)
+    return b''.join([String('@setDataFrame').to_bytes(), String('onMetaData').to_bytes(),
+                     EcmaArray(values).to_bytes()])
+
+
+def _measure(name: str, function, iterations: int) -> None:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - start
+    print(f'{name:>24}: {elapsed / iterations * 1e6:8.2f} us')
+
+
+def main():
+    """Prints time per payload of every operation"""
+    opts, _ = getopt.getopt(sys.argv[1:], 'n:')
+    iterations = int(dict(opts).get('-n', 20000))
+    connect, metadata = _connect(), _metadata()
+    values = _metadata_values()
+    array = len(String('@setDataFrame')) + len(String('onMetaData'))
+    metadata3 = amf3.Encoder().encode(values)
+    _measure('connect decode', lambda: Command.make(connect, 128), iterations)
+    _measure('onMetaData decode', lambda: Data.make(metadata), iterations)
+    _measure('onMetaData amf0 values', lambda: amf0.Type.decode(memoryview(metadata), array), iterations)
+    _measure('onMetaData amf0 encode', _metadata, iterations)
+    _measure('onMetaData amf3 decode', lambda: amf3.Decoder().decode(memoryview(metadata3)), iterations)
+    _measure('onMetaData amf3 encode', lambda: amf3.Encoder().encode(values), iterations)
+
+
+if __name__ == '__main__':
+    main()
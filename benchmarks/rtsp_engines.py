@@ -0,0 +1,88 @@
+"""Compares RTSP network engines (selector loop vs asyncio) streaming one file to several clients
+
+usage: PYTHONPATH=src python benchmarks/rtsp_engines.py -r root -f name [-c clients] [-t seconds] [-p port]
+"""
+import getopt
+import resource
+import socket
+import sys
+import threading
+import time
+from tube.tcp.service import Service as SelectorService
+from tube.tcp.aio_service import Service as AioService
+
+
+def _reply(sock, pending=b''):
+    """Reads RTSP reply, returns reply and rest of data"""
+    while b'\r\n\r\n' not in pending:
+        pending += sock.recv(4096)
+    head, _, rest = pending.partition(b'\r\n\r\n')
+    length = [int(k.split(b':')[1]) for k in head.split(b'\r\n') if k.lower().startswith(b'content-length')]
+    while length and len(rest) < length[0]:
+        rest += sock.recv(4096)
+    body_size = length[0] if length else 0
+    return head.decode() + '\r\n\r\n' + rest[:body_size].decode(), rest[body_size:]
+
+
+def _client(port, name, seconds, stats):
+    url = f'rtsp://127.0.0.1:{port}/{name}'
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(f'DESCRIBE {url} RTSP/1.0\r\nCSeq: 1\r\nAccept: application/sdp\r\n\r\n'.encode())
+    sdp, rest = _reply(sock)
+    tracks = [k.split(':')[1] for k in sdp.split('\r\n') if k.startswith('a=control:')]
+    session = ''
+    for i, track in enumerate(tracks):
+        sock.sendall(f'SETUP {url}/{track} RTSP/1.0\r\nCSeq: {i + 2}\r\n{session}'
+                     f'Transport: RTP/AVP/TCP;unicast;interleaved={2 * i}-{2 * i + 1}\r\n\r\n'.encode())
+        reply, rest = _reply(sock, rest)
+        session = [k for k in reply.split('\r\n') if k.startswith('Session: ')][0].split(';')[0] + '\r\n'
+    sock.sendall(f'PLAY {url} RTSP/1.0\r\nCSeq: {len(tracks) + 2}\r\n{session}Range: npt=0.000-\r\n\r\n'.encode())
+    _, rest = _reply(sock, rest)
+    received, start = len(rest), time.time()
+    sock.settimeout(.5)
+    while time.time() - start < seconds:
+        try:
+            data = sock.recv(65536)
+        except socket.timeout:
+            continue
+        if not data:
+            break
+        received += len(data)
+    sock.close()
+    stats.append(received)
+
+
+def _measure(service_class, port, params, name, clients, seconds):
+    service = service_class(('', port), params)
+    service.start()
+    time.sleep(1.)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_before = usage.ru_utime + usage.ru_stime
+    stats = []
+    threads = [threading.Thread(target=_client, args=(port, name, seconds, stats)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    service.terminate()
+    service.join()
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return sum(stats), usage.ru_utime + usage.ru_stime - cpu_before
+
+
+def main():
+    """Runs both engines one after another and prints throughput and server CPU time"""
+    opts, _ = getopt.getopt(sys.argv[1:], 'r:f:c:t:p:')
+    opts = dict(opts)
+    params = {'root': opts.get('-r', '.')}
+    clients, seconds = int(opts.get('-c', 10)), float(opts.get('-t', 10.))
+    port = int(opts.get('-p', 4567))
+    for engine, service_class in (('selector', SelectorService), ('asyncio', AioService)):
+        received, cpu = _measure(service_class, port, params, opts['-f'], clients, seconds)
+        print(f'{engine:>8}: {clients} clients, {received * 8 / seconds / 1e6:.2f} Mbit/s, '
+              f'server cpu {cpu:.2f}s ({100. * cpu / seconds:.0f}%)')
+        port += 1
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,16 @@
 
 
 class AdaptationSet:
-    def __init__(self, tkhd_box, mdhd_box):
+    def __init__(self, tkhd_box, mdhd_box, mime_type='video/mp4'):
         self._initialization = f'_init.mp4'
         self._mdhd_box = mdhd_box
         self._tkhd_box = tkhd_box
-        self._mime_type = 'video/mp4'
+        self._mime_type = mime_type
         self._media = f'_sn$Number$.m4s'
+        self.representation_id = ''
+        self.bandwidth = 0
+        self.codecs = ''
+        self.width, self.height = 0, 0
 
     @property
     def mime_type(self):
@@ -1,6 +1,16 @@
 """MP4 files are formed as a series of objects, called boxes.
    All data is contained in boxes; there is no other data within the file.
 """
+import sys
+from array import array
+
+
+def table_bytes(entries, typecode: str = 'I') -> bytes:
+    """Returns integer table entries as big endian bytestream"""
+    table = array(typecode, entries)
+    if sys.byteorder == 'little':
+        table.byteswap()
+    return table.tobytes()
 
 
 class BoxIterator:
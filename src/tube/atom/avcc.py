@@ -76,6 +76,9 @@ class Box(atom.Box):
             pps_id: int = BitReader(p[1:]).golomb_u()
             self.pps[pps_id] = p
             self.size += 2 + len(p)
+        if sps_list and pps_list:
+            self._sprop_parameter_sets = base64.b64encode(sps_list[-1]).decode('ascii') + ',' + \
+                base64.b64encode(pps_list[-1]).decode('ascii')
 
     def _read_parameter_set(self, file):
         """reads one parameter set from file"""
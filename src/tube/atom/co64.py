@@ -1,8 +1,7 @@
 """The chunk offset table gives the index of each chunk into the containing file.
    The variant, permitting the use of 64-bit offsets
 """
-from functools import reduce
-from .atom import FullBox, full_box_derived
+from .atom import FullBox, full_box_derived, table_bytes
 
 
 def atom_type():
@@ -29,9 +28,8 @@ class Box(FullBox):
 
     def init_from_args(self, **kwargs):
         self.type = 'co64'
-        self.size = 16
+        self.entries = kwargs.get('entries', [])
+        self.size = 16 + 8 * len(self.entries)
 
     def to_bytes(self):
-        ret = super().to_bytes() + len(self.entries).to_bytes(4, byteorder='big')
-        return ret + reduce(lambda a, b: a + b,
-                            map(lambda x: x.to_bytes(8, byteorder='big'), self.entries))
+        return super().to_bytes() + len(self.entries).to_bytes(4, byteorder='big') + table_bytes(self.entries, 'Q')
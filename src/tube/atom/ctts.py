@@ -4,7 +4,6 @@
    CT(n) = DT(n) + CTTS(n)
    where CTTS(n) is the (uncompressed) table entry for sample n.
    """
-from functools import reduce
 from .atom import FullBox, full_box_derived
 
 
@@ -15,9 +14,11 @@ def atom_type():
 
 class Entry:
     """Composition time to sample box entry"""
-    def __init__(self, file):
-        self._count = int.from_bytes(file.read(4), 'big')
-        self._offset = int.from_bytes(file.read(4), 'big')
+    def __init__(self, file=None, count: int = 0, offset: int = 0):
+        if file is not None:
+            count, offset = int.from_bytes(file.read(4), 'big'), int.from_bytes(file.read(4), 'big')
+        self._count = count
+        self._offset = offset
 
     def __repr__(self):
         return f'Entry({self._count}, {self._offset})'
@@ -56,7 +57,8 @@ class Box(FullBox):
 
     def init_from_args(self, **kwargs):
         self.type = 'ctts'
-        self.size = 16
+        self.entries = kwargs.get('entries', [])
+        self.size = 16 + 8 * len(self.entries)
 
     def _read_entry(self, file):
         """Reads entry from file"""
@@ -65,5 +67,4 @@ class Box(FullBox):
     def to_bytes(self):
         ret = super().to_bytes()
         ret += len(self.entries).to_bytes(4, byteorder='big')
-        ret += reduce(lambda a, b: a + b, map(lambda x: x.to_bytes(), self.entries))
-        return ret
+        return ret + b''.join(x.to_bytes() for x in self.entries)
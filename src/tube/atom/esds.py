@@ -1,4 +1,5 @@
 """An MPEG-4 elementary stream descriptor atom. This extension is required for MPEG-4 video"""
+import io
 from .atom import FullBox, full_box_derived
 
 
@@ -187,8 +188,23 @@ class Box(FullBox):
                ' descriptors: [' + ''.join('{'+str(d)+'}' for d in self.descriptors) + ']'
 
     def init_from_file(self, file):
+        self._read_descriptors(file, self.size - (file.tell() - self.position))
+
+    def init_from_args(self, **kwargs):
+        """Makes descriptors of MPEG-4 audio with the audio specific config"""
+        self.type = 'esds'
+        config = kwargs.get('config', b'')
+        bit_rate = kwargs.get('bit_rate', 0).to_bytes(4, byteorder='big')
+        specific = bytes([5, len(config)]) + config
+        decoder = bytes([4, 13 + len(specific), 0x40, 0x15]) + bytes(3) + bit_rate + bit_rate + specific
+        descriptors = bytes([3, 6 + len(decoder)]) + kwargs.get('stream_id', 0).to_bytes(2, byteorder='big') + \
+            b'\x00' + decoder + bytes([6, 1, 2])
+        self._read_descriptors(io.BytesIO(descriptors), len(descriptors))
+        self.size += len(descriptors)
+
+    def _read_descriptors(self, file, left):
         self.descriptors = []
-        left = self.size - (file.tell() - self.position)
+        start = file.tell()
         while left > 0:
             tag = file.read(1)[0]
             descriptor = {
@@ -201,7 +217,8 @@ class Box(FullBox):
                 self.descriptors.append(descriptor)
             else:
                 break
-            left = self.size - (file.tell() - self.position)
+            left -= file.tell() - start
+            start = file.tell()
 
     @property
     def config(self):
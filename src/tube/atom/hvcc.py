@@ -5,6 +5,7 @@ from enum import IntEnum
 from functools import reduce
 import base64
 from . import atom
+from ..bitreader import Reader as BitReader, ReaderException
 
 
 class NetworkUnitType(IntEnum):
@@ -79,10 +80,14 @@ class NetworkUnitHeader:
 
 class ConfigSet:
     """Abstraction of a set of configuration"""
-    def __init__(self, file):
-        self.type = NetworkUnitHeader(file.read(1))
-        count = int.from_bytes(file.read(2), 'big')
-        self.sets = list(map(lambda x: self.read_configure_set(file), range(count)))
+    def __init__(self, file=None, nal_unit_type=0, sets=()):
+        if file is None:
+            self.type = NetworkUnitHeader(bytes([nal_unit_type]))
+            self.sets = list(sets)
+        else:
+            self.type = NetworkUnitHeader(file.read(1))
+            count = int.from_bytes(file.read(2), 'big')
+            self.sets = list(map(lambda x: self.read_configure_set(file), range(count)))
         self.base64_set = base64.b64encode(self.sets[-1]).decode('ascii')
 
     @staticmethod
@@ -121,6 +126,7 @@ class Box(atom.Box):
         self.frame_rate = 0
         self.max_sub_layers = 0
         self.config_sets = []
+        self.width, self.height = 0, 0  # of pictures, known when made of SPS
         super().__init__(*args, **kwargs)
 
     def __repr__(self):
@@ -140,6 +146,53 @@ class Box(atom.Box):
         """Returns length of avcC size field"""
         return 4
 
+    def init_from_args(self, **kwargs):
+        """Takes VPS, SPS and PPS lists, profile, chroma format and bit depths are those of the last SPS"""
+        self.type = 'hvcC'
+        sets = [(NetworkUnitType.VPS_NUT, kwargs.get('vps', [])),
+                (NetworkUnitType.SPS_NUT, kwargs.get('sps', [])),
+                (NetworkUnitType.PPS_NUT, kwargs.get('pps', []))]
+        self.config_sets = [ConfigSet(nal_unit_type=nal_unit_type, sets=units) for nal_unit_type, units in sets if units]
+        self.min_spacial_segmentation = 0xf000
+        self.chroma, self.bit_depth = b'\xfc\xfd', b'\xf8\xf8'
+        self.general_config = bytes(12)
+        layers = 1
+        if kwargs.get('sps'):
+            try:
+                layers, chroma_format, luma_depth, chroma_depth = self._parse_sps(kwargs['sps'][-1])
+                self.chroma = bytes([0xfc, 0xfc | chroma_format])
+                self.bit_depth = bytes([0xf8 | luma_depth, 0xf8 | chroma_depth])
+            except (ReaderException, IndexError):
+                pass  # general profile is kept as far as SPS goes
+        self.max_sub_layers = (layers << 3) | 3  # temporal layers, 4 byte unit length
+        self.size += 23 + sum(3 + sum(2 + len(unit) for unit in config_set.sets) for config_set in self.config_sets)
+
+    def _parse_sps(self, sps):
+        """Takes general profile and picture size of SPS. Returns sub-layers, chroma format and bit depths"""
+        rbsp = sps[2:].replace(b'\x00\x00\x03', b'\x00\x00')
+        sub_layers = ((rbsp[0] >> 1) & 7) + 1
+        self.general_config = rbsp[1:13]
+        reader = BitReader(rbsp[13:])
+        present = [(reader.bit(), reader.bit()) for _ in range(sub_layers - 1)]
+        if sub_layers > 1:
+            reader.bits(2 * (9 - sub_layers))
+        for profile_present, level_present in present:
+            if profile_present:
+                reader.bits(88)
+            if level_present:
+                reader.bits(8)
+        reader.golomb_u()  # sps_seq_parameter_set_id
+        chroma_format = reader.golomb_u()
+        if chroma_format == 3:
+            reader.bit()  # separate_colour_plane_flag
+        self.width, self.height = reader.golomb_u(), reader.golomb_u()
+        if reader.bit():  # conformance window
+            sub_width, sub_height = (2, 2) if chroma_format == 1 else (2, 1) if chroma_format == 2 else (1, 1)
+            left, right, top, bottom = (reader.golomb_u() for _ in range(4))
+            self.width -= sub_width * (left + right)
+            self.height -= sub_height * (top + bottom)
+        return sub_layers, chroma_format, reader.golomb_u(), reader.golomb_u()
+
     def init_from_file(self, file):
         self._read_some(file, 1)
         self.general_config = self._read_some(file, 12)
@@ -23,6 +23,11 @@ class Box(FullBox):
         self.balance = int.from_bytes(self._read_some(file, 2), "big")
         self._read_some(file, 2)
 
+    def init_from_args(self, **kwargs):
+        self.type = atom_type()
+        self.balance = kwargs.get('balance', 0)
+        self.size = 16
+
     def to_bytes(self):
         ret = super().to_bytes() + \
               self.balance.to_bytes(2, byteorder='big') + \
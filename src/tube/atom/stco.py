@@ -1,5 +1,5 @@
 """The chunk offset table gives the index of each chunk into the containing file"""
-from .atom import FullBox, full_box_derived
+from .atom import FullBox, full_box_derived, table_bytes
 
 
 def atom_type():
@@ -27,11 +27,10 @@ class Box(FullBox):
 
     def init_from_args(self, **kwargs):
         self.type = 'stco'
-        self.size = 16
+        self.entries = kwargs.get('entries', [])
+        self.size = 16 + 4 * len(self.entries)
 
     def to_bytes(self):
-        ret = super().to_bytes() + \
-              len(self.entries).to_bytes(4, byteorder='big')
-        for entry in self.entries:
-            ret += entry.to_bytes(4, byteorder='big')
-        return ret
+        return super().to_bytes() + \
+            len(self.entries).to_bytes(4, byteorder='big') + \
+            table_bytes(self.entries)
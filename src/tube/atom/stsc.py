@@ -84,7 +84,8 @@ class Box(FullBox):
 
     def init_from_args(self, **kwargs):
         self.type = 'stsc'
-        self.size = 16
+        self.entries = kwargs.get('entries', [])
+        self.size = 16 + 12 * len(self.entries)
 
     def append(self, frame_size: int):
         if not self.entries:
@@ -149,6 +149,20 @@ class AudioSampleEntry(SampleEntry):
                     self.stream_descriptors = esds.Box(file=file, depth=self._depth + 1)
                     left -= self.stream_descriptors.size
 
+    def init_from_args(self, **kwargs):
+        super().init_from_args(**kwargs)
+        self.type = kwargs.get('format', 'mp4a')
+        self.channel_count = kwargs.get('channels', 2)
+        self.sample_size = kwargs.get('sample_size', 16)
+        self.sample_rate = kwargs.get('sample_rate', 0) << 16
+        self.stream_descriptors = None
+        self.size += 20
+
+    def add_descriptors(self, box):
+        """Sets elementary stream descriptor box"""
+        self.stream_descriptors = box
+        self.size += box.size
+
     def __repr__(self):
         ret = super().__repr__() +\
               f" channels:{self.channel_count}" \
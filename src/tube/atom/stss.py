@@ -0,0 +1,40 @@
+"""The sync sample table lists random access points of the stream"""
+from .atom import FullBox, full_box_derived, table_bytes
+
+
+def atom_type():
+    """Returns this atom type"""
+    return 'stss'
+
+
+@full_box_derived
+class Box(FullBox):
+    """Sync sample numbers, every sample is a sync one if the box is absent"""
+    def __init__(self, *args, **kwargs):
+        self.entries = []
+        super().__init__(*args, **kwargs)
+
+    def __repr__(self):
+        ret = super().__repr__() + ' sync samples:[' + \
+              ' '.join(str(k) for k in self.entries) + ']'
+        return ret
+
+    def init_from_file(self, file):
+        count = int.from_bytes(self._read_some(file, 4), "big")
+        self.entries = list(
+            map(lambda x: int.from_bytes(self._read_some(file, 4), "big"), range(count))
+        )
+
+    def init_from_args(self, **kwargs):
+        self.type = 'stss'
+        self.entries = kwargs.get('entries', [])
+        self.size = 16 + 4 * len(self.entries)
+
+    def append(self, entry: int):
+        self.entries.append(entry)
+        self.size += 4
+
+    def to_bytes(self):
+        return super().to_bytes() + \
+            len(self.entries).to_bytes(4, byteorder='big') + \
+            table_bytes(self.entries)
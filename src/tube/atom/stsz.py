@@ -1,5 +1,5 @@
 """Sample sizes (framing)"""
-from .atom import FullBox, full_box_derived
+from .atom import FullBox, full_box_derived, table_bytes
 
 
 def atom_type():
@@ -32,8 +32,8 @@ class Box(FullBox):
     def init_from_args(self, **kwargs):
         self.type = 'stsz'
         super().init_from_args(**kwargs)
-        self.size = 20
-        self.entries = []
+        self.entries = kwargs.get('entries', [])
+        self.size = 20 + 4 * len(self.entries)
         self.sample_size = 0
 
     def append(self, entry: int):
@@ -47,5 +47,5 @@ class Box(FullBox):
             len(self.entries).to_bytes(4, byteorder='big')
         ]
         if self.sample_size == 0:
-            rc.extend([e.to_bytes(4, byteorder='big') for e in self.entries])
+            rc.append(table_bytes(self.entries))
         return b''.join(rc)
@@ -48,7 +48,8 @@ class Box(FullBox):
 
     def init_from_args(self, **kwargs):
         self.type = 'stts'
-        self.size = 16
+        self.entries = kwargs.get('entries', [])
+        self.size = 16 + 8 * len(self.entries)
 
     def append(self, timestamp: int):
         if not self._last_timestamp:
@@ -0,0 +1,31 @@
+"""The track fragment decode time gives the decode time of the first sample of the track fragment"""
+from .atom import FullBox, full_box_derived
+
+
+def atom_type():
+    """Returns this atom type"""
+    return 'tfdt'
+
+
+@full_box_derived
+class Box(FullBox):
+    """Track fragment base media decode time box"""
+    def __init__(self, *args, **kwargs):
+        self.base_media_decode_time = 0
+        super().__init__(*args, **kwargs)
+
+    def __repr__(self):
+        return super().__repr__() + f" base media decode time:{self.base_media_decode_time}"
+
+    def init_from_file(self, file):
+        self.base_media_decode_time = int.from_bytes(self._read_some(file, 8 if self.version == 1 else 4), "big")
+
+    def init_from_args(self, **kwargs):
+        self.type = atom_type()
+        self.version = 1
+        self.base_media_decode_time = kwargs.get('base_media_decode_time', 0)
+        self.size = 20
+
+    def to_bytes(self):
+        return super().to_bytes() + \
+            self.base_media_decode_time.to_bytes(8 if self.version == 1 else 4, byteorder='big')
@@ -12,6 +12,7 @@ class Flags(IntFlag):
     DEFAULT_SAMPLE_SIZE_PRESENT = 0x000010
     DEFAULT_SAMPLE_FLAGS_PRESENT = 0x000020
     DURATION_IS_EMPTY = 0x010000
+    DEFAULT_BASE_IS_MOOF = 0x020000
 
 
 class OptionalFields:
@@ -33,6 +33,7 @@ class Frame:
     def __init__(self, unit_size_bytes=0):
         self.duration, self.offset, self.size = 0, 0, 0
         self.composition_time = None
+        self.decoding_time = None  # known to live sources only, files tell durations
         self._data = b''
         self._chunk_offset = 0
         self._unit_size_bytes = unit_size_bytes
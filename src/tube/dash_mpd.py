@@ -3,7 +3,7 @@ from datetime import timedelta
 
 
 class DashMpd:
-    def __init__(self, title_text, duration, max_segment_duration, adaptation_sets):
+    def __init__(self, title_text, duration, max_segment_duration, adaptation_sets, segment_alignment=True):
         dt = str(timedelta(seconds=duration)).split(':')
         duration = f'PT{dt[0]}H{dt[1]}M{dt[2]}S'
         self._value = xmlTree.Element('MPD')
@@ -20,19 +20,28 @@ class DashMpd:
         title.text = title_text
         period = xmlTree.SubElement(self._value, 'Period')
         period.set('duration', duration)
-        for adaptation in adaptation_sets:
+        for adaptation in adaptation_sets:  # a list of adaptations is one set of alternative representations
+            representations = adaptation if isinstance(adaptation, list) else [adaptation]
             adaptation_set = xmlTree.SubElement(period, 'AdaptationSet')
-            adaptation_set.set('segmentAlignment', 'true')
-            adaptation_set.set('lang', adaptation.language)
-            representation = xmlTree.SubElement(adaptation_set, 'Representation')
-            representation.set('id', str(adaptation.id))
-            representation.set('mimeType', adaptation.mime_type)
-            segment_template = xmlTree.SubElement(representation, 'SegmentTemplate')
-            segment_template.set('timescale', str(adaptation.timescale))
-            segment_template.set('media', adaptation.media)
-            segment_template.set('startNumber', '0')
-            segment_template.set('duration', str(adaptation.duration))
-            segment_template.set('initialization', adaptation.initialization)
+            adaptation_set.set('segmentAlignment', 'true' if segment_alignment else 'false')
+            adaptation_set.set('lang', representations[0].language)
+            for rendition in representations:
+                representation = xmlTree.SubElement(adaptation_set, 'Representation')
+                representation.set('id', rendition.representation_id or str(rendition.id))
+                representation.set('mimeType', rendition.mime_type)
+                if rendition.bandwidth:
+                    representation.set('bandwidth', str(rendition.bandwidth))
+                if rendition.codecs:
+                    representation.set('codecs', rendition.codecs)
+                if rendition.width:
+                    representation.set('width', str(rendition.width))
+                    representation.set('height', str(rendition.height))
+                segment_template = xmlTree.SubElement(representation, 'SegmentTemplate')
+                segment_template.set('timescale', str(rendition.timescale))
+                segment_template.set('media', rendition.media)
+                segment_template.set('startNumber', '0')
+                segment_template.set('duration', str(rendition.duration))
+                segment_template.set('initialization', rendition.initialization)
 
     def __str__(self):
         """Returns prepared DASH MPD"""
@@ -0,0 +1,119 @@
+"""File operations of ingest made on a thread of their own, so that a stalled disk holds up no network loop.
+Data waiting to be written counts against the budget of its connection and the budget of the process"""
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+_lock: threading.Lock = threading.Lock()
+_buffered: int = 0  # bytes waiting to be written by all connections of the process
+_throttled_time: float = 0.  # seconds reads of all connections have been paused for
+
+
+def buffered() -> int:
+    """Returns bytes of ingest waiting to be written by all connections of the process"""
+    return _buffered
+
+
+def throttled_time() -> float:
+    """Returns seconds reads of ingest have been paused for by all connections of the process"""
+    return _throttled_time
+
+
+class IngestBudget:
+    """Bytes of ingest a connection has waiting to be written. Reads of the connection are paused while it
+    or the process is over the limit and resumed once writes catch up, time spent paused is accumulated"""
+    connection_limit: int = 32 * 1024 * 1024
+    process_limit: int = 256 * 1024 * 1024
+
+    def __init__(self, connection_limit: int = 0, process_limit: int = 0) -> None:
+        self.size: int = 0
+        self.throttles: int = 0
+        self.throttled_time: float = 0.
+        self.connection_limit: int = connection_limit or IngestBudget.connection_limit
+        self.process_limit: int = process_limit or IngestBudget.process_limit
+        self._throttled_since: Optional[float] = None
+
+    def take(self, size: int) -> None:
+        """Counts data queued to be written"""
+        global _buffered
+        with _lock:
+            self.size += size
+            _buffered += size
+
+    def release(self, size: int) -> None:
+        """Counts data written off"""
+        global _buffered
+        with _lock:
+            self.size -= size
+            _buffered -= size
+
+    @property
+    def exceeded(self) -> bool:
+        """Verifies if the connection or the process has more data waiting than its limit"""
+        return self.size > self.connection_limit or _buffered > self.process_limit
+
+    @property
+    def throttled(self) -> bool:
+        """Verifies if reads are paused"""
+        return self._throttled_since is not None
+
+    def throttle(self) -> None:
+        """Marks reads paused"""
+        if self._throttled_since is None:
+            self._throttled_since = time.monotonic()
+            self.throttles += 1
+
+    def resume(self) -> float:
+        """Marks reads resumed. Returns seconds they have been paused for"""
+        global _throttled_time
+        if self._throttled_since is None:
+            return 0.
+        paused, self._throttled_since = time.monotonic() - self._throttled_since, None
+        self.throttled_time += paused
+        with _lock:
+            _throttled_time += paused
+        return paused
+
+
+class DiskWriter:
+    """Makes file operations of a connection in order on a thread of its own, started with the first one.
+    Operations carry the size of data they write, it is taken from the budget until they are made.
+    Without a budget operations are made at once"""
+    def __init__(self, budget: Optional[IngestBudget] = None) -> None:
+        self._budget: Optional[IngestBudget] = budget
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def call(self, function: Callable, *args, size: int = 0) -> None:
+        """Queues the operation"""
+        if self._budget is None:
+            self._make(function, args)
+            return
+        self._budget.take(size)
+        self._queue.put((function, args, size))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name='disk writer')
+            self._thread.start()
+
+    def close(self) -> None:
+        """Lets operations queued be made and ends the thread. Does not wait for them"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._queue, self._thread = queue.Queue(), None
+
+    def _run(self, operations: queue.Queue) -> None:
+        while True:
+            operation = operations.get()
+            if operation is None:
+                return
+            function, args, size = operation
+            self._make(function, args)
+            self._budget.release(size)
+
+    @staticmethod
+    def _make(function: Callable, args: tuple) -> None:
+        try:
+            function(*args)
+        except Exception as e:  # noqa # pylint: disable=broad-except
+            print(f'Exception: {e}')
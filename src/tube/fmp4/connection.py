@@ -0,0 +1,94 @@
+"""Live fragmented MP4 over HTTP network connection"""
+import time
+import urllib.parse
+from .. import livesource
+from ..livesource import LiveSource, LiveReader
+from ..rtsp.output import OutputQueue
+from ..rtsp.parser import Parser
+
+
+class Connection:
+    """Streams live ingest as progressive fragmented mp4 of unknown length: the init segment, then moof and mdat
+    of samples ingested since the previous fragment. Fragments are produced while the client keeps up, a client
+    left behind by the ring of samples resumes from the next key frame. The connection closes once publishing ends"""
+    poll_interval: float = .01  # seconds to look for new samples again
+
+    def __init__(self, address, params):
+        self._address = address
+        self._parser = Parser()
+        self._output = OutputQueue(params.get('queue_limit', 4 * 1024 * 1024), 'wait')
+        self._source = None
+        self._reader = None
+        print(f'HTTP connect from {self._address}')
+
+    def on_read_event(self, key, data):
+        """Manager read socket event"""
+        if not data:
+            raise EOFError()
+        self._parser.feed(data)
+        for request in self._parser:
+            if self._source is None:
+                self._on_request(request.headers, key.data)
+
+    def on_write_event(self, key):
+        """Manager write socket event"""
+        self._output.push(key.data.outb)
+        key.data.outb = b''
+        if self.playing and self._output.writable:
+            for stream, packets, keyframe in self.get_next_frames():
+                self._output.push_frame(stream, packets, keyframe)
+        if self._output:
+            self._output.send(key.fileobj)  # Should be ready to write
+        elif self.finished:
+            raise EOFError()
+
+    @property
+    def playing(self):
+        """Verifies if live ingest is being streamed to the client"""
+        return self._reader is not None and not self.finished
+
+    @property
+    def finished(self):
+        """Verifies if publishing has ended and everything ingested is given to the client"""
+        return self._reader is not None and self._reader.ended
+
+    @property
+    def frame_filter(self):
+        """Returns frame drop policy holder of the connection"""
+        return self._output.filter
+
+    def next_frame_time(self):
+        """Returns now if any sample has come, a poll interval later otherwise"""
+        return time.time() + (0. if self._reader.pending() else self.poll_interval)
+
+    def get_next_frames(self):
+        """Returns samples ingested since the previous call as a fragment: [(0, [(moof and mdat,)], keyframe)]"""
+        video = self._reader.samples(LiveSource.video_track_id) if LiveSource.video_track_id in self._tracks else []
+        audio = self._reader.samples(LiveSource.audio_track_id) if LiveSource.audio_track_id in self._tracks else []
+        if not video and not audio:
+            return []
+        return [(0, [(self._source.fragment(video, audio),)], video[0].keyframe if video else True)]
+
+    def close(self):
+        """Stops streaming"""
+        self._reader = None
+
+    @property
+    def _tracks(self):
+        return self._reader.samples_info
+
+    def _on_request(self, headers, data):
+        method, path = (headers[0].split() + ['', ''])[:2]
+        name = urllib.parse.unquote(urllib.parse.urlsplit(path).path).strip('/')
+        if name.endswith('.mp4'):
+            name = name[:-4]
+        source = livesource.find(name)
+        if method != 'GET' or source is None or not source.described:
+            data.outb = b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n'
+            return
+        self._source, self._reader = source, LiveReader(source)
+        data.outb = b''.join([b'HTTP/1.1 200 OK\r\n',
+                              b'Content-Type: video/mp4\r\n',
+                              b'Cache-Control: no-cache\r\n',
+                              b'Connection: close\r\n\r\n',
+                              source.init_segment])
@@ -2,14 +2,46 @@
 import json
 import logging
 import os
+import re
 import ssl
 import time
+import urllib.parse
 from .dash_mpd import DashMpd
+from .ladder import Ladder
 from http.server import BaseHTTPRequestHandler
 from .reader import Reader
 from .segmenter import SegmentMaker
 from .writer import Writer
 from .cdn import Cdn
+from .livesink import LiveSink
+
+_live_playlists = {}  # {path: (mtime, inode, body, state)} of live playlists being waited on
+
+
+def _live_playlist(folder):
+    """Returns body of the live playlist of the folder and its state: (media sequence, part) of the next part
+       to come, None when the stream has ended, the target duration and the part target duration.
+       The playlist is parsed again only when it has been rewritten"""
+    path = os.path.join(folder, LiveSink.playlist)
+    try:
+        stat = os.stat(path)
+        cached = _live_playlists.get(path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_ino):
+            return cached[2:]
+        with open(path, 'rb') as f:
+            body = f.read()
+    except OSError:  # nothing has been cut yet or the stream is gone
+        _live_playlists.pop(path, None)
+        return b'', (None, 6, 0.)
+    playlist = body.decode()
+    hint = re.search(r'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="[^"]*?(\d+)\.(\d+)\.m4s"', playlist)
+    target = re.search(r'#EXT-X-TARGETDURATION:(\d+)', playlist)
+    part_target = re.search(r'#EXT-X-PART-INF:PART-TARGET=([\d.]+)', playlist)
+    state = ((int(hint.group(1)), int(hint.group(2))) if hint else None,
+             int(target.group(1)) if target else 6,
+             float(part_target.group(1)) if part_target else 0.)
+    _live_playlists[path] = stat.st_mtime_ns, stat.st_ino, body, state
+    return body, state
 
 
 def handler(params):
@@ -21,7 +53,9 @@ def handler(params):
             self._segment_floor = float(params.get("segment", "6."))
             self._verbal = params.get("verb", False)
             self._cache = params.get("cache", False)
+            self._demux = params.get("demux", False)
             self.segment_makers = params.get("segment_makers", None)
+            self.ladders = params.get("ladders", {})
             self._filename = ''
             self.path = ''
             super().__init__(*args, **kwargs)
@@ -80,10 +114,15 @@ def handler(params):
             else:
                 self._reply_error(501)
 
-        def _stream_media_playlist(self):
+        def _stream_media_playlist(self, variant=''):
             segment_maker = self._get_segment_maker()
             if segment_maker:
-                playlist = segment_maker.media_playlist()
+                if variant == '_master':
+                    playlist = segment_maker.master_playlist()
+                elif variant == '_iframes':
+                    playlist = segment_maker.iframe_playlist()
+                else:
+                    playlist = segment_maker.media_playlist()
                 self.send_response(200)
                 self.send_header('Content-type', 'application/vnd.apple.mpegurl')
                 self.send_header('Content-length', str(len(playlist)))
@@ -97,21 +136,51 @@ def handler(params):
             if idx < 0:
                 self._reply_error(404)
                 return
-            segment_maker = self.segment_makers.get(self.path[:idx])
+            segment_maker = self._get_ladder_maker(self.path[:idx])
             if segment_maker is None:
                 self._reply_error(501)
                 return
-            self.send_response(200)
-            self.send_header('Content-type', 'video/mp4')
             if self.path[idx+1:-4] == 'init':
                 body = segment_maker.init()
+                size = len(body)
             else:
                 segment_number = int(self.path[idx+3:-4])
-                body = segment_maker.segment(segment_number)
+                size = segment_maker.segment_size(segment_number)
+            byte_range = self._byte_range(size)
+            if byte_range and byte_range[0] >= byte_range[1]:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.end_headers()
+                return
+            start, end = byte_range or (0, size)
+            if self.path[idx+1:-4] == 'init':
+                body = body[start:end]
+            else:
+                body = segment_maker.segment(segment_number, start, end)
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-type', 'video/mp4')
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
             self.send_header('Content-length', str(len(body)))
             self.end_headers()
             self.wfile.write(body)
 
+        def _byte_range(self, size):
+            """Returns (start, end) of the first range of Range header, None if there is no valid range.
+            An unsatisfiable range comes with start not below end"""
+            value = self.headers.get('Range', '')
+            if not value.startswith('bytes='):
+                return None
+            match = re.fullmatch(r'([0-9]*)-([0-9]*)', value[6:].split(',')[0].strip())
+            if not match or not any(match.groups()):
+                return None
+            first, last = match.groups()
+            if not first:
+                return max(size - int(last), 0), size
+            if last and int(last) < int(first):
+                return None
+            return int(first), min(int(last) + 1, size) if last else size
+
         def _stream_cdn(self):
             try:
                 with Cdn(self._root, self.path.split('?proto=cdn')[0]) as f:
@@ -133,8 +202,55 @@ def handler(params):
             self.end_headers()
             self.wfile.write(reply.encode())
 
+        def _stream_ladder(self, extension):
+            ladder = self._get_ladder(self.path, brands=['iso5', 'avc1', 'dash'] if extension == '.mpd' else None)
+            if ladder is None:
+                return False
+            if extension == '.mpd':
+                body, content_type = ladder.mpd(self.path[1:]), 'application/dash+xml'
+            else:
+                body, content_type = ladder.master_playlist(), 'application/vnd.apple.mpegurl'
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+            return True
+
+        def _get_ladder(self, path, **kwargs):
+            ladder = self.ladders.get(path)
+            if ladder is None:
+                renditions = {f'{path}_{height}': filename
+                              for height, filename in sorted(Ladder.renditions(self._root, path[1:]).items(),
+                                                             reverse=True)}
+                if not renditions and self._demux and os.path.isfile(os.path.join(self._root, path[1:]+'.mp4')):
+                    renditions = {f'{path}_video': os.path.join(self._root, path[1:]+'.mp4')}
+                if not renditions:
+                    return None
+                ladder = Ladder(renditions,
+                                path,
+                                self.server.server_address,
+                                demux=self._demux,
+                                segment_duration=self._segment_floor,
+                                brands=kwargs.get('brands'),
+                                is_ssl=issubclass(type(self.request), ssl.SSLSocket),
+                                cache=self._cache,
+                                verbal=self._verbal)
+                self.ladders[path] = ladder
+                self.segment_makers.update(ladder.makers)
+                self.segment_makers.update(ladder.audio)
+            return ladder
+
+        def _get_ladder_maker(self, path, **kwargs):
+            segment_maker = self.segment_makers.get(path)
+            rendition = re.match(r'(.+)_(\d+|video|audio\d+)$', path)
+            if segment_maker is None and rendition:
+                ladder = self._get_ladder(rendition.group(1), **kwargs)
+                segment_maker = ladder.maker(path) if ladder else None
+            return segment_maker
+
         def _get_segment_maker(self, **kwargs):
-            segment_maker = self.segment_makers.get(self.path)
+            segment_maker = self._get_ladder_maker(self.path, **kwargs)
             if segment_maker is None:
                 segment_maker = SegmentMaker(self._filename,
                                              self.path,
@@ -147,6 +263,85 @@ def handler(params):
                 self.segment_makers[self.path] = segment_maker
             return segment_maker
 
+        def _live_folder(self, path):
+            if path.endswith('.m3u8') and os.path.isdir(os.path.join(self._root, path[1:-5] + '.live')):
+                return os.path.join(self._root, path[1:-5] + '.live')
+            if '.live/' in path:
+                return os.path.join(self._root, os.path.dirname(path[1:]))
+            return ''
+
+        @staticmethod
+        def _live_wait(part_target):
+            """Sleeps until the playlist is worth looking at again: a fraction of a part, so that waiting clients
+               neither wake up all the time nor lag far behind the part being cut"""
+            time.sleep(max(part_target / 4, .02))
+
+        def _stream_live_playlist(self, folder, query):
+            """Blocks playlist reload up to the requested media sequence number and part, if any"""
+            query = urllib.parse.parse_qs(query)
+            try:
+                msn = int(query['_HLS_msn'][0]) if '_HLS_msn' in query else None
+                part = int(query['_HLS_part'][0]) if '_HLS_part' in query else None
+            except ValueError:
+                msn = part = -1
+            if (part is not None and msn is None) or (msn is not None and msn < 0) or (part is not None and part < 0):
+                self._reply_error(400)
+                return
+            deadline = None
+            while True:
+                body, (next_part, target_duration, part_target) = _live_playlist(folder)
+                if body and (msn is None or next_part is None or
+                             (next_part[0] > msn if part is None else next_part > (msn, part))):
+                    break
+                if next_part and msn > next_part[0] + 2:
+                    self._reply_error(400)
+                    return
+                deadline = deadline or time.time() + 3 * target_duration
+                if time.time() > deadline:
+                    self._reply_error(503 if body else 404)
+                    return
+                self._live_wait(part_target)
+            self.send_response(200)
+            self.send_header('Content-type', 'application/vnd.apple.mpegurl')
+            self.send_header('Cache-Control', 'no-cache' if msn is None else 'max-age=60')
+            self.send_header('Content-length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream_live_file(self, folder, path):
+            """Blocks request of the hinted part until it is written"""
+            filename = os.path.join(folder, os.path.basename(path))
+            deadline = None
+            while not os.path.isfile(filename):
+                _, (next_part, target_duration, part_target) = _live_playlist(folder)
+                if next_part is None or not path.endswith(f'/{next_part[0]}.{next_part[1]}.m4s'):
+                    self._reply_error(404)
+                    return
+                deadline = deadline or time.time() + 3 * target_duration
+                if time.time() > deadline:
+                    self._reply_error(503)
+                    return
+                self._live_wait(part_target)
+            try:
+                with open(filename, 'rb') as f:
+                    body = f.read()
+            except OSError:  # dropped out of the playlist window
+                self._reply_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-type', 'video/mp4')
+            self.send_header('Content-length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _redirect_live(self):
+            """Sends the client to live fMP4 of rtmp ingest, streamed from memory by the service of rtsp port"""
+            host = self.headers.get('Host', '').rpartition(':')[0] or self.headers.get('Host', '')
+            self.send_response(307)
+            self.send_header('Location', f'http://{host}:{params.get("rtsp_port", 4557)}{self.path}')
+            self.send_header('Content-length', '0')
+            self.end_headers()
+
         def _reply_error(self, code):
             try:
                 self.send_error(code)
@@ -161,6 +356,12 @@ def handler(params):
                 self._reply_error(501)
             elif self.path == '/':
                 self._stream_file_list()
+            elif self._live_folder(urllib.parse.urlsplit(self.path).path):
+                path = urllib.parse.urlsplit(self.path)
+                if path.path.endswith('.m3u8'):
+                    self._stream_live_playlist(self._live_folder(path.path), path.query)
+                else:
+                    self._stream_live_file(self._live_folder(path.path), path.path)
             elif self.path.endswith(('.m4s', '.mp4')):
                 try:
                     self._stream_segment()
@@ -178,15 +379,30 @@ def handler(params):
                     if self._stream_file(os.path.join(self._root, self.path[1:]), 'text/plain'):
                         return
                     self.path = self.path[:-1*len(extension)]
+                variant = ''
+                if extension in ['.m3u', '.m3u8'] and \
+                        not os.path.isfile(os.path.join(self._root, self.path[1:]+'.mp4')):
+                    for suffix in ('_master', '_iframes'):
+                        if self.path.endswith(suffix):
+                            self.path, variant = self.path[:-len(suffix)], suffix
                 self._filename = os.path.join(self._root, self.path[1:]+'.mp4')
-                if os.path.isfile(self._filename):
+                if extension in ['.m3u', '.m3u8', '.mpd'] and \
+                        (variant == '_master' or (extension == '.mpd' and self._demux) or
+                         not os.path.isfile(self._filename)) and \
+                        self._stream_ladder(extension):
+                    return
+                if os.path.isfile(self._filename) or \
+                        (extension in ['.m3u', '.m3u8', '.mpd'] and self._get_ladder_maker(self.path)):
                     if extension in ['.m3u', '.m3u8']:
-                        self._stream_media_playlist()
+                        self._stream_media_playlist(variant)
                     elif extension == '.mpd':
                         self._stream_dash_mpd()
                     else:
                         self._stream_fmp4()
                     return
+                if '.' not in self.path and self._live_folder(self.path + '.m3u8'):
+                    self._redirect_live()
+                    return
                 self._reply_error(404)
 
     return Handler
@@ -0,0 +1,112 @@
+"""Prepares sibling renditions of a title for adaptive streaming"""
+import logging
+import os
+import re
+from .dash_mpd import DashMpd
+from .segmenter import SegmentMaker
+
+
+class Ladder:
+    """Renditions <title>_<height>.mp4 of one title, segmented on key frames common to all of them,
+    so that players switch between renditions at any segment boundary.
+    Demultiplexed ladder keeps video renditions without audio and serves every audio track of the best one apart.
+    If the renditions share too few key frames, every one is segmented on its own and alignment is not claimed"""
+    MAX_ALIGNED_SEGMENT_FLOORS = 3  # longest aligned segment allowed, in segment duration floors
+
+    @staticmethod
+    def renditions(root, title):
+        """Returns {height: filename} of sibling renditions of the title"""
+        directory = os.path.join(root, os.path.dirname(title))
+        pattern = re.compile(re.escape(os.path.basename(title)) + r'_(\d+)\.mp4$')
+        rc = {}
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                match = pattern.match(name)
+                if match:
+                    rc[int(match.group(1))] = os.path.join(directory, name)
+        return rc
+
+    def __init__(self, renditions, path, server_address, demux=False, **kwargs):
+        """Renditions are {rendition path: filename}, the best one first"""
+        self.path = path
+        self.makers = {}
+        self.audio = {}
+        segment_duration = kwargs.get('segment_duration', 6.)
+        for rendition_path, filename in renditions.items():
+            self.makers[rendition_path] = SegmentMaker(filename,
+                                                       rendition_path,
+                                                       server_address,
+                                                       deferred=True,
+                                                       handlers=('vide', 'text') if demux else None,
+                                                       **kwargs)
+        best_path, best = next(iter(self.makers.items()))
+        if demux:
+            for track_id in best.track_ids('soun'):
+                self.audio[f'{path}_audio{track_id}'] = SegmentMaker(renditions[best_path],
+                                                                     f'{path}_audio{track_id}',
+                                                                     server_address,
+                                                                     deferred=True,
+                                                                     tracks={track_id},
+                                                                     fragment_durations=best.fragment_durations(),
+                                                                     **kwargs)
+        self.aligned = True
+        boundaries = self._aligned_boundaries(segment_duration * 1000)
+        if boundaries is None:
+            self.aligned = False
+            logging.warning(f'{path}: renditions share too few key frames to align segments, '
+                            'segmenting every one on its own')
+        for maker in list(self.makers.values()) + list(self.audio.values()):
+            maker.split(boundaries)
+
+    def _aligned_boundaries(self, floor):
+        """Returns segment boundaries on key frames common to all renditions (times in milliseconds),
+           None if they leave a segment longer than MAX_ALIGNED_SEGMENT_FLOORS floors"""
+        ends = [maker.fragment_ends() for maker in self.makers.values()]
+        common = set.intersection(*(set(rendition_ends) for rendition_ends in ends))
+        boundaries, start = set(), 0
+        for end in sorted(common):
+            if end - start > floor:
+                boundaries.add(end)
+                start = end
+        last = max((rendition_ends[-1] for rendition_ends in ends if rendition_ends), default=0)
+        points = [0] + sorted(boundaries) + [last]
+        if len(ends) > 1 and max(b - a for a, b in zip(points, points[1:])) > floor * self.MAX_ALIGNED_SEGMENT_FLOORS:
+            return None
+        return boundaries
+
+    def maker(self, path):
+        """Returns segment maker of the rendition or audio track, None if there is no such one"""
+        return self.makers.get(path, self.audio.get(path))
+
+    @property
+    def duration(self):
+        """Returns duration of the title"""
+        return max(maker.duration for maker in self.makers.values())
+
+    @property
+    def target_duration(self):
+        """Returns the longest segment duration"""
+        return max(maker.target_duration for maker in list(self.makers.values()) + list(self.audio.values()))
+
+    def master_playlist(self):
+        """Returns HLS master playlist of all renditions"""
+        audio = list(self.audio.values())
+        return '#EXTM3U\n#EXT-X-VERSION:5\n#EXT-X-INDEPENDENT-SEGMENTS\n' + \
+            ''.join(maker.media_inf(path[len(self.path) + 1:], not index)
+                    for index, (path, maker) in enumerate(self.audio.items())) + \
+            ''.join(maker.stream_inf(audio) for maker in self.makers.values()) + \
+            ''.join(maker.iframe_stream_inf() for maker in self.makers.values())
+
+    def mpd(self, title):
+        """Returns DASH MPD with a Representation of every rendition and an AdaptationSet of every audio track"""
+        adaptation_sets = [[self._adaptation_set(path, maker) for path, maker in self.makers.items()]]
+        adaptation_sets.extend([self._adaptation_set(path, maker)] for path, maker in self.audio.items())
+        return str(DashMpd(title, self.duration, self.target_duration, adaptation_sets, self.aligned))
+
+    def _adaptation_set(self, path, maker):
+        adaptation_set = maker.writer.adaptation_set
+        adaptation_set.representation_id = path[len(self.path) + 1:]
+        adaptation_set.bandwidth = maker.bandwidth()
+        adaptation_set.codecs = maker.codecs()
+        adaptation_set.width, adaptation_set.height = maker.dimensions
+        return adaptation_set
@@ -0,0 +1,345 @@
+"""Packages live ingest as low-latency HLS"""
+import math
+import os
+import shutil
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+from typing import List, Optional
+from .atom.atom import Box
+from .atom import avcc, dref, esds, ftyp, hdlr, mdat, mdhd, mfhd, mvhd, smhd, stco, stsc, stsd, stsz, stts
+from .atom import tfdt, tfhd, tkhd, trex, trun, vmhd
+from .diskwriter import DiskWriter
+
+LiveSample = namedtuple('LiveSample', 'time duration composition_time keyframe data')
+LivePart = namedtuple('LivePart', 'duration independent')
+
+AAC_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+AAC_FRAME_LENGTH = 1024
+VIDEO_SAMPLE_ENTRIES = {'avcC': 'avc1', 'hvcC': 'hev1'}  # parameter sets may come in band too
+
+
+class LiveSegment:
+    """Media segment of the live playlist, filled with parts as they are cut"""
+    def __init__(self, sequence: int):
+        self.sequence: int = sequence
+        self.date: datetime = datetime.now(timezone.utc)
+        self.parts: List[LivePart] = []
+        self.complete: bool = False
+
+    @property
+    def duration(self) -> float:
+        """Returns duration of the parts cut so far"""
+        return sum(part.duration for part in self.parts)
+
+
+class LiveSink:
+    """Cuts live ingest into CMAF parts (moof+mdat) as it arrives and keeps low-latency HLS playlist
+    of them in <root>/<name>.live. Parts are closed on frame boundaries not to exceed the part target,
+    segments on the first key frame after the segment duration. Every file is replaced atomically, so that
+    HTTP service of another process may serve them any time. Files are written by the writer"""
+    playlist = 'index.m3u8'
+    video_track_id = 1
+    audio_track_id = 2
+    video_timescale = 90000
+    window = 6  # segments in the playlist
+
+    def __init__(self, root: str, segment_duration: float = 6., part_duration: float = .5,
+                 writer: Optional[DiskWriter] = None) -> None:
+        self._root: str = root
+        self._writer: DiskWriter = writer or DiskWriter()
+        self._segment_duration: float = segment_duration
+        self._part_duration: float = part_duration
+        self._folder: str = ''
+        self._prefix: str = ''
+        self._reset()
+
+    def _reset(self) -> None:
+        """Forgets ingest of the previous publishing"""
+        self._metadata: dict = {}
+        self._coding: Optional[Box] = None  # avcC or hvcC
+        self._audio_config: bytes = b''
+        self._sample_rate: int = 0
+        self._channels: int = 0
+        self._tracks: tuple = ()  # track ids of the init segment, fixed once it is written
+        self._origin: Optional[int] = None
+        self._last_video: Optional[LiveSample] = None
+        self._video: List[LiveSample] = []
+        self._audio: List[LiveSample] = []
+        self._audio_time: Optional[int] = None
+        self._part_start: float = 0.
+        self._segment_start: float = 0.
+        self._segments: deque = deque()
+        self._stale: deque = deque()
+        self._segment_data: List[bytes] = []
+        self._sequence_number: int = 1
+        self._ended: bool = False
+
+    def on_publish(self, publish_name: str) -> None:
+        publish_name = os.path.normpath('/' + publish_name)[1:]  # stays within the root
+        self._reset()
+        self._folder = os.path.join(self._root, publish_name + '.live')
+        self._prefix = os.path.basename(publish_name) + '.live/'
+        self._writer.call(self._make_folder, self._folder)
+        self._segments.append(LiveSegment(0))
+
+    def on_metadata(self, data: dict) -> None:
+        self._metadata = data
+
+    def on_video_config(self, configuration) -> None:
+        """Takes in AVC decoder configuration record or a ready avcC or hvcC box"""
+        self._coding = configuration if isinstance(configuration, Box) else \
+            avcc.Box(initial=configuration.initial(),
+                     u_length=configuration.length_size,
+                     sps=configuration.sps,
+                     pps=configuration.pps)
+
+    def on_audio_config(self, payload: bytes) -> None:
+        """Takes in AAC audio specific config"""
+        if len(payload) >= 2:
+            frequency_index = ((payload[0] & 7) << 1) | (payload[1] >> 7)
+            if frequency_index < len(AAC_SAMPLE_RATES):
+                self._audio_config = bytes(payload)
+                self._sample_rate = AAC_SAMPLE_RATES[frequency_index]
+                self._channels = (payload[1] >> 3) & 0xf
+
+    def on_video_frame(self, timestamp: int, composition_time: int, keyframe: bool, payload: bytes) -> None:
+        """Takes in access unit of length prefixed NAL units, timestamps are in ms"""
+        if not self._folder or self._coding is None or (self._tracks and self.video_track_id not in self._tracks):
+            return
+        time_ = self._time(timestamp) * (self.video_timescale // 1000)
+        if self._last_video is None:
+            if not keyframe:
+                return
+            self._part_start = self._segment_start = time_ / self.video_timescale
+        else:
+            duration = max(time_ - self._last_video.time, 1)
+            self._video.append(self._last_video._replace(duration=duration))
+            self._cut(time_ / self.video_timescale, keyframe, duration / self.video_timescale)
+        self._last_video = LiveSample(time_,
+                                      0,
+                                      max(composition_time, 0) * (self.video_timescale // 1000),
+                                      keyframe,
+                                      bytes(payload))
+
+    def on_audio_frame(self, timestamp: int, payload: bytes) -> None:
+        """Takes in raw AAC frame, timestamp is in ms"""
+        if not self._folder or not self._sample_rate or (self._tracks and self.audio_track_id not in self._tracks):
+            return
+        expected = self._time(timestamp) * self._sample_rate // 1000
+        if self._audio_time is None or abs(expected - self._audio_time) > 2 * AAC_FRAME_LENGTH:  # gap in ingest
+            self._audio_time = expected
+            if self._coding is None and not self._audio:
+                self._part_start = self._segment_start = self._audio_time / self._sample_rate
+        if self._coding is None:  # no video to cut by its key frames
+            self._cut(self._audio_time / self._sample_rate, True, AAC_FRAME_LENGTH / self._sample_rate)
+        self._audio.append(LiveSample(self._audio_time, AAC_FRAME_LENGTH, 0, True, bytes(payload)))
+        self._audio_time += AAC_FRAME_LENGTH
+
+    def close(self) -> None:
+        """Flushes the rest of ingest and ends the playlist"""
+        if not self._folder or self._ended:
+            return
+        if self._last_video is not None:
+            duration = self._video[-1].duration if self._video else self.video_timescale // 30
+            self._video.append(self._last_video._replace(duration=duration))
+            self._last_video = None
+            end = (self._video[-1].time + duration) / self.video_timescale
+        elif self._audio:
+            end = (self._audio[-1].time + AAC_FRAME_LENGTH) / self._sample_rate
+        else:
+            end = self._part_start
+        self._ended = True
+        self._flush(end, True)
+        self._write_playlist()
+
+    def _time(self, timestamp: int) -> int:
+        if self._origin is None:
+            self._origin = timestamp
+        return max(timestamp - self._origin, 0)
+
+    def _cut(self, time_: float, keyframe: bool, duration: float) -> None:
+        """Closes the part, and the segment on key frame, before a sample of the time"""
+        if keyframe and time_ - self._segment_start >= self._segment_duration:
+            self._flush(time_, True)
+        elif time_ - self._part_start + duration > self._part_duration:
+            self._flush(time_, False)
+
+    def _flush(self, end: float, segment_end: bool) -> None:
+        """Writes samples up to the end time as a part, then the segment if it ends"""
+        video, self._video = self._video, []
+        audio = [sample for sample in self._audio if sample.time < end * self._sample_rate]
+        self._audio = self._audio[len(audio):]
+        segment: LiveSegment = self._segments[-1]
+        if video or audio:
+            if not self._tracks:
+                self._write('init.mp4', self._init_segment())
+            fragment = self._fragment(video, audio)
+            self._write(f'{segment.sequence}.{len(segment.parts)}.m4s', fragment)
+            self._segment_data.append(fragment)
+            segment.parts.append(LivePart(end - self._part_start, video[0].keyframe if video else True))
+        self._part_start = end
+        if segment_end and segment.parts:
+            self._write(f'{segment.sequence}.m4s', b''.join(self._segment_data))
+            self._segment_data = []
+            segment.complete = True
+            self._segment_start = end
+            if not self._ended:
+                self._segments.append(LiveSegment(segment.sequence + 1))
+            while len(self._segments) > self.window + 1:
+                self._stale.append(self._segments.popleft())
+            while len(self._stale) > 2:  # clients may still be loading recently dropped segments
+                self._remove(self._stale.popleft())
+        if not self._ended:
+            self._write_playlist()
+
+    def _write_playlist(self) -> None:
+        target_duration = math.ceil(max([self._segment_duration] +
+                                        [segment.duration for segment in self._segments if segment.complete]))
+        lines = ['#EXTM3U',
+                 '#EXT-X-VERSION:6',
+                 f'#EXT-X-TARGETDURATION:{target_duration}',
+                 f'#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * self._part_duration:.3f}',
+                 f'#EXT-X-PART-INF:PART-TARGET={self._part_duration:.3f}',
+                 f'#EXT-X-MEDIA-SEQUENCE:{self._segments[0].sequence}',
+                 f'#EXT-X-MAP:URI="{self._prefix}init.mp4"']
+        parts_from = len(self._segments) - 3  # parts are listed for the last few segments only
+        for index, segment in enumerate(self._segments):
+            if not segment.parts:
+                continue
+            lines.append(f'#EXT-X-PROGRAM-DATE-TIME:{segment.date.isoformat(timespec="milliseconds")}')
+            if index >= parts_from:
+                lines.extend(f'#EXT-X-PART:DURATION={part.duration:.5f},'
+                             f'URI="{self._prefix}{segment.sequence}.{number}.m4s"' +
+                             (',INDEPENDENT=YES' if part.independent else '')
+                             for number, part in enumerate(segment.parts))
+            if segment.complete:
+                lines.extend([f'#EXTINF:{segment.duration:.5f},', f'{self._prefix}{segment.sequence}.m4s'])
+        if self._ended:
+            lines.append('#EXT-X-ENDLIST')
+        else:
+            segment = self._segments[-1]
+            lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="{self._prefix}{segment.sequence}.{len(segment.parts)}.m4s"')
+        self._write(self.playlist, ('\n'.join(lines) + '\n').encode())
+
+    def _write(self, name: str, data: bytes) -> None:
+        self._writer.call(self._replace, os.path.join(self._folder, name), data, size=len(data))
+
+    def _remove(self, segment: LiveSegment) -> None:
+        names = [f'{segment.sequence}.m4s'] + [f'{segment.sequence}.{i}.m4s' for i in range(len(segment.parts))]
+        self._writer.call(self._remove_files, [os.path.join(self._folder, name) for name in names])
+
+    @staticmethod
+    def _make_folder(folder: str) -> None:
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+    @staticmethod
+    def _replace(path: str, data: bytes) -> None:
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _remove_files(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _init_segment(self) -> bytes:
+        ftyp_box: ftyp.Box = ftyp.Box(major_brand='iso6', minor_version=0, compatible_brands={'iso6', 'cmfc', 'mp41'})
+        return ftyp_box.to_bytes() + self._movie().to_bytes()
+
+    def _movie(self) -> Box:
+        """Returns moov of the init segment and fixes its tracks"""
+        moov: Box = Box(type='moov')
+        self._tracks = (self.video_track_id,) if self._coding is not None else ()
+        if self._sample_rate:
+            self._tracks += (self.audio_track_id,)
+        moov.add_inner_box(mvhd.Box(timescale=1000, next_track_id=max(self._tracks) + 1))
+        if self._coding is not None:
+            width, height = int(self._metadata.get('width', 0.)), int(self._metadata.get('height', 0.))
+            entry = stsd.VisualSampleEntry(format=VIDEO_SAMPLE_ENTRIES[self._coding.type],
+                                            width=width,
+                                            height=height)
+            entry.add_coding(self._coding)
+            moov.add_inner_box(self._track(self.video_track_id,
+                                           'vide',
+                                           self.video_timescale,
+                                           entry,
+                                           vmhd.Box(flags=1),
+                                           width=width << 16,
+                                           height=height << 16))
+        if self._sample_rate:
+            entry = stsd.AudioSampleEntry(channels=self._channels, sample_rate=self._sample_rate)
+            entry.add_descriptors(esds.Box(config=self._audio_config, stream_id=self.audio_track_id))
+            moov.add_inner_box(self._track(self.audio_track_id,
+                                           'soun',
+                                           self._sample_rate,
+                                           entry,
+                                           smhd.Box(),
+                                           volume=0x0100))
+        moov.add_inner_box(Box(type='mvex'))
+        for track_id in self._tracks:
+            moov.add_inner_box(trex.Box(track_id=track_id), 'mvex')
+        return moov
+
+    @staticmethod
+    def _track(track_id, handler_type, timescale, entry, media_header, **kwargs) -> Box:
+        track: Box = Box(type='trak')
+        track.add_inner_box(tkhd.Box(flags=3, track_id=track_id, **kwargs))
+        track.add_inner_box(Box(type='mdia'))
+        track.add_inner_box(mdhd.Box(timescale=timescale), 'mdia')
+        track.add_inner_box(hdlr.Box(handler_type=handler_type,
+                                     name='VideoHandler' if handler_type == 'vide' else 'SoundHandler'),
+                            'mdia')
+        track.add_inner_box(Box(type='minf'), 'mdia')
+        track.add_inner_box(media_header, 'minf')
+        track.add_inner_box(Box(type='dinf'), 'minf')
+        dref_box = dref.Box()
+        dref_box.add_entry(dref.Entry(type='url ', flags=1))
+        track.add_inner_box(dref_box, 'dinf')
+        track.add_inner_box(Box(type='stbl'), 'minf')
+        sample_description = stsd.Box(hdlr=handler_type)
+        sample_description.add_entry(entry)
+        track.add_inner_box(sample_description, 'stbl')
+        for box in (stts.Box(), stsc.Box(), stsz.Box(), stco.Box()):
+            track.add_inner_box(box, 'stbl')
+        return track
+
+    def _fragment(self, video: List[LiveSample], audio: List[LiveSample]) -> bytes:
+        """Returns moof and mdat of the samples"""
+        moof: Box = Box(type='moof')
+        header = mfhd.Box()
+        header.sequence_number = self._sequence_number
+        self._sequence_number += 1
+        moof.add_inner_box(header)
+        media = mdat.Box(type='mdat')
+        runs = []
+        for track_id, samples in ((self.video_track_id, video), (self.audio_track_id, audio)):
+            if not samples:
+                continue
+            traf: Box = Box(type='traf')
+            moof.add_inner_box(traf)
+            traf.add_inner_box(tfhd.Box(flags=tfhd.Flags.DEFAULT_BASE_IS_MOOF, track_id=track_id))
+            traf.add_inner_box(tfdt.Box(base_media_decode_time=samples[0].time))
+            flags = trun.Flags.DATA_OFFSET | trun.Flags.SAMPLE_DURATION | trun.Flags.SAMPLE_SIZE
+            if track_id == self.video_track_id:
+                flags |= trun.Flags.SAMPLE_FLAGS | trun.Flags.SAMPLE_COMPOSITION_TIME_OFFSETS
+            run = trun.Box(flags=flags)
+            traf.add_inner_box(run)
+            size = 0
+            for sample in samples:
+                run.add_sample(duration=sample.duration,
+                               size=len(sample.data),
+                               flags=int(trex.SampleFlags(2, False) if sample.keyframe else trex.SampleFlags(1, True)),
+                               time_offsets=sample.composition_time)
+                media.append(sample.data)
+                size += len(sample.data)
+            runs.append((run, size))
+        offset = moof.full_size() + 8
+        for run, size in runs:
+            run.data_offset = offset
+            offset += size
+        return moof.to_bytes() + media.to_bytes()
@@ -0,0 +1,228 @@
+"""Keeps live ingest in memory, so that RTSP sessions and fMP4 streams play it the way they play files"""
+import math
+from collections import deque
+from typing import Dict, List, Optional
+from .atom.atom import Box
+from .atom.trun import Frame
+from .livesink import LiveSink, LiveSample
+from .reader import ClockRate, SamplesInfo
+from .rtp.cache import PacketCache
+
+
+class SampleRing:
+    """Samples of a track in ingest order, bounded by their size in bytes. The oldest samples are dropped first,
+    readers left behind resume from the next key frame kept"""
+    def __init__(self, limit: int) -> None:
+        self.first: int = 0  # index of the oldest sample kept
+        self._samples: deque = deque()  # (number, sample), numbers are unique among tracks of the source
+        self._keyframes: deque = deque()  # indices of key frames kept
+        self._size: int = 0
+        self._limit: int = limit
+
+    @property
+    def end(self) -> int:
+        """Returns index of the sample to come"""
+        return self.first + len(self._samples)
+
+    def append(self, number: int, sample: LiveSample) -> None:
+        """Keeps the sample, drops the oldest ones beyond the limit"""
+        if sample.keyframe:
+            self._keyframes.append(self.end)
+        self._samples.append((number, sample))
+        self._size += len(sample.data)
+        while self._size > self._limit and len(self._samples) > 1:
+            self._size -= len(self._samples.popleft()[1].data)
+            self.first += 1
+            while self._keyframes and self._keyframes[0] < self.first:
+                self._keyframes.popleft()
+
+    def get(self, index: int) -> tuple:
+        """Returns (number, sample) of the index"""
+        return self._samples[index - self.first]
+
+    def resume(self, index: int) -> int:
+        """Returns the index to read from: the same one while the sample is kept, the next key frame otherwise"""
+        if index >= self.first:
+            return index
+        return self._keyframes[0] if self._keyframes else self.end
+
+    def last_keyframe(self) -> int:
+        """Returns index of the latest key frame, the end if there is none"""
+        return self._keyframes[-1] if self._keyframes else self.end
+
+    def find(self, time_: int) -> int:
+        """Returns index of the first sample of the time or later"""
+        index = self.end
+        while index > self.first and self.get(index - 1)[1].time >= time_:
+            index -= 1
+        return index
+
+
+class LiveSource(LiveSink):
+    """Published stream kept in memory as a ring of samples per track, read by any number of readers
+    at their own pace. A sample is taken in as soon as its duration is known, that is the next frame arrives"""
+    ring_limit: int = 8 * 1024 * 1024  # bytes of samples per track
+
+    def __init__(self) -> None:
+        super().__init__('', math.inf, 0.)  # every frame closes a part
+        self.name: str = ''
+        self.movie: Optional[Box] = None
+        self.init_segment: bytes = b''
+        self.rings: Dict[int, SampleRing] = {self.video_track_id: SampleRing(self.ring_limit),
+                                             self.audio_track_id: SampleRing(self.ring_limit)}
+        self.packet_cache: PacketCache = PacketCache(self.ring_limit)  # shared by rtsp sessions of the stream
+        self._count: int = 0
+
+    def on_publish(self, publish_name: str) -> None:
+        self.name = publish_name
+        self._folder = publish_name  # nothing is written, frames are taken in once published
+        _sources[publish_name] = self
+
+    def close(self) -> None:
+        """Takes in the rest of ingest, readers stop once they read it"""
+        super().close()
+        if _sources.get(self.name) is self:
+            del _sources[self.name]
+
+    @property
+    def described(self) -> bool:
+        """Verifies if tracks are known, that is samples may be read"""
+        return self.movie is not None
+
+    @property
+    def ended(self) -> bool:
+        """Verifies if publishing has ended"""
+        return self._ended
+
+    def fragment(self, video: List[LiveSample], audio: List[LiveSample]) -> bytes:
+        """Returns moof and mdat of the samples, to follow the init segment"""
+        return self._fragment(video, audio)
+
+    def _flush(self, end: float, segment_end: bool) -> None:
+        """Puts samples up to the end time into the rings"""
+        video, self._video = self._video, []
+        audio = [sample for sample in self._audio if sample.time < end * self._sample_rate]
+        self._audio = self._audio[len(audio):]
+        if (video or audio) and not self._tracks:
+            self.init_segment = self._init_segment()
+        for track_id, samples in ((self.video_track_id, video), (self.audio_track_id, audio)):
+            for sample in samples:
+                self.rings[track_id].append(self._count, sample)
+                self._count += 1
+        self._part_start = self._segment_start = end
+
+    def _write_playlist(self) -> None:
+        """Live source has no playlist"""
+
+    def _movie(self) -> Box:
+        self.movie = super()._movie()
+        return self.movie
+
+
+class LiveReader:
+    """Reads a live source the way Reader reads a file. Video is read from the latest key frame on, audio from
+    the same time. Sample offset is its number in the source, next_sample returns None until the sample comes"""
+    live = True
+    media_duration_sec = 0.
+
+    def __init__(self, source: LiveSource) -> None:
+        self._source: LiveSource = source
+        self.boxes: List[Box] = [source.movie]
+        self.media_header: dict = {}
+        self.samples_info: dict = {}
+        self.video_configuration_box = None
+        for trak in self.find_box('trak'):
+            track_id = trak.find_inner_boxes('tkhd')[0].track_id
+            self.media_header[track_id] = trak.find_inner_boxes('mdhd')[0]
+            self.samples_info[track_id] = SamplesInfo()
+            description = trak.find_inner_boxes('stsd')[0]
+            if description.handler == 'vide':
+                self.video_configuration_box = description.entries[0]['avcC']
+                if self.video_configuration_box is None:
+                    self.video_configuration_box = description.entries[0]['hvcC']
+                self.samples_info[track_id].unit_size_bytes = self.video_configuration_box.unit_length
+                self.samples_info[track_id].timescale_multiplier = \
+                    int(ClockRate.VIDEO_Khz.value / self.media_header[track_id].timescale)
+        self._next: Dict[int, int] = {}
+        self._recent: Dict[int, tuple] = {}  # (number, data) of the last sample returned of every track
+        self.rewind()
+
+    def __repr__(self):
+        return '\n'.join(str(box) for box in self.boxes)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def find_box(self, box_type):
+        """Searches box by atom type"""
+        ret = []
+        for box in self.boxes:
+            ret.extend(box.find_inner_boxes(box_type))
+        return ret
+
+    def rewind(self) -> None:
+        """Moves to the latest key frame"""
+        rings = self._source.rings
+        start = None
+        if LiveSource.video_track_id in self.samples_info:
+            ring = rings[LiveSource.video_track_id]
+            self._next[LiveSource.video_track_id] = ring.last_keyframe()
+            if ring.last_keyframe() < ring.end:
+                start = ring.get(ring.last_keyframe())[1].time / LiveSource.video_timescale
+        if LiveSource.audio_track_id in self.samples_info:
+            ring = rings[LiveSource.audio_track_id]
+            timescale = self.media_header[LiveSource.audio_track_id].timescale
+            self._next[LiveSource.audio_track_id] = ring.find(math.ceil(start * timescale)) if start is not None \
+                else ring.end
+
+    def pending(self, track_ids=None) -> bool:
+        """Verifies if any track (of the ids, if given) has samples to read"""
+        return any(self._source.rings[track_id].resume(index) < self._source.rings[track_id].end
+                   for track_id, index in self._next.items() if track_ids is None or track_id in track_ids)
+
+    def samples(self, track_id) -> List[LiveSample]:
+        """Returns all samples of the track ingested since the last call"""
+        ring = self._source.rings[track_id]
+        index = ring.resume(self._next[track_id])
+        self._next[track_id] = ring.end
+        return [ring.get(i)[1] for i in range(index, ring.end)]
+
+    def next_sample(self, track_id, forward=True, read=True):
+        """Returns next sample of the track, None if it has not come yet. Raises once publishing has ended"""
+        ring = self._source.rings[track_id]
+        index = ring.resume(self._next[track_id])
+        self._next[track_id] = index
+        if index >= ring.end:
+            if self._source.ended:
+                raise IndexError('samples depleted')
+            return None
+        number, sample = ring.get(index)
+        self._next[track_id] = index + 1
+        self._recent[track_id] = number, sample.data
+        ret = Frame(self.samples_info[track_id].unit_size_bytes)
+        ret.offset, ret.size, ret.duration = number, len(sample.data), sample.duration
+        ret.composition_time = sample.composition_time
+        ret.decoding_time = sample.time
+        if read:
+            ret.data = sample.data
+        return ret
+
+    def sample(self, offset, size):
+        """Returns data of a sample just returned by next_sample"""
+        for number, data in self._recent.values():
+            if number == offset:
+                return data
+        raise IndexError(f'sample {offset} is not read')
+
+    @property
+    def ended(self) -> bool:
+        """Verifies if publishing has ended and every sample is read"""
+        return self._source.ended and not self.pending()
+
+
+_sources: Dict[str, LiveSource] = {}
+
+
+def find(name: str) -> Optional[LiveSource]:
+    """Returns the source published under the name, None if there is none"""
+    return _sources.get(name)
@@ -1,117 +1,401 @@
-"""stores media data in MP4 format"""
-import os.path
+"""Records media data in MP4 format as it arrives"""
+import math
+import os
 import shutil
-import tempfile
-from collections import defaultdict
-from typing import Optional
-from .rtmp.messages.data import VideoData, AudioData
-from .atom import atom, avcc, dref, ftyp, hdlr, mvhd, mdhd, stsc, stsd, stts, stsz, tkhd, vmhd
+import time
+from array import array
+from typing import List, Optional
+from .atom.atom import Box
+from .atom import avcc, co64, ctts, dref, esds, ftyp, hdlr, mdhd, mvhd, smhd
+from .atom import stco, stsc, stsd, stss, stsz, stts, tkhd, vmhd
+from .diskwriter import DiskWriter
+from .livesink import AAC_SAMPLE_RATES, AAC_FRAME_LENGTH, VIDEO_SAMPLE_ENTRIES, LiveSink
+
+
+class SampleTable:
+    """Sample table of a recorded track. Samples are kept as compact arrays of sizes and chunk offsets
+    and run-length coded times, so that it grows by a few bytes per sample whatever the bitrate"""
+    def __init__(self, handler_type: str, timescale: int) -> None:
+        self.handler_type: str = handler_type
+        self.timescale: int = timescale
+        self.sizes: array = array('I')
+        self.sync: array = array('I')
+        self.chunk_offsets: array = array('Q')
+        self.chunks: List[list] = []  # [first chunk, samples per chunk] runs
+        self.deltas: List[list] = []  # [count, delta] runs
+        self.composition_offsets: List[list] = []  # [count, offset] runs
+        self.pending: List[bytes] = []  # samples of the chunk being gathered
+        self.pending_start: int = 0
+        self.time: Optional[int] = None
+
+    @property
+    def duration(self) -> int:
+        """Returns duration of samples in timescale units"""
+        return sum(count * delta for count, delta in self.deltas)
+
+    def add(self, time_: int, composition_offset: int, keyframe: bool, payload: bytes) -> None:
+        """Takes in a sample to be written with the next chunk"""
+        if self.time is not None:
+            self._run(self.deltas, max(time_ - self.time, 0))
+        if not self.pending:
+            self.pending_start = time_
+        self.time = time_
+        self.sizes.append(len(payload))
+        if keyframe:
+            self.sync.append(len(self.sizes))
+        self._run(self.composition_offsets, composition_offset)
+        self.pending.append(payload)
+
+    def end(self) -> None:
+        """Gives the last sample the duration of the previous one"""
+        if self.time is not None:
+            self._run(self.deltas, self.deltas[-1][1] if self.deltas else 0)
+            self.time = None
+
+    def chunk(self, offset: int) -> List[bytes]:
+        """Takes away samples gathered so far as the chunk at the offset"""
+        pending, self.pending = self.pending, []
+        self.chunk_offsets.append(offset)
+        if not self.chunks or self.chunks[-1][1] != len(pending):
+            self.chunks.append([len(self.chunk_offsets), len(pending)])
+        return pending
+
+    def boxes(self, shift: int = 0) -> List[Box]:
+        """Returns sample table boxes, chunk offsets are shifted by the size of boxes moved before media data"""
+        offsets = array('Q', (offset + shift for offset in self.chunk_offsets)) if shift else self.chunk_offsets
+        rc: List[Box] = [
+            stts.Box(entries=[stts.Entry(count, delta) for count, delta in self.deltas]),
+            stsc.Box(entries=[stsc.Entry(first_chunk=first_chunk, samples_per_chunk=samples)
+                              for first_chunk, samples in self.chunks]),
+            stsz.Box(entries=self.sizes),
+            co64.Box(entries=offsets) if offsets and offsets[-1] > 0xffffffff else stco.Box(entries=offsets)
+        ]
+        if any(offset for _, offset in self.composition_offsets):
+            rc.insert(1, ctts.Box(entries=[ctts.Entry(count=count, offset=offset)
+                                           for count, offset in self.composition_offsets]))
+        if len(self.sync) < len(self.sizes):
+            rc.insert(1, stss.Box(entries=self.sync))
+        return rc
+
+    @staticmethod
+    def _run(runs: List[list], value: int) -> None:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
 
 
 class Mp4Sink:
-    def __init__(self, root: str) -> None:
+    """Appends published samples to media data of <root>/<name>.mp4.part as chunks of about a second of a track,
+    so that only the sample tables stay in memory. On unpublish the movie box is written after media data
+    or, if faststart, before it, and the file is renamed to <root>/<name>.mp4. Files are written by the writer"""
+    video_timescale = 90000
+    chunk_duration = 1.  # seconds of a track written at once
+    buffer_size = 1 << 20
+
+    def __init__(self, root: str, faststart: bool = False, writer: Optional[DiskWriter] = None) -> None:
         self._root: str = root
-        self._name: tuple = ()
-        self._folder: str = ''
+        self._faststart: bool = faststart
+        self._writer: DiskWriter = writer or DiskWriter()
+        self._filename: str = ''
+        self._file = None
+        self._reset()
+
+    def _reset(self) -> None:
+        """Forgets ingest of the previous publishing"""
+        self._position: int = 0
+        self._mdat_position: int = 0
         self._metadata: dict = {}
-        self._stsz: defaultdict = defaultdict(lambda: stsz.Box(version=0, flags=0))
-        self._stts: defaultdict = defaultdict(lambda: stts.Box())
-        self._stsc: defaultdict = defaultdict(lambda: stsc.Box())
-        self._avcc: Optional[avcc.Box] = None
+        self._coding: Optional[Box] = None  # avcC or hvcC
+        self._audio_config: bytes = b''
+        self._channels: int = 0
+        self._origin: Optional[int] = None
+        self._video: Optional[SampleTable] = None
+        self._audio: Optional[SampleTable] = None
+        self._audio_time: Optional[int] = None
 
     def __del__(self) -> None:
-        try:
-            with open(self._name[0], 'ab') as f:
-                self._compile(f)
-            os.rename(self._name[0], self._name[1])
-            shutil.rmtree(self._folder)
-        except OSError as err:
-            print(err)
+        self.close()
 
     def on_publish(self, publish_name: str) -> None:
-        self._folder = tempfile.mkdtemp()
-        self._name = os.path.join(self._folder, publish_name + '.mp4'), os.path.join(self._root, publish_name + '.mp4')
+        publish_name = os.path.normpath('/' + publish_name)[1:]  # stays within the root
+        self._reset()
+        self._filename = os.path.join(self._root, publish_name + '.mp4')
+        self._writer.call(self._open, self._filename)
+        self._write(self._ftyp())
+        self._mdat_position = self._position
+        self._write(b'\x00\x00\x00\x01mdat' + bytes(8))  # 64-bit size is set on unpublish
 
     def on_metadata(self, data: dict) -> None:
         self._metadata = data
-        print(f'Meta: {self._metadata}')
-        with open(self._name[0], 'wb') as f:
-            ftyp_box: ftyp.Box = ftyp.Box(major_brand='isom',
-                                          minor_version=512,
-                                          compatible_brands={'isom', 'iso2', 'avc1', 'mp41'}
-                                          )
-            f.write(ftyp_box.to_bytes())
-
-    def on_video_config(self, payload: bytes) -> None:
-        self._avcc = avcc.Box(initial=VideoData.configuration.initial(),
-                              u_length=VideoData.configuration.length_size,
-                              sps=VideoData.configuration.sps,
-                              pps=VideoData.configuration.pps)
-        d = os.path.join(self._folder, 'vide')
+
+    def on_video_config(self, configuration) -> None:
+        """Takes in AVC decoder configuration record or a ready avcC or hvcC box"""
+        self._coding = configuration if isinstance(configuration, Box) else \
+            avcc.Box(initial=configuration.initial(),
+                     u_length=configuration.length_size,
+                     sps=configuration.sps,
+                     pps=configuration.pps)
+
+    def on_audio_config(self, payload: bytes) -> None:
+        """Takes in AAC audio specific config"""
+        if len(payload) >= 2 and self._audio is None:
+            frequency_index = ((payload[0] & 7) << 1) | (payload[1] >> 7)
+            if frequency_index < len(AAC_SAMPLE_RATES):
+                self._audio_config = bytes(payload)
+                self._channels = (payload[1] >> 3) & 0xf
+                self._audio = SampleTable('soun', AAC_SAMPLE_RATES[frequency_index])
+
+    def on_video_frame(self, timestamp: int, composition_time: int, keyframe: bool, payload: bytes) -> None:
+        """Takes in access unit of length prefixed NAL units, timestamps are in ms"""
+        if not self._filename or self._coding is None:
+            return
+        if self._video is None:
+            if not keyframe:
+                return
+            self._video = SampleTable('vide', self.video_timescale)
+        scale = self.video_timescale // 1000
+        self._add(self._video, self._time(timestamp) * scale, max(composition_time, 0) * scale, keyframe, payload)
+
+    def on_audio_frame(self, timestamp: int, payload: bytes) -> None:
+        """Takes in raw AAC frame, timestamp is in ms"""
+        if not self._filename or self._audio is None:
+            return
+        expected = self._time(timestamp) * self._audio.timescale // 1000
+        if self._audio_time is None or expected - self._audio_time > 2 * AAC_FRAME_LENGTH:  # gap in ingest
+            self._audio_time = expected
+        self._add(self._audio, self._audio_time, 0, True, payload)
+        self._audio_time += AAC_FRAME_LENGTH
+
+    def close(self) -> None:
+        """Writes the movie box and moves the recording in place"""
+        if not self._filename:
+            return
+        tables = self._tables()
+        for table in tables:
+            table.end()
+            if table.pending:
+                self._write_chunk(table)
+        moov = self._faststart_moov(tables) if self._faststart else self._moov(tables)
+        self._writer.call(self._finish, self._filename, self._position - self._mdat_position, moov.to_bytes())
+        self._filename = ''
+
+    def _time(self, timestamp: int) -> int:
+        if self._origin is None:
+            self._origin = timestamp
+        return max(timestamp - self._origin, 0)
+
+    def _tables(self) -> List[SampleTable]:
+        return [table for table in (self._video, self._audio) if table is not None and table.sizes]
+
+    def _add(self, table: SampleTable, time_: int, composition_offset: int, keyframe: bool, payload: bytes) -> None:
+        if table.pending and time_ - table.pending_start >= self.chunk_duration * table.timescale:
+            self._write_chunk(table)
+        table.add(time_, composition_offset, keyframe, bytes(payload))
+
+    def _write_chunk(self, table: SampleTable) -> None:
+        for sample in table.chunk(self._position):
+            self._write(sample)
+
+    def _write(self, data: bytes) -> None:
+        self._writer.call(self._write_file, data, size=len(data))
+        self._position += len(data)
+
+    def _open(self, filename: str) -> None:
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        self._file = open(filename + '.part', 'wb', buffering=self.buffer_size)
+
+    def _write_file(self, data: bytes) -> None:
+        if self._file is not None:
+            self._file.write(data)
+
+    def _finish(self, filename: str, mdat_size: int, moov: bytes) -> None:
+        """Sets the media data size, writes the movie box and renames the recording"""
+        file, self._file = self._file, None
+        if file is None:
+            return
         try:
-            os.mkdir(d)
+            file.seek(self._mdat_position + 8)
+            file.write(mdat_size.to_bytes(8, 'big'))
+            file.seek(self._mdat_position + mdat_size)
+            if not self._faststart:
+                file.write(moov)
+                file.close()
+            else:
+                file.close()
+                self._move_moov(filename, moov)
+            os.replace(filename + '.part', filename)
         except OSError as err:
             print(err)
-        print(VideoData.configuration)
 
-    def on_video_data(self, timestamp: int, payload: bytes) -> None:
-        self._stts['vide'].append(timestamp)
-        self._stsz['vide'].append(len(payload))
-        self._stsc['vide'].append(len(payload))
-        for i in payload[:10]:
-            print(f'{i:x}', end=' ')
-        print(f' of {len(payload)} in {timestamp}')
+    def _faststart_moov(self, tables: List[SampleTable]) -> Box:
+        """Returns the movie box to be put before media data"""
+        size = self._moov(tables).full_size()
+        moov = self._moov(tables, size)
+        if moov.full_size() != size:  # chunk offsets have turned 64-bit
+            moov = self._moov(tables, moov.full_size())
+        return moov
 
-    def on_audio_config(self, payload: bytes) -> None:
-        # print(AudioData.configuration)
-        pass
-
-    def on_audio_data(self, payload: bytes) -> None:
-        self._stsz['soun'].append(len(payload))
-        for i in payload[:5]:
-            print(f'{i:x}', end=' ')
-        print(f' of {len(payload)}')
-
-    def _compile(self, file):
-        moov: atom.Box = atom.Box(type='moov')
-        moov.add_inner_box(mvhd.Box(next_track_id=len(self._stsz) + 1))
-        stsd_ = sorted(self._stsz, reverse=True)
-        for i, tr in enumerate(stsd_):
-            track: atom.Box = atom.Box(type='trak')
-            volume: int = 0 if tr == 'vide' else 0x0100
-            duration: int = int(self._metadata.get('duration', 0.))
-            width: int = int(self._metadata.get('width', 0.)) if tr == 'vide' else 0
-            height: int = int(self._metadata.get('height', 0.)) if tr == 'vide' else 0
-            track.add_inner_box(tkhd.Box(track_id=i+1,
-                                         volume=volume,
-                                         duration=duration,
-                                         width=width,
-                                         height=height
-                                         )
-                                )
-            track.add_inner_box(atom.Box(type='mdia'))
-            track.add_inner_box(mdhd.Box(duration=duration), 'mdia')
-            track.add_inner_box(hdlr.Box(handler_type=tr,
-                                         name='VideoHandler' if tr == 'vide' else 'SoundHandler'
-                                         ),
-                                'mdia'
-                                )
-            track.add_inner_box(atom.Box(type='minf'), 'mdia')
-            if tr == 'vide':
-                track.add_inner_box(vmhd.Box(flags=1), 'minf')
-            track.add_inner_box(atom.Box(type='dinf'), 'minf')
-            dref_ = dref.Box()
-            dref_.add_entry(dref.Entry(type='url ', flags=1))
-            track.add_inner_box(dref_, 'dinf')
-            track.add_inner_box(atom.Box(type='stbl'), 'minf')
-            stsd_ = stsd.Box()
-            if tr == 'vide':
-                v: stsd.VisualSampleEntry = stsd.VisualSampleEntry(width=width, height=height)
-                v.add_coding(self._avcc)
-                stsd_.add_entry(v)
-            track.add_inner_box(stsd_, 'stbl')
-            track.add_inner_box(self._stts[tr], 'stbl')
-            track.add_inner_box(self._stsc[tr], 'stbl')
-            track.add_inner_box(self._stsz[tr], 'stbl')
+    def _move_moov(self, filename: str, moov: bytes) -> None:
+        """Rewrites the recording with the movie box before media data"""
+        with open(filename + '.part', 'rb') as src, open(filename + '.tmp', 'wb') as dst:
+            dst.write(src.read(self._mdat_position))
+            dst.write(moov)
+            shutil.copyfileobj(src, dst, self.buffer_size)
+        os.replace(filename + '.tmp', filename + '.part')
+
+    def _moov(self, tables: List[SampleTable], shift: int = 0) -> Box:
+        duration = max([table.duration * 1000 // table.timescale for table in tables] + [0])
+        version = 1 if duration > 0xffffffff else 0
+        moov: Box = Box(type='moov')
+        moov.add_inner_box(mvhd.Box(version=version, timescale=1000, duration=duration, next_track_id=len(tables) + 1))
+        for track_id, table in enumerate(tables, 1):
+            if table.handler_type == 'vide':
+                width, height = int(self._metadata.get('width', 0.)), int(self._metadata.get('height', 0.))
+                entry = stsd.VisualSampleEntry(format=VIDEO_SAMPLE_ENTRIES[self._coding.type],
+                                                width=width,
+                                                height=height)
+                entry.add_coding(self._coding)
+                kwargs = {'width': width << 16, 'height': height << 16}
+                media_header = vmhd.Box(flags=1)
+            else:
+                entry = stsd.AudioSampleEntry(channels=self._channels, sample_rate=table.timescale)
+                entry.add_descriptors(esds.Box(config=self._audio_config, stream_id=track_id))
+                kwargs = {'volume': 0x0100}
+                media_header = smhd.Box()
+            media_duration = table.duration
+            track: Box = Box(type='trak')
+            track.add_inner_box(tkhd.Box(version=version,
+                                         flags=3,
+                                         track_id=track_id,
+                                         duration=media_duration * 1000 // table.timescale,
+                                         **kwargs))
+            track.add_inner_box(Box(type='mdia'))
+            track.add_inner_box(mdhd.Box(version=1 if media_duration > 0xffffffff else 0,
+                                         timescale=table.timescale,
+                                         duration=media_duration),
+                                'mdia')
+            track.add_inner_box(hdlr.Box(handler_type=table.handler_type,
+                                         name='VideoHandler' if table.handler_type == 'vide' else 'SoundHandler'),
+                                'mdia')
+            track.add_inner_box(Box(type='minf'), 'mdia')
+            track.add_inner_box(media_header, 'minf')
+            track.add_inner_box(Box(type='dinf'), 'minf')
+            dref_box = dref.Box()
+            dref_box.add_entry(dref.Entry(type='url ', flags=1))
+            track.add_inner_box(dref_box, 'dinf')
+            track.add_inner_box(Box(type='stbl'), 'minf')
+            sample_description = stsd.Box()
+            sample_description.add_entry(entry)
+            track.add_inner_box(sample_description, 'stbl')
+            for box in table.boxes(shift):
+                track.add_inner_box(box, 'stbl')
             moov.add_inner_box(track)
-        file.write(moov.to_bytes())
+        return moov
+
+    @staticmethod
+    def _ftyp() -> bytes:
+        return ftyp.Box(major_brand='isom',
+                        minor_version=512,
+                        compatible_brands={'isom', 'iso2', 'avc1', 'mp41'}).to_bytes()
+
+
+class FragmentedMp4Sink(LiveSink):
+    """Records published stream as fragmented mp4: the init segment followed by moof and mdat per group
+    of pictures, each written at once as it is cut. The file is playable while it grows and a crash loses
+    only fragments written after the last fsync. With rotation recording goes on in <name>-<index>.mp4
+    files of about the duration in seconds or the size in bytes"""
+    fragment_duration = 1.  # floor, fragments are cut on key frames
+    sync_interval = 5.  # seconds between fsync of the file
+
+    def __init__(self, root: str, rotation_duration: float = 0., rotation_size: int = 0,
+                 writer: Optional[DiskWriter] = None) -> None:
+        super().__init__(root, self.fragment_duration, math.inf, writer)
+        self._rotation: tuple = rotation_duration, rotation_size
+        self._name: str = ''
+        self._file = None  # made use of by the writer only
+
+    def _reset(self) -> None:
+        super()._reset()
+        self._filename: str = ''  # of the file being recorded
+        self._file_index: int = 0
+        self._file_start: float = 0.
+        self._file_size: int = 0
+        self._synced: float = 0.
+
+    def __del__(self) -> None:
+        self.close()
+
+    def on_publish(self, publish_name: str) -> None:
+        self._reset()
+        publish_name = os.path.normpath('/' + publish_name)[1:]  # stays within the root
+        self._name = os.path.join(self._root, publish_name)
+        self._folder = os.path.dirname(self._name) or '.'
+        self._writer.call(self._make_folder, self._folder)
+
+    def close(self) -> None:
+        """Flushes the rest of ingest and closes the recording"""
+        super().close()
+        if self._filename:
+            self._close_file()
+
+    def _flush(self, end: float, segment_end: bool) -> None:
+        """Appends samples up to the end time to the recording as a fragment"""
+        video, self._video = self._video, []
+        audio = [sample for sample in self._audio if sample.time < end * self._sample_rate]
+        self._audio = self._audio[len(audio):]
+        if video or audio:
+            duration, size = self._rotation
+            if self._filename and \
+                    (0 < duration <= self._part_start - self._file_start or 0 < size <= self._file_size):
+                self._close_file()
+            if not self._filename:
+                self._open_file()
+            fragment = self._fragment(video, audio)
+            sync = time.monotonic() - self._synced >= self.sync_interval
+            if sync:
+                self._synced = time.monotonic()
+            self._writer.call(self._append, fragment, sync, size=len(fragment))
+            self._file_size += len(fragment)
+        self._part_start = self._segment_start = end
+
+    def _write_playlist(self) -> None:
+        """Recording has no playlist"""
+
+    def _open_file(self) -> None:
+        self._filename = f'{self._name}-{self._file_index:03d}.mp4' if any(self._rotation) \
+            else self._name + '.mp4'
+        self._file_index += 1
+        init = self._init_segment()
+        self._writer.call(self._open, self._filename, init, size=len(init))
+        self._file_start = self._part_start
+        self._file_size = len(init)
+
+    def _close_file(self) -> None:
+        self._writer.call(self._close)
+        self._filename = ''
+        self._synced = time.monotonic()
+
+    @staticmethod
+    def _make_folder(folder: str) -> None:
+        os.makedirs(folder, exist_ok=True)  # unlike live output, earlier recordings stay
+
+    def _open(self, filename: str, init: bytes) -> None:
+        self._file = open(filename, 'wb')
+        self._file.write(init)
+
+    def _append(self, fragment: bytes, sync: bool) -> None:
+        if self._file is not None:
+            self._file.write(fragment)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def _close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            finally:
+                self._file.close()
+                self._file = None
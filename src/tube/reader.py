@@ -1,7 +1,9 @@
 """Reads MP4 format file"""
+import bisect
+import itertools
 from enum import IntEnum
 from .atom.atom import Box
-from .atom import stco, stsc, stsz, tkhd, mdhd, co64, stts, ctts, hdlr, stsd, trun
+from .atom import stco, stsc, stsz, tkhd, mdhd, co64, stts, ctts, hdlr, stsd, stss, trun
 from .atom import ftyp, vmhd, mvhd, smhd, dref, hvcc  # noqa # pylint: disable=unused-import
 
 
@@ -19,6 +21,11 @@ class SamplesStscInfo:
             if i > 0:
                 chunk_run_size = entry.first_chunk - entries[i-1].first_chunk
                 self._chunks.extend([entries[i-1].samples_per_chunk] * chunk_run_size)
+        self._firsts = [0] + list(itertools.accumulate(self._chunks))  # index of first sample of chunk
+        self._last = entries[-1].samples_per_chunk if entries else 1  # the last run lasts to the end of track
+
+    def _samples_per_chunk(self, index):
+        return self._chunks[index] if index < len(self._chunks) else self._last
 
     @property
     def chunk_aligned(self):
@@ -27,21 +34,31 @@ class SamplesStscInfo:
 
     def next(self):
         """Forward iterates chunk to sample index"""
-        if self._chunk_index < len(self._chunks):
-            self._sample_index += 1
-            if self._sample_index >= self._chunks[self._chunk_index]:  # chunk is depleted
-                self._sample_index = 0
-                self._chunk_index += 1
+        self._sample_index += 1
+        if self._sample_index >= self._samples_per_chunk(self._chunk_index):  # chunk is depleted
+            self._sample_index = 0
+            self._chunk_index += 1
 
     def prev(self):
         """Backward iterates chunk to sample index"""
         if self._sample_index == 0:  # chunk is depleted
             if self._chunk_index:
                 self._chunk_index -= 1
-                self._sample_index = self._chunks[self._chunk_index]
+                self._sample_index = self._samples_per_chunk(self._chunk_index)
         if self._sample_index:
             self._sample_index -= 1
 
+    def seek(self, index):
+        """Positions on the sample. Returns index of its chunk and number of samples before it in the chunk"""
+        firsts = self._firsts
+        chunk_index = bisect.bisect_right(firsts, index) - 1
+        if chunk_index < len(self._chunks):
+            self._chunk_index, self._sample_index = chunk_index, index - firsts[chunk_index]
+            return chunk_index, self._sample_index
+        chunk_index, self._sample_index = divmod(index - firsts[-1], self._last)
+        self._chunk_index = len(self._chunks) + chunk_index
+        return self._chunk_index, self._sample_index
+
 
 class SamplesStcoInfo:
     """Chunk offset information"""
@@ -67,6 +84,10 @@ class SamplesStcoInfo:
         else:
             raise EOFError('stco box depleted')
 
+    def seek(self, index):
+        """Positions on the chunk"""
+        self._index = index
+
 
 class SamplesStszInfo:
     """Sample sizes"""
@@ -78,6 +99,24 @@ class SamplesStszInfo:
         """Returns size of the current sample"""
         return self._entries[self._index]
 
+    @property
+    def index(self):
+        """Returns index of the current sample"""
+        return self._index
+
+    @property
+    def count(self):
+        """Returns number of samples"""
+        return len(self._entries)
+
+    def size(self, index):
+        """Returns size of the sample"""
+        return self._entries[index]
+
+    def seek(self, index):
+        """Positions on the sample"""
+        self._index = index
+
     def next(self):
         """Forward iterates sample size index"""
         if self._index < len(self._entries):
@@ -98,6 +137,8 @@ class SamplesSttsInfo:
     def __init__(self, entries):
         self._entry_index, self._delta_index = 0, 0
         self._entries = entries
+        self._firsts = [0] + list(itertools.accumulate(entry.count for entry in entries))
+        self._times = [0] + list(itertools.accumulate(entry.count * entry.delta for entry in entries))
 
     def current_decoding_time(self):
         """Returns decoding time of the current sample"""
@@ -123,12 +164,33 @@ class SamplesSttsInfo:
         if self._delta_index:
             self._delta_index -= 1
 
+    def decoding_time(self, index):
+        """Returns decoding time of the sample: sum of durations of all preceding ones"""
+        entry_index = min(bisect.bisect_right(self._firsts, index) - 1, len(self._entries) - 1)
+        return self._times[entry_index] + (index - self._firsts[entry_index]) * self._entries[entry_index].delta
+
+    def seek(self, index):
+        """Positions on the sample"""
+        self._entry_index = bisect.bisect_right(self._firsts, index) - 1
+        self._delta_index = index - self._firsts[self._entry_index]
+
 
 class SamplesCttsInfo:
     """Composition Time to sample"""
     def __init__(self):
         self._offset_index, self._entry_index = 0, 0
-        self.entries = []
+        self._entries, self._firsts = [], [0]
+
+    @property
+    def entries(self):
+        """Returns ctts entries"""
+        return self._entries
+
+    @entries.setter
+    def entries(self, entries):
+        """Sets ctts entries and indices of their first samples"""
+        self._entries = entries
+        self._firsts = [0] + list(itertools.accumulate(entry.count for entry in entries))
 
     def current_composition_time(self):
         """Returns composition time of the current sample"""
@@ -158,6 +220,13 @@ class SamplesCttsInfo:
             if self._offset_index:
                 self._offset_index -= 1
 
+    def seek(self, index):
+        """Positions on the sample"""
+        self._entry_index, self._offset_index = 0, 0
+        if index < self._firsts[-1]:
+            self._entry_index = bisect.bisect_right(self._firsts, index) - 1
+            self._offset_index = index - self._firsts[self._entry_index]
+
 
 class SamplesInfo:  # pylint: disable=too-many-instance-attributes
     """Composite information of sample atoms"""
@@ -170,6 +239,7 @@ class SamplesInfo:  # pylint: disable=too-many-instance-attributes
         self.stts = SamplesSttsInfo([])
         self.ctts = SamplesCttsInfo()
         self.stsc = SamplesStscInfo([])
+        self.sync_samples = None  # all samples are sync ones
 
     def fill_chunk_offset_info(self, info):
         """Sets chunk offset information"""
@@ -191,6 +261,45 @@ class SamplesInfo:  # pylint: disable=too-many-instance-attributes
         """Sets sample to chunk information"""
         self.stsc = SamplesStscInfo(info)
 
+    def fill_sync_sample_info(self, info):
+        """Sets sync sample information as zero based sample indices"""
+        self.sync_samples = [number - 1 for number in info]
+
+    @property
+    def index(self):
+        """Returns index of the current sample"""
+        return self.stsz.index
+
+    def decoding_time(self, index):
+        """Returns decoding time of the sample"""
+        return self.stts.decoding_time(index)
+
+    def sync_sample(self, reference, forward=True, distance=0):
+        """Returns index of the closest sync sample after (before if not forward) the reference one
+           at least distance of decoding time away, None if there is no such sample"""
+        sync = self.sync_samples if self.sync_samples is not None else range(self.stsz.count)
+        if forward:
+            positions = range(bisect.bisect_right(sync, reference), len(sync))
+        else:
+            positions = range(bisect.bisect_left(sync, reference) - 1, -1, -1)
+        for position in positions:
+            if not distance or abs(self.decoding_time(sync[position]) - self.decoding_time(reference)) >= distance:
+                return sync[position]
+        return None
+
+    def seek(self, index):
+        """Positions all sample tables on the sample"""
+        if not 0 <= index < self.stsz.count:
+            raise IndexError('sample out of range')
+        chunk_index, preceding = self.stsc.seek(index)
+        self.stco.seek(chunk_index)
+        self.stsz.seek(index)
+        self.stts.seek(index)
+        self.ctts.seek(index)
+        self.offset = self.stco.offset() + sum(self.stsz.size(i) for i in range(index - preceding, index))
+        self.size = 0
+        self._info_depleted = False
+
     def sample(self):
         """Returns a specific sample information"""
         if self._info_depleted:
@@ -235,6 +344,8 @@ class SamplesInfo:  # pylint: disable=too-many-instance-attributes
 
 class Reader:
     """Reads atom from MP4 format file"""
+    live = False
+
     def __init__(self, filename):
         self.media_duration_sec = 0.
         self.boxes = []
@@ -270,8 +381,8 @@ class Reader:
             ret.extend(box.find_inner_boxes(box_type))
         return ret
 
-    def next_sample(self, track_id, forward=True):
-        """Reads track next sample from file"""
+    def next_sample(self, track_id, forward=True, read=True):
+        """Reads track next sample from file. Without read only sample position, size and timing are set"""
         sample = self.samples_info[track_id].sample()
         if sample is None:
             raise IndexError('samples depleted')
@@ -279,10 +390,16 @@ class Reader:
             self.samples_info[track_id].next()
         else:
             self.samples_info[track_id].prev()
-        self.file.seek(sample.offset)
-        sample.data = self.file.read(sample.size)
+        if read:
+            self.file.seek(sample.offset)
+            sample.data = self.file.read(sample.size)
         return sample
 
+    def sync_sample(self, track_id, index):
+        """Moves to the sample and returns it without reading. Samples around are not read at all"""
+        self.samples_info[track_id].seek(index)
+        return self.next_sample(track_id, read=False)
+
     def move_to(self, offset):
         """Moves forward position indicator to the offset"""
         self.move(offset, True)
@@ -394,6 +511,12 @@ class Reader:
                 self.samples_info[track_id].fill_sample_sizes_info([box.sample_size])
         return track_id, handler
 
+    def _on_stss(self, box, track_id, handler):
+        """Manager Sync Sample box"""
+        if box.type == stss.atom_type():
+            self.samples_info[track_id].fill_sync_sample_info(box.entries)
+        return track_id, handler
+
     def _on_stsc(self, box, track_id, handler):
         """Manager Sample Chunk box"""
         if box.type == stsc.atom_type():
@@ -1,16 +1,61 @@
 """RTMP protocol message format"""
 from __future__ import annotations
+import secrets
+import struct
 from collections import namedtuple, defaultdict
+from typing import Optional
 
 CS0 = namedtuple('CS0', 'version')
 CSn = namedtuple('CSn', 'time time2 random')
 
+_handshake_times = struct.Struct('>II')
+_message_header_lengths = (11, 7, 3, 0)
+_type2 = struct.Struct('>HB')  # 24-bit timestamp
+_type1 = struct.Struct('>HBHBB')  # 24-bit timestamp, 24-bit message length, message type id
+_message_stream_id = struct.Struct('<I')
+_extended_timestamp = struct.Struct('>I')
+
 
 class ChunkException(ValueError):
     """Exception, raised on chunk errors"""
     pass
 
 
+class ChunkLengthException(ChunkException):
+    """Exception, raised on a message declared longer than allowed"""
+    pass
+
+
+class Handshake:
+    """S0S1S2 in one buffer allocated with the connection. S0 and S1 are written at once, S2 echoes C1"""
+    size: int = 1536  # of C1, S1, C2 and S2
+
+    def __init__(self, version: int, time: int) -> None:
+        self.buffer: bytearray = bytearray(1 + 2 * self.size)
+        self.buffer[0] = version
+        _handshake_times.pack_into(self.buffer, 1, time, 0)
+        self.buffer[9:1 + self.size] = secrets.token_bytes(self.size - 8)
+        self.c1_time: Optional[int] = None
+
+    @property
+    def s1_time(self) -> int:
+        return _handshake_times.unpack_from(self.buffer, 1)[0]
+
+    def respond(self, c0c1) -> bytearray:
+        """Returns S0S1S2, S2 is written with time and random data of C1"""
+        if len(c0c1) < 1 + self.size:
+            raise ChunkException(f'{self.__class__.__name__}: C0C1 too short {len(c0c1)}')
+        self.c1_time = _handshake_times.unpack_from(c0c1, 1)[0]
+        _handshake_times.pack_into(self.buffer, 1 + self.size, self.c1_time, self.s1_time)
+        self.buffer[9 + self.size:] = c0c1[9:1 + self.size]
+        return self.buffer
+
+    def verify(self, c2) -> tuple:
+        """Returns if time, time2 and random data of C2 are the expected ones"""
+        time, time2 = _handshake_times.unpack_from(c2, 0)
+        return time == self.s1_time, time2 == self.c1_time, c2[8:self.size] == self.buffer[9:1 + self.size]
+
+
 class ChunkBasicHeader:
     """
     +-+-+-+-+-+-+-+-+
@@ -71,9 +116,11 @@ class ChunkMessageHeader:
     +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+ """
     def __init__(self):
         self.timestamp: int = 0
+        self.timestamp_delta: int = 0
         self.message_length: int = 0
         self.message_type_id: int = 0
         self.message_stream_id: int = 0
+        self.extended: bool = False  # type 3 chunks carry extended timestamp too
         self._length: int = 0
 
     def from_bytes(self, message: bytes) -> ChunkMessageHeader:
@@ -81,18 +128,43 @@ class ChunkMessageHeader:
         basic_header: ChunkBasicHeader = ChunkBasicHeader()
         basic_header.from_bytes(message)
         self._length = len(basic_header)
-        {
-            0: self._type0,
-            1: self._type1,
-            2: self._type2,
-        }.get(basic_header.chunk_type, self._type3)(message[self._length:self._length+11])
-        if self.timestamp == 0xffffff:
-            if len(message) < 16:
-                raise ChunkException(f'{self.__class__.__name__}: message too short {len(message)}')
-            self.timestamp = int(message[self._length:self._length+4])
-            self._length += 4
+        self._length += self.unpack_from(memoryview(message), self._length, basic_header.chunk_type)
         return self
 
+    def unpack_from(self, view: memoryview, offset: int, chunk_type: int) -> int:
+        """Parses message header of the chunk type with extended timestamp. Returns its length.
+        Fields stay intact if the view is too short"""
+        length: int = _message_header_lengths[chunk_type]
+        if len(view) < offset + length:
+            raise ChunkException(f'{self.__class__.__name__}: message too short {len(view) - offset}')
+        if chunk_type < 3:
+            if chunk_type == 2:
+                high, low = _type2.unpack_from(view, offset)
+            else:
+                high, low, length_high, length_low, message_type_id = _type1.unpack_from(view, offset)
+            delta: int = (high << 8) | low
+            extended: bool = delta == 0xffffff
+        else:
+            extended = self.extended
+        if extended:
+            if len(view) < offset + length + 4:
+                raise ChunkException(f'{self.__class__.__name__}: message too short {len(view) - offset}')
+            if chunk_type < 3:
+                delta = _extended_timestamp.unpack_from(view, offset + length)[0]
+            length += 4
+        if chunk_type < 3:
+            self.extended = extended
+            self.timestamp_delta = delta
+            if chunk_type == 0:
+                self.timestamp = delta  # absolute one, the delta of following type 3 chunks
+                self.message_stream_id = _message_stream_id.unpack_from(view, offset + 7)[0]
+            else:
+                self.timestamp += delta
+            if chunk_type < 2:
+                self.message_length = (length_high << 8) | length_low
+                self.message_type_id = message_type_id
+        return length
+
     def to_bytes(self, basic_header: ChunkBasicHeader) -> bytes:
         return basic_header.to_bytes() +\
          {
@@ -101,41 +173,17 @@ class ChunkMessageHeader:
             2: self._type2_to_bytes,
          }.get(basic_header.chunk_type, lambda: b'')()
 
-    def _type0(self, message: bytes):
-        if len(message) < 11:
-            raise ChunkException(f'{self.__class__.__name__}: message too short {len(message)}')
-        self._type1(message)
-        self.message_stream_id = int.from_bytes(message[7:11], byteorder='little')
-        self._length += 4
-
     def _type0_to_bytes(self) -> bytes:
         return self._type1_to_bytes() + self.message_stream_id.to_bytes(4, 'little')
 
-    def _type1(self, message: bytes):
-        if len(message) < 7:
-            raise ChunkException(f'{self.__class__.__name__}: message too short {len(message)}')
-        self._type2(message)
-        self.message_length = int.from_bytes(message[3:6], byteorder='big')
-        self.message_type_id = int(message[6])
-        self._length += 4
-
     def _type1_to_bytes(self) -> bytes:
         return self._type2_to_bytes() +\
                self.message_length.to_bytes(3, 'big') +\
                self.message_type_id.to_bytes(1, 'big')
 
-    def _type2(self, message: bytes):
-        if len(message) < 3:
-            raise ChunkException(f'{self.__class__.__name__}: message too short {len(message)}')
-        self.timestamp += int.from_bytes(message[0:3], byteorder='big')
-        self._length += 3
-
     def _type2_to_bytes(self) -> bytes:
         return self.timestamp.to_bytes(3, 'big')
 
-    def _type3(self, message: bytes):
-        pass
-
     def __repr__(self):
         return f'{self.__class__.__name__}(timestamp={self.timestamp},' \
                f' message length={self.message_length}),' \
@@ -146,6 +194,14 @@ class ChunkMessageHeader:
         return self._length
 
 
+class ChunkStream:
+    """Message being reassembled on a chunk stream and the header its next chunks inherit"""
+    def __init__(self) -> None:
+        self.header: ChunkMessageHeader = ChunkMessageHeader()
+        self.message: bytearray = bytearray()  # grows as chunks of the message come
+        self.length: int = 0  # of the message being reassembled
+
+
 class Chunk:
     """
     +--------------+----------------+--------------------+--------------+
@@ -154,14 +210,13 @@ class Chunk:
     <-------------------- Chunk Header ------------------>"""
     _default_size: int = 128
 
-    def __init__(self):
+    def __init__(self, max_message_length: int = 0xffffff):
         self._size = self.__class__._default_size
-        self._header: defaultdict = defaultdict(lambda: ChunkMessageHeader())
-        self._chunk_stream_id: int = 0
-        self._data: bytearray = bytearray()
+        self._max_message_length: int = max_message_length
+        self._streams: defaultdict = defaultdict(ChunkStream)
+        self._stream: Optional[ChunkStream] = None  # stream of the chunk being read
+        self._chunk_left: int = 0  # data of the chunk being read yet to come
         self._cache: bytearray = bytearray()
-        self._start_of_chunk: bool = True
-        self._filled_part_of_chunk: int = 0
 
     @property
     def size(self) -> int:
@@ -171,41 +226,66 @@ class Chunk:
     def size(self, value: int) -> None:
         self._size = value
 
+    @property
+    def buffered(self) -> int:
+        """Returns bytes kept for messages being reassembled"""
+        return len(self._cache) + sum(len(stream.message) for stream in self._streams.values())
+
+    def abort(self, stream_id: int) -> None:
+        """Discards the message being reassembled on the chunk stream"""
+        stream: Optional[ChunkStream] = self._streams.get(stream_id)
+        if stream is not None:
+            stream.message, stream.length = bytearray(), 0
+
     def parse(self, buffer: bytes, callback, out_data):
-        """Parses Chunk Header, Stores Chunk Data"""
-        offset: int = 0
-        self._cache += buffer
-        while offset < len(self._cache):
-            if self._start_of_chunk:
-                self._filled_part_of_chunk = 0
+        """Parses chunks of the buffer, calls back with every completed message.
+        Only a chunk header split between buffers is kept over to the next one"""
+        if self._cache:
+            self._cache += buffer
+            buffer = self._cache
+        with memoryview(buffer) as view:
+            offset: int = self._parse(view, callback, out_data)
+            self._cache = bytearray(view[offset:])
+
+    def _parse(self, view: memoryview, callback, out_data) -> int:
+        offset, end = 0, len(view)
+        while offset < end:
+            if not self._chunk_left:
                 try:
-                    self._chunk_stream_id = ChunkBasicHeader().from_bytes(self._cache[offset:offset+3]).chunk_stream_id
-                    self._header[self._chunk_stream_id].from_bytes(self._cache[offset:offset+16])
+                    offset = self._parse_header(view, offset)
+                except ChunkLengthException:
+                    raise
                 except ChunkException:
                     break
-                offset += len(self._header[self._chunk_stream_id])
-            rc: int = self._store_data(self._cache[offset:offset+self._free_part()])
-            self._start_of_chunk = self._filled_part_of_chunk >= self._size
-            offset += rc
-            if self._ready():
-                callback(self._header[self._chunk_stream_id], self._data, out_data)
-                self._reset()
-        self._cache = self._cache[offset:]
-
-    def _free_part(self):
-        free_in_chunk: int = self._size - self._filled_part_of_chunk
-        free_in_message: int = self._header[self._chunk_stream_id].message_length - len(self._data)
-        return free_in_chunk if free_in_chunk < free_in_message else free_in_message
-
-    def _ready(self) -> bool:
-        return len(self._data) == self._header[self._chunk_stream_id].message_length
-
-    def _store_data(self, buffer: bytes) -> int:
-        self._data += buffer
-        self._filled_part_of_chunk += len(buffer)
-        return len(buffer)
-
-    def _reset(self):
-        self._start_of_chunk = True
-        self._filled_part_of_chunk = 0
-        self._data = b''
+            stream: ChunkStream = self._stream
+            size: int = min(self._chunk_left, end - offset)
+            stream.message += view[offset:offset + size]
+            self._chunk_left -= size
+            offset += size
+            if len(stream.message) == stream.length:
+                message, stream.message, stream.length = stream.message, bytearray(), 0
+                callback(stream.header, message, out_data)
+        return offset
+
+    def _parse_header(self, view: memoryview, offset: int) -> int:
+        """Parses chunk header at the offset. Returns offset of chunk data"""
+        chunk_type, stream_id = view[offset] >> 6, view[offset] & 0x3f
+        if stream_id < 2:  # 2 or 3 byte basic header
+            if len(view) < offset + 2 + stream_id:
+                raise ChunkException(f'{self.__class__.__name__}: basic header too short')
+            stream_id, offset = 64 + view[offset + 1] + (view[offset + 2] << 8 if stream_id else 0), \
+                offset + 2 + stream_id
+        else:
+            offset += 1
+        stream: ChunkStream = self._streams[stream_id]
+        offset += stream.header.unpack_from(view, offset, chunk_type)
+        if chunk_type < 3 or not stream.message:  # new message
+            if chunk_type == 3:  # keeps timestamp delta
+                stream.header.timestamp += stream.header.timestamp_delta
+            if stream.header.message_length > self._max_message_length:
+                raise ChunkLengthException(f'{self.__class__.__name__}: message length '
+                                           f'{stream.header.message_length} exceeds {self._max_message_length}')
+            stream.message, stream.length = bytearray(), stream.header.message_length
+        self._stream = stream
+        self._chunk_left = min(self._size, stream.length - len(stream.message))
+        return offset
@@ -1,15 +1,21 @@
 """RTMP protocol network connection"""
-import secrets
 from datetime import datetime
 from enum import IntEnum
-from typing import Optional
-from .chunk import CS0, CSn, Chunk, ChunkMessageHeader
-from .messages.amf0 import Number, String
-from .messages.command import Command, ResultCommand, Publish
-from .messages.control import SetChunkSize
-from .messages.control import WindowAcknowledgementSize, SetPeerBandwidth, UserControlMessage, UserControlEventType
-from .messages.data import DataMessageException, Data, VideoData, AudioData, PacketType
-from ..mp4sink import Mp4Sink
+from typing import Callable, Dict, Optional
+from .chunk import CS0, Chunk, ChunkMessageHeader, Handshake
+from .messages import response
+from .messages.amf0 import Type as Amf0
+from .messages.command import Command, Publish, Play
+from .messages.control import SetChunkSize, AbortMessage, Acknowledgement, WindowAcknowledgementSize, SetPeerBandwidth
+from .messages.control import UserControlMessage, UserControlEventType
+from .messages.data import DataMessageException, Data, VideoData, AudioData, PacketType, SoundFormat
+from .messages.data import AVCDecoderConfigurationRecord
+from . import stream
+from ..diskwriter import DiskWriter, IngestBudget
+from ..rtsp.output import OutputQueue
+from ..livesink import LiveSink
+from ..livesource import LiveSource
+from ..mp4sink import Mp4Sink, FragmentedMp4Sink
 
 State: IntEnum = IntEnum('State', ('Initial',
                                    'Handshake'
@@ -23,7 +29,10 @@ class ConnectionException(ValueError):
 
 
 class Connection:
-    """Manages RTMP protocol network connection activity"""
+    """Manages RTMP protocol network connection activity. Messages are dispatched by type id,
+    the ones of no interest are dropped"""
+    _play_chunk_size: bytes = SetChunkSize(stream.LiveStream.chunk_size).to_bytes()  # follows play start
+
     @staticmethod
     def version():
         return 3
@@ -31,12 +40,28 @@ class Connection:
     def __init__(self, address, params):
         self._verbal: bool = params.get("verb", False)
         self._address: str = address
-        self._c1: CSn = CSn(0, 0, b'')
-        self._s1: CSn = CSn(int(datetime.now().timestamp()), 0, secrets.token_bytes(1528))
+        self._handshake: Handshake = Handshake(Connection.version(), int(datetime.now().timestamp()))
         self._state: State = State.Initial
-        self._chunk: Chunk = Chunk()
-        self._stream_id: float = 1.
-        self._mp4sink: Mp4Sink = Mp4Sink(params.get('root', '.'))
+        self._c2: bytearray = bytearray()
+        self._ack_window: int = 0  # acknowledgements are not sent until the peer sets the window
+        self._received: int = 0
+        self._acknowledged: int = 0
+        self._budget: IngestBudget = IngestBudget(*params.get('ingest_limit', ()))
+        self._chunk: Chunk = Chunk(self._budget.connection_limit)
+        self._writer: DiskWriter = DiskWriter(self._budget)
+        self._mp4sink = FragmentedMp4Sink(params.get('root', '.'), *params['fragmented'], writer=self._writer) \
+            if 'fragmented' in params else Mp4Sink(params.get('root', '.'), params.get('faststart', False), self._writer)
+        self._livesink: LiveSink = LiveSink(params.get('root', '.'),
+                                            float(params.get('segment', 6.)),
+                                            float(params.get('part', .5)),
+                                            self._writer)
+        self._livesource: LiveSource = LiveSource()
+        self._publishing: bool = False
+        self._video_configuration: Optional[AVCDecoderConfigurationRecord] = None  # of the published stream
+        self._published: Optional[stream.LiveStream] = None
+        self._played: Optional[stream.LiveStream] = None
+        self._output: OutputQueue = OutputQueue(params.get('queue_limit', 4 * 1024 * 1024), 'drop')
+        self._out_data = None
         print(f'RTMP connect from {self._address}')
 
     def on_read_event(self, key, buffer):
@@ -47,141 +72,255 @@ class Connection:
             return
         raise EOFError()
 
+    def close(self):
+        """Ends publishing and leaves the played stream. Writes queued are made after the connection is gone"""
+        self._end_publishing()
+        self._writer.close()
+        if self._budget.throttled:
+            self._budget.resume()
+        if self._budget.throttles:
+            print(f'RTMP reads of {self._address} throttled {self._budget.throttles} times '
+                  f'for {self._budget.throttled_time:.3f}s')
+        if self._played:
+            stream.stop(self._played, self)
+            self._played = None
+
+    def _end_publishing(self):
+        """Ends recording, live playlist, live source and players of the published stream, if any"""
+        if not self._publishing:
+            return
+        self._publishing = False
+        self._mp4sink.close()
+        self._livesink.close()
+        self._livesource.close()
+        if self._published:
+            stream.unpublish(self._published)
+            self._published = None
+
+    def reading(self) -> bool:
+        """Verifies if ingest may be read, that is data waiting to be written is within budget.
+        Accounts time reads are paused for"""
+        if self._budget.exceeded:
+            self._budget.throttle()
+            return False
+        if self._budget.throttled:
+            paused = self._budget.resume()
+            print(f'RTMP reads of {self._address} resumed after {paused:.3f}s, '
+                  f'{self._budget.throttled_time:.3f}s throttled in total')
+        return True
+
     def on_write_event(self, key):
         """Manager write socket event"""
-        if key.data.outb:
-            sent = key.fileobj.send(key.data.outb)  # Should be ready to write
-            key.data.outb = key.data.outb[sent:]
+        self._output.push(key.data.outb)
+        key.data.outb = b''
+        if self._output:
+            self._output.send(key.fileobj)  # Should be ready to write
+
+    def send_message(self, message: bytes, keyframe: bool, type_id: int) -> None:
+        """Queues chunked message of the played stream. Media frames of a congested player are dropped
+        up to the next key frame, other messages (type id 0) are always sent"""
+        transport = getattr(self._out_data, 'transport', None)  # asyncio engine writes at once
+        congested: bool = transport.get_write_buffer_size() >= self._output.limit if transport \
+            else self._output.congested
+        if type_id and not self._output.filter.accept(type_id, keyframe, congested):
+            return
+        if transport is None:
+            self._output.push(message)
+        else:
+            transport.write(message)
 
     def _on_new_data(self, buffer, data):
-        if not self._c1.random:
+        if self._handshake.c1_time is None:
             self._on_c0(buffer, data)
-        elif self._state == State.Initial and len(buffer) >= 1536:
-            self._on_c2(buffer)
+        elif self._state == State.Initial:
+            self._c2 += buffer  # may come split or followed by the first chunks
+            if len(self._c2) >= 1536:
+                self._on_c2(self._c2[:1536])
+                if len(self._c2) > 1536:
+                    self._chunk.parse(self._c2[1536:], self._on_new_chunk, data)
+                self._c2 = bytearray()
         else:
             self._chunk.parse(buffer, self._on_new_chunk, data)
+        if self._chunk.buffered > self._budget.connection_limit:  # only reading on completes the messages
+            raise ConnectionException(f'messages being reassembled exceed {self._budget.connection_limit} bytes')
+        self._received += len(buffer)
+        if self._ack_window and self._received - self._acknowledged >= self._ack_window:
+            self._acknowledged = self._received
+            data.outb += Acknowledgement(self._received & 0xffffffff).to_bytes()
 
     def _on_c0(self, buffer, data):
         c0: CS0 = CS0(buffer[0])
         if c0.version != Connection.version():
             raise ConnectionException(f'unsupported protocol version {c0.version}')
-        self._c1 = CSn(int.from_bytes(buffer[1:5], byteorder='big'),
-                       int.from_bytes(buffer[5:9], byteorder='big'),
-                       buffer[9:])
-        s0: bytes = Connection.version().to_bytes(1, 'big')
-        s1: bytes = self._s1.time.to_bytes(4, 'big') + self._s1.time2.to_bytes(4, 'big') + self._s1.random
-        s2: bytes = self._c1.time.to_bytes(4, 'big') + self._s1.time.to_bytes(4, 'big') + self._c1.random
-        data.outb = s0 + s1 + s2
+        data.outb = self._handshake.respond(buffer)
 
     def _on_c2(self, buffer):
-        c2: CSn = CSn(int.from_bytes(buffer[0:4], byteorder='big'),
-                      int.from_bytes(buffer[4:8], byteorder='big'),
-                      buffer[8:])
-        time_ok, time2_ok, random_ok = c2.time == self._s1.time,\
-            c2.time2 == self._c1.time,\
-            c2.random == self._s1.random
+        time_ok, time2_ok, random_ok = self._handshake.verify(buffer)
         if not (time_ok and time2_ok and random_ok):
             raise ConnectionException(f'Handshake failed: time {time_ok}, time2 {time2_ok} random {random_ok}')
         self._state = State.Handshake
 
     def _on_new_chunk(self, header: ChunkMessageHeader, data: bytes, out_data):
-        print(header)
-        {
-            SetChunkSize.type_id: self._on_control,
-            Command.amf0_type_id: self._on_command,
-            Data.amf0_type_id: self._on_metadata,
-            Data.video_type_id: self._on_video_packet,
-            Data.audio_type_id: self._on_audio_packet,
-        }.get(header.message_type_id)(data, out_data=out_data, timestamp=header.timestamp)
-
-    def _on_control(self, data: bytes, **kwargs) -> None:
+        self._handlers.get(header.message_type_id, Connection._on_ignored)(self, data, header.timestamp, out_data)
+
+    def _on_ignored(self, data: bytes, timestamp: int, out_data) -> None:
+        pass
+
+    def _on_set_chunk_size(self, data: bytes, timestamp: int, out_data) -> None:
         self._chunk.size = SetChunkSize().from_bytes(data).chunk_size
-        print(f'new chunk size={self._chunk.size}')
-        out_data = kwargs.get('out_data')
         if out_data:
-            out_data.outb = ResultCommand(0., self._chunk.size,
-                                          additional=Number(8192.).to_bytes(),
-                                          name='onBWDone').to_bytes()
+            out_data.outb += response.bandwidth_done
+
+    def _on_abort(self, data: bytes, timestamp: int, out_data) -> None:
+        self._chunk.abort(AbortMessage(0).from_bytes(data).chunk_stream_id)
+
+    def _on_window_size(self, data: bytes, timestamp: int, out_data) -> None:
+        self._ack_window = WindowAcknowledgementSize().from_bytes(data).window_size
+
+    def _on_user_control(self, data: bytes, timestamp: int, out_data) -> None:
+        if len(data) < 6 or int.from_bytes(data[:2], 'big') != UserControlEventType.PingRequest:
+            return
+        ping: UserControlMessage = UserControlMessage().from_bytes(data)
+        if out_data:
+            out_data.outb += UserControlMessage(UserControlEventType.PingResponse, [ping.timestamp, 0]).to_bytes()
 
-    def _on_command(self, data: bytes, **kwargs) -> None:
+    def _on_amf3_command(self, data: bytes, timestamp: int, out_data) -> None:
+        self._on_command(data[1:], timestamp, out_data)  # AMF0 encoded after the format selector
+
+    def _on_command(self, data: bytes, timestamp: int, out_data) -> None:
         command: Optional[Command, None] = Command.make(data, self._chunk.size)
         if command:
-            print(command)
-            out_data = kwargs.get('out_data')
+            if self._verbal:
+                print(command)
             if out_data:
-                {
-                    'connect': self._on_connect,
-                    'releaseStream': self._on_release_stream,
-                    'FCPublish': self._on_fc_publish,
-                    'createStream': self._on_create_stream,
-                    '_checkbw': self._on_check_bw,
-                    'publish': self._on_publish,
-                }.get(command.type, None)(command, out_data)
+                self._commands[command.type](self, command, out_data)
 
     def _on_connect(self, command: Command, out_data) -> None:
-        out_data.outb = WindowAcknowledgementSize().to_bytes() + \
-                        SetPeerBandwidth().to_bytes() + \
-                        UserControlMessage().to_bytes() + \
-                        SetChunkSize().to_bytes() + \
-                        ResultCommand(command.transaction_id, self._chunk.size,
-                                      object={
-                                          'fmsVer': String('FMS/3,0,1,123'),
-                                          'capabilities': Number(31.)
-                                      },
-                                      args={
-                                          'level': String('status'),
-                                          'code': String('NetConnection.Connect.Success'),
-                                          'description': String('Connection succeeded.'),
-                                          'objectEncoding': Number(0.)
-                                      }).to_bytes()
+        out_data.outb += response.connect.to_bytes(command.transaction_id)
 
     def _on_release_stream(self, command: Command, out_data) -> None:
-        out_data.outb = ResultCommand(command.transaction_id, self._chunk.size).to_bytes()
+        out_data.outb += response.result.to_bytes(command.transaction_id)
 
     def _on_fc_publish(self, command: Command, out_data) -> None:
-        out_data.outb = ResultCommand(command.transaction_id, self._chunk.size, name='onFCPublish').to_bytes()
+        out_data.outb += response.fc_publish.to_bytes(command.transaction_id)
 
     def _on_create_stream(self, command: Command, out_data) -> None:
-        out_data.outb = ResultCommand(command.transaction_id, self._chunk.size,
-                                      additional=Number(self._stream_id).to_bytes()).to_bytes()
+        out_data.outb += response.create_stream.to_bytes(command.transaction_id)
 
     def _on_check_bw(self, command: Command, out_data) -> None:
-        out_data.outb = ResultCommand(command.transaction_id, self._chunk.size).to_bytes()
+        out_data.outb += response.result.to_bytes(command.transaction_id)
 
     def _on_publish(self, command: Publish, out_data) -> None:
+        self._end_publishing()
+        self._publishing = True
+        self._video_configuration = None
+        self._livesource = LiveSource()  # readers of the previous one see it ended
+        self._published = stream.publish(command.publishing_name)
         self._mp4sink.on_publish(command.publishing_name)
-        out_data.outb = UserControlMessage(UserControlEventType.StreamBegin, [1, 0]).to_bytes() +\
-            ResultCommand(0, self._chunk.size,
-                          args={
-                              'level': String('status'),
-                              'code': String('NetStream.Publish.Start'),
-                              'description': String(f'{command.publishing_name} is now published'),
-                              'details': String(command.publishing_name)
-                          },
-                          name='onStatus').to_bytes()
-
-    def _on_metadata(self, data: bytes, **kwargs) -> None:
+        self._livesink.on_publish(command.publishing_name)
+        self._livesource.on_publish(command.publishing_name)
+        out_data.outb += response.publish.to_bytes(command.publishing_name)
+
+    def _on_play(self, command: Play, out_data) -> None:
+        self._out_data = out_data
+        self.send_message(response.play.to_bytes(command.stream_name) + self._play_chunk_size, True, 0)
+        self._played = stream.play(command.stream_name, self)
+
+    def _on_unpublish(self, command: Command, out_data) -> None:
+        self._end_publishing()
+        if command.type == 'FCUnpublish':
+            out_data.outb += response.fc_unpublish.to_bytes(command.transaction_id)
+
+    def _on_amf3_metadata(self, data: bytes, timestamp: int, out_data) -> None:
+        self._on_metadata(data[1:], timestamp, out_data)  # AMF0 encoded after the format selector
+
+    def _on_metadata(self, data: bytes, timestamp: int, out_data) -> None:
         metadata: Optional[Data, None] = Data.make(data)
+        if self._published:
+            field: Amf0 = Amf0.make(data)
+            self._published.on_metadata(data[len(field):] if field.value == '@setDataFrame' else data)
         if metadata:
             self._mp4sink.on_metadata(metadata.object.value)
+            self._livesink.on_metadata(metadata.object.value)
+            self._livesource.on_metadata(metadata.object.value)
 
-    def _on_video_packet(self, data: bytes, **kwargs) -> None:
+    def _on_video_packet(self, data: bytes, timestamp: int, out_data) -> None:
+        if not data:
+            return
+        if self._published:
+            self._published.on_video(timestamp,
+                                     data,
+                                     data[0] >> 4 == 1,
+                                     len(data) > 1 and data[0] & 0xf == 7 and data[1] == PacketType.SequenceHeader)
         try:
-            VideoData(data, kwargs.get('timestamp', 0), self._video_callback)
+            video: VideoData = VideoData(data, timestamp, configuration=self._video_configuration)
+            self._video_configuration = video.configuration
+            for sink in (self._mp4sink, self._livesink, self._livesource):
+                if video.type == PacketType.SequenceHeader:
+                    sink.on_video_config(video.configuration)
+                else:
+                    sink.on_video_frame(timestamp, video.composition_time, video.keyframe, video.payload)
         except DataMessageException as ex:
             print(ex)
 
-    def _video_callback(self, packet_type: PacketType, payload: bytes, timestamp: int = 0) -> None:
-        if packet_type == PacketType.SequenceHeader:
-            self._mp4sink.on_video_config(payload)
-        else:
-            self._mp4sink.on_video_data(timestamp, payload)
+    def _on_audio_packet(self, data: bytes, timestamp: int, out_data) -> None:
+        if len(data) < 2:
+            return
+        if self._published:
+            self._published.on_audio(timestamp,
+                                     data,
+                                     data[0] >> 4 == SoundFormat.AAC and data[1] == PacketType.SequenceHeader)
+        audio: AudioData = AudioData(data)
+        if audio.format == SoundFormat.AAC:
+            for sink in (self._mp4sink, self._livesink, self._livesource):
+                if audio.type == PacketType.SequenceHeader:
+                    sink.on_audio_config(audio.payload)
+                else:
+                    sink.on_audio_frame(timestamp, audio.payload)
 
-    def _on_audio_packet(self, data: bytes, **kwargs) -> None:
-        AudioData(data, self._audio_callback)
+    def _on_aggregate(self, data: bytes, timestamp: int, out_data) -> None:
+        """Dispatches every message of the aggregate: type, size, timestamp, stream id and data followed by
+        back pointer. Timestamps of the messages are shifted for the first to take the aggregate one"""
+        offset: int = 0
+        base: Optional[int] = None
+        while offset + 11 <= len(data):
+            type_id: int = data[offset]
+            size: int = int.from_bytes(data[offset + 1:offset + 4], 'big')
+            message_time: int = int.from_bytes(data[offset + 4:offset + 7], 'big') | data[offset + 7] << 24
+            if offset + 11 + size > len(data):
+                break
+            base = message_time if base is None else base
+            if type_id != Connection.aggregate_type_id:
+                self._handlers.get(type_id, Connection._on_ignored)(self,
+                                                                    data[offset + 11:offset + 11 + size],
+                                                                    timestamp + message_time - base,
+                                                                    out_data)
+            offset += 11 + size + 4
 
-    def _audio_callback(self, packet_type: PacketType, payload: bytes) -> None:
-        if packet_type == PacketType.SequenceHeader:
-            self._mp4sink.on_audio_config(payload)
-        else:
-            self._mp4sink.on_audio_data(payload)
+    aggregate_type_id: int = 22
+    _handlers: Dict[int, Callable] = {
+        SetChunkSize.type_id: _on_set_chunk_size,
+        AbortMessage.type_id: _on_abort,
+        Acknowledgement.type_id: _on_ignored,  # the peer acknowledges what is sent
+        UserControlMessage.type_id: _on_user_control,
+        WindowAcknowledgementSize.type_id: _on_window_size,
+        SetPeerBandwidth.type_id: _on_ignored,  # output is bounded by the queue limit
+        Data.audio_type_id: _on_audio_packet,
+        Data.video_type_id: _on_video_packet,
+        Data.amf3_type_id: _on_amf3_metadata,
+        Command.amf3_type_id: _on_amf3_command,
+        Data.amf0_type_id: _on_metadata,
+        Command.amf0_type_id: _on_command,
+        aggregate_type_id: _on_aggregate,
+    }  # shared objects (16, 19) are not supported
+    _commands: Dict[str, Callable] = {
+        'connect': _on_connect,
+        'releaseStream': _on_release_stream,
+        'FCPublish': _on_fc_publish,
+        'createStream': _on_create_stream,
+        '_checkbw': _on_check_bw,
+        'publish': _on_publish,
+        'play': _on_play,
+        'FCUnpublish': _on_unpublish,
+        'deleteStream': _on_unpublish,
+    }
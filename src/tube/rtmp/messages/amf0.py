@@ -2,7 +2,8 @@
 from __future__ import annotations
 import struct
 from enum import IntEnum
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
+from . import amf3
 
 TypeMarker: IntEnum = IntEnum('TypeMarker', ('Number',
                                              'Boolean',
@@ -25,26 +26,43 @@ TypeMarker: IntEnum = IntEnum('TypeMarker', ('Number',
                               start=0
                               )
 
+_double: struct.Struct = struct.Struct('>d')
+_u16: struct.Struct = struct.Struct('>H')
+_u32: struct.Struct = struct.Struct('>I')
+_date: struct.Struct = struct.Struct('>dh')  # milliseconds since the epoch, reserved time zone
+_marker_double: struct.Struct = struct.Struct('>Bd')
+_marker_u16: struct.Struct = struct.Struct('>BH')
+_marker_u32: struct.Struct = struct.Struct('>BI')
+_marker_date: struct.Struct = struct.Struct('>Bdh')
+_object_end: bytes = b'\x00\x00' + bytes([TypeMarker.ObjectEnd])
+
+
+class Amf0Exception(ValueError):
+    """Exception, raised on malformed or unsupported AMF0 data"""
+    pass
+
 
 class Type:
     @staticmethod
     def make(data: bytes) -> Type:
-        marker: TypeMarker = int(data[0])
-        rc = {
-            TypeMarker.Number: Number(),
-            TypeMarker.Boolean: Boolean(),
-            TypeMarker.String: String(),
-            TypeMarker.Object: Object(),
-            TypeMarker.Null: Null(),
-            TypeMarker.EcmaArray: EcmaArray(),
-        }.get(marker, lambda: None)
-        rc.from_bytes(data[1:])
-        return rc
-
-    def __init__(self, marker: TypeMarker):
-        self.marker: TypeMarker = marker
-        self._value: Any = None
-        self._size: int = 0
+        """Returns the value the data starts with"""
+        return Type.decode(memoryview(data), 0)[0]
+
+    @staticmethod
+    def decode(view: memoryview, offset: int) -> Tuple[Type, int]:
+        """Returns the value at the offset of the view and the offset past it"""
+        try:
+            cls: type = _types[view[offset]]
+        except KeyError:
+            raise Amf0Exception(f'unsupported type marker {view[offset]}') from None
+        rc: Type = cls.__new__(cls)  # values are set as they are read
+        end: int = rc._read(view, offset + 1)
+        rc._size = end - offset
+        return rc, end
+
+    marker: TypeMarker = None
+    _value: Any = None
+    _size: int = 0
 
     def __len__(self):
         return self._size
@@ -57,15 +75,50 @@ class Type:
         return self._value
 
     def from_bytes(self, data: bytes) -> Type:
-        raise NotImplementedError
+        """Reads the value that follows the type marker"""
+        self._size = self._read(memoryview(data), 0) + 1
+        return self
 
     def to_bytes(self) -> bytes:
         raise NotImplementedError
 
+    def _read(self, view: memoryview, offset: int) -> int:
+        """Reads the value that follows the type marker at the offset. Returns the offset past the value"""
+        raise NotImplementedError
+
+
+def _string_size(value: str) -> int:
+    return len(value) if value.isascii() else len(value.encode('utf-8'))
+
+
+def _read_properties(view: memoryview, offset: int, values: dict) -> int:
+    """Reads (name, value) pairs up to the object end marker. Returns the offset past the marker"""
+    while True:
+        size: int = _u16.unpack_from(view, offset)[0]
+        offset += 2
+        if not size and view[offset] == TypeMarker.ObjectEnd:
+            return offset + 1
+        key: str = str(view[offset:offset + size], 'utf-8')
+        values[key], offset = Type.decode(view, offset + size)
+
+
+def _properties_bytes(values: dict) -> List[bytes]:
+    rc: List[bytes] = []
+    for key, value in values.items():
+        key = key.encode('utf-8')
+        rc.extend((_u16.pack(len(key)), key, value.to_bytes()))
+    rc.append(_object_end)
+    return rc
+
+
+def _properties_size(values: dict) -> int:
+    return sum(2 + _string_size(key) + len(value) for key, value in values.items()) + 3
+
 
 class Number(Type):
+    marker: TypeMarker = TypeMarker.Number
+
     def __init__(self, value: float = 0.):
-        super().__init__(TypeMarker.Number)
         self._value = value
         self._size = 9
 
@@ -75,207 +128,243 @@ class Number(Type):
     def __int__(self):
         return int(self._value)
 
-    def from_bytes(self, data: bytes) -> Type:
-        self._value = struct.unpack('>d', data[:8])[0]
-        return self
-
     def to_bytes(self) -> bytes:
-        return struct.pack('>Bd', int(self.marker), float(self._value))
+        return _marker_double.pack(TypeMarker.Number, float(self._value))
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        self._value = _double.unpack_from(view, offset)[0]
+        return offset + 8
 
 
 class Boolean(Type):
+    marker: TypeMarker = TypeMarker.Boolean
+
     def __init__(self, value: bool = False):
-        super().__init__(TypeMarker.Boolean)
         self._value = value
         self._size = 2
 
     def __bool__(self):
         return self._value
 
-    def from_bytes(self, data: bytes) -> Type:
-        self._value = data[0] != b'\x00'
-        return self
-
     def to_bytes(self) -> bytes:
-        return b'\x01' if self._value else b'\x00'
+        return bytes([TypeMarker.Boolean, 1 if self._value else 0])
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        self._value = view[offset] != 0
+        return offset + 1
 
 
 class String(Type):
+    marker: TypeMarker = TypeMarker.String
+
     def __init__(self, value: str = ''):
-        super().__init__(TypeMarker.String)
         self._value = value
-        self._size = 3 + len(value)
+        self._size = 3 + _string_size(value)
 
     def __str__(self):
         return self._value
 
-    def from_bytes(self, data: bytes) -> Type:
-        size: int = struct.unpack('>H', data[:2])[0]
-        self._value = data[2:2+size].decode('utf-8')
-        self._size = 3 + len(self._value)
-        return self
-
     def to_bytes(self) -> bytes:
-        return struct.pack('>BH', int(self.marker), len(self._value)) + self._value.encode('utf-8')
+        value: bytes = self._value.encode('utf-8')
+        return _marker_u16.pack(TypeMarker.String, len(value)) + value
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        size: int = _u16.unpack_from(view, offset)[0]
+        offset += 2
+        self._value = str(view[offset:offset + size], 'utf-8')
+        return offset + size
 
 
 class Object(Type):
-    def __init__(self, value: Dict[str: Any, ...] = None):
-        super().__init__(TypeMarker.Object)
-        self._value = value if value else dict()
-        self._size = 4
-        for item in self._value.items():
-            self._size += len(item[0]) + 2 + len(item[1])
+    marker: TypeMarker = TypeMarker.Object
 
-    def from_bytes(self, data: bytes) -> Type:
-        self._value = dict()
-        off: int = 0
-        while True:
-            key: str = String().from_bytes(data[off:]).value
-            off += len(key) + 2
-            self._value[key]: Type = Type.make(data[off:])
-            off += len(self._value[key])
-            if data[off] == data[off + 1] == 0 and data[off + 2] == TypeMarker.ObjectEnd:
-                break
-        self._size = off + 4
-        return self
+    def __init__(self, value: Dict[str, Type] = None):
+        self._value = value if value else dict()
+        self._size = 1 + _properties_size(self._value)
 
     def to_bytes(self) -> bytes:
-        rc: bytes = struct.pack('B', int(self.marker))
-        for item in self._value.items():
-            rc += struct.pack('>H', len(item[0])) + item[0].encode('utf-8') + item[1].to_bytes()
-        return rc + b'\x00\x00' + struct.pack('B', int(TypeMarker.ObjectEnd))
+        return b''.join([bytes([TypeMarker.Object])] + _properties_bytes(self._value))
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        self._value = dict()
+        return _read_properties(view, offset, self._value)
 
 
 class Null(Type):
+    marker: TypeMarker = TypeMarker.Null
+
     def __init__(self):
-        super().__init__(TypeMarker.Null)
         self._size = 1
 
-    def from_bytes(self, data: bytes) -> Type:
-        return self
+    def to_bytes(self) -> bytes:
+        return bytes([TypeMarker.Null])
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        return offset
+
+
+class Undefined(Type):
+    marker: TypeMarker = TypeMarker.Undefined
+
+    def __init__(self):
+        self._size = 1
 
     def to_bytes(self) -> bytes:
-        return struct.pack('B', int(self.marker))
+        return bytes([TypeMarker.Undefined])
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        return offset
 
 
 class Reference(Type):
+    marker: TypeMarker = TypeMarker.Reference
+
     def __init__(self, value: int = 0):
-        super().__init__(TypeMarker.Reference)
         self._value = value
         self._size = 3
 
-    def from_bytes(self, data: bytes) -> Type:
-        self._value = struct.unpack('>H', data[:2])[0]
-        return self
-
     def to_bytes(self) -> bytes:
-        return struct.pack('>BH', int(self.marker), self._value)
+        return _marker_u16.pack(TypeMarker.Reference, self._value)
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        self._value = _u16.unpack_from(view, offset)[0]
+        return offset + 2
 
 
 class EcmaArray(Type):
-    def __init__(self, value: Dict[str: Any, ...] = None):
-        super().__init__(TypeMarker.EcmaArray)
-        self._value = value if value else dict()
-        self._size = 4
-        for item in self._value.items():
-            self._size += len(item[0]) + 2 + len(item[1])
+    """Associative array. Its count is advisory, properties are read up to the object end marker"""
+    marker: TypeMarker = TypeMarker.EcmaArray
 
-    def from_bytes(self, data: bytes) -> Type:
-        self._value = dict()
-        count: int = struct.unpack('>I', data[:4])[0]
-        off: int = 4
-        for _ in range(count):
-            key: str = String().from_bytes(data[off:]).value
-            off += len(key) + 2
-            self._value[key]: Type = Type.make(data[off:])
-            off += len(self._value[key])
-        self._size = off
-        return self
+    def __init__(self, value: Dict[str, Type] = None):
+        self._value = value if value else dict()
+        self._size = 5 + _properties_size(self._value)
 
     def to_bytes(self) -> bytes:
-        rc: bytes = struct.pack('>BI', int(self.marker), len(self._value))
-        for item in self._value.items():
-            rc += struct.pack('>H', len(item[0])) + item[0].encode('utf-8') + item[1].to_bytes()
-        return rc
+        return b''.join([_marker_u32.pack(TypeMarker.EcmaArray, len(self._value))] +
+                        _properties_bytes(self._value))
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        self._value = dict()
+        return _read_properties(view, offset + 4, self._value)
 
 
 class StrictArray(Type):
+    marker: TypeMarker = TypeMarker.StrictArray
+
     def __init__(self, value: List[Type] = None):
-        super().__init__(TypeMarker.StrictArray)
         self._value = value if value else []
-        self._size = 4
-        for item in self._value:
-            self._size += len(item)
+        self._size = 5 + sum(len(item) for item in self._value)
 
-    def from_bytes(self, data: bytes) -> Type:
+    def to_bytes(self) -> bytes:
+        return b''.join([_marker_u32.pack(TypeMarker.StrictArray, len(self._value))] +
+                        [item.to_bytes() for item in self._value])
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        count: int = _u32.unpack_from(view, offset)[0]
+        offset += 4
         self._value = []
-        count: int = struct.unpack('>I', data[:4])[0]
-        off: int = 4
         for _ in range(count):
-            self._value.append(Type.make(data[off:]))
-            off += len(self._value[-1])
-        self._size = off
-        return self
-
-    def to_bytes(self) -> bytes:
-        rc: bytes = struct.pack('>BI', int(self.marker), len(self._value))
-        for item in self._value:
-            rc += item.to_bytes()
-        return rc
+            item, offset = Type.decode(view, offset)
+            self._value.append(item)
+        return offset
 
 
 class Date(Type):
+    """Milliseconds since the epoch, time zone is reserved and written as 0"""
+    marker: TypeMarker = TypeMarker.Date
+
     def __init__(self, value: float = 0.):
-        super().__init__(TypeMarker.Date)
         self._value = value
         self._size = 11
 
-    def from_bytes(self, data: bytes) -> Type:
-        # time-zone = S16 ; reserved, not supported should be set to 0x0000
-        self._value = struct.unpack('>d', data[2:10])[0]
-        return self
-
     def to_bytes(self) -> bytes:
-        return struct.pack('B', int(self.marker)) + b'\x00\x00' + struct.pack('>d', float(self._value))
+        return _marker_date.pack(TypeMarker.Date, float(self._value), 0)
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        self._value = _date.unpack_from(view, offset)[0]
+        return offset + 10
 
 
 class LongString(Type):
+    marker: TypeMarker = TypeMarker.LongString
+
     def __init__(self, value: str = ''):
-        super().__init__(TypeMarker.LongString)
         self._value = value
-        self._size = 5 + len(value)
+        self._size = 5 + _string_size(value)
 
     def __str__(self):
         return self._value
 
-    def from_bytes(self, data: bytes) -> Type:
-        size: int = struct.unpack('>I', data[:4])[0]
-        self._value = data[4:4+size].decode('utf-8')
-        self._size = 5 + len(self._value)
-        return self
-
     def to_bytes(self) -> bytes:
-        return struct.pack('>BI', int(self.marker), len(self._value)) + self._value.encode('utf-8')
+        value: bytes = self._value.encode('utf-8')
+        return _marker_u32.pack(self.marker, len(value)) + value
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        size: int = _u32.unpack_from(view, offset)[0]
+        offset += 4
+        self._value = str(view[offset:offset + size], 'utf-8')
+        return offset + size
+
+
+class XmlDocument(LongString):
+    marker: TypeMarker = TypeMarker.XmlDocument
 
 
 class TypedObject(Type):
-    def __init__(self, name: str, value: Object = Object()):
-        super().__init__(TypeMarker.TypedObject)
-        self._value = value
+    marker: TypeMarker = TypeMarker.TypedObject
+
+    def __init__(self, name: str = '', value: Object = None):
+        self._value = value if value is not None else Object()
         self._name: str = name
-        self._size = len(self._name) + 2 + len(self._value)
+        self._size = 2 + _string_size(self._name) + len(self._value)
 
-    def from_bytes(self, data: bytes) -> Type:
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def to_bytes(self) -> bytes:
+        name: bytes = self._name.encode('utf-8')
+        return _marker_u16.pack(TypeMarker.TypedObject, len(name)) + name + self._value.to_bytes()[1:]
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        size: int = _u16.unpack_from(view, offset)[0]
+        offset += 2
+        self._name = str(view[offset:offset + size], 'utf-8')
         self._value = Object()
-        off: int = struct.unpack('>H', data[:2])[0]
-        self._name = data[2:2+off].decode('utf-8')
-        off += 2
-        self._value = Object().from_bytes(data[off:])
-        self._size = off + len(self._value)
-        return self
+        end: int = self._value._read(view, offset + size)
+        self._value._size = end - offset - size + 1
+        return end
+
+
+class AvmPlus(Type):
+    """Value encoded in AMF3 within AMF0 data"""
+    marker: TypeMarker = TypeMarker.AvmPlusObject
+
+    def __init__(self, value: Any = None):
+        self._value = value
+        self._size = len(self.to_bytes()) if value is not None else 0
 
     def to_bytes(self) -> bytes:
-        return struct.pack('>BH', int(self.marker), len(self._name)) +\
-               self._name.encode('utf-8') +\
-               self._value.to_bytes()[1:]
+        return bytes([TypeMarker.AvmPlusObject]) + amf3.Encoder().encode(self._value)
+
+    def _read(self, view: memoryview, offset: int) -> int:
+        self._value, offset = amf3.Decoder().decode(view, offset)
+        return offset
+
+
+_types: Dict[int, type] = {
+    TypeMarker.Number: Number,
+    TypeMarker.Boolean: Boolean,
+    TypeMarker.String: String,
+    TypeMarker.Object: Object,
+    TypeMarker.Null: Null,
+    TypeMarker.Undefined: Undefined,
+    TypeMarker.Reference: Reference,
+    TypeMarker.EcmaArray: EcmaArray,
+    TypeMarker.StrictArray: StrictArray,
+    TypeMarker.Date: Date,
+    TypeMarker.LongString: LongString,
+    TypeMarker.XmlDocument: XmlDocument,
+    TypeMarker.TypedObject: TypedObject,
+    TypeMarker.AvmPlusObject: AvmPlus,
+}
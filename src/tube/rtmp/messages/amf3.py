@@ -1,11 +1,12 @@
 """An improved compact binary format that is used to serialize ActionScript object graphs"""
-from enum import IntEnum
 import struct
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Tuple
 
 TypeMarker: IntEnum = IntEnum('TypeMarker', ('Undefined',
                                              'Null',
-                                             'False',
-                                             'True',
+                                             'FalseValue',
+                                             'TrueValue',
                                              'Integer',
                                              'Double',
                                              'String',
@@ -14,24 +15,323 @@ TypeMarker: IntEnum = IntEnum('TypeMarker', ('Undefined',
                                              'Array',
                                              'Object',
                                              'Xml',
-                                             'ByteArray'),
+                                             'ByteArray',
+                                             'VectorInt',
+                                             'VectorUint',
+                                             'VectorDouble',
+                                             'VectorObject',
+                                             'Dictionary'),
                               start=0
                               )
 
+_double: struct.Struct = struct.Struct('>d')
+_marker_double: struct.Struct = struct.Struct('>Bd')
+_integer_min: int = -(1 << 28)
+_integer_max: int = (1 << 28) - 1
+
+
+class Amf3Exception(ValueError):
+    """Exception, raised on malformed or unsupported AMF3 data"""
+    pass
+
+
+class Date(float):
+    """Milliseconds since the epoch"""
+    pass
+
+
+class Xml(str):
+    """XML document as text"""
+    pass
+
+
+class Object(dict):
+    """Sealed and dynamic members of an object, named after its class. An anonymous object has empty class name"""
+    def __init__(self, *args, class_name: str = '', **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.class_name: str = class_name
+
+
+Traits = Tuple[str, bool, List[str]]  # class name, dynamic, sealed member names
+
+
+class Decoder:
+    """Decodes values of a message. References are resolved within the values decoded by the same decoder:
+    strings, objects and traits are kept in tables as they are read"""
+    def __init__(self) -> None:
+        self._strings: List[str] = []
+        self._objects: List[Any] = []
+        self._traits: List[Traits] = []
+
+    def decode(self, view: memoryview, offset: int = 0) -> Tuple[Any, int]:
+        """Returns the value at the offset of the view and the offset past it"""
+        try:
+            reader: Callable = self._readers[view[offset]]
+        except KeyError:
+            raise Amf3Exception(f'unsupported type marker {view[offset]}') from None
+        return reader(self, view, offset + 1)
+
+    @staticmethod
+    def _u29(view: memoryview, offset: int) -> Tuple[int, int]:
+        """Returns variable length unsigned 29-bit integer and the offset past it"""
+        value: int = 0
+        for _ in range(3):
+            byte: int = view[offset]
+            offset += 1
+            if byte < 0x80:
+                return (value << 7) | byte, offset
+            value = (value << 7) | (byte & 0x7f)
+        return (value << 8) | view[offset], offset + 1
+
+    def _string_value(self, view: memoryview, offset: int) -> Tuple[str, int]:
+        """Returns string that is either inline or a reference to a string read before"""
+        header, offset = self._u29(view, offset)
+        if not header & 1:
+            return self._strings[header >> 1], offset
+        size: int = header >> 1
+        if not size:
+            return '', offset
+        rc: str = str(view[offset:offset + size], 'utf-8')
+        self._strings.append(rc)
+        return rc, offset + size
+
+    def _reference(self, view: memoryview, offset: int) -> Tuple[int, int, bool]:
+        """Returns value of the header, the offset past it and if the header refers to an object read before"""
+        header, offset = self._u29(view, offset)
+        return header >> 1, offset, not header & 1
+
+    def _undefined(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        return None, offset
+
+    def _false(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        return False, offset
+
+    def _true(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        return True, offset
+
+    def _integer(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        value, offset = self._u29(view, offset)
+        return value - (1 << 29) if value & (1 << 28) else value, offset
+
+    def _double(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        return _double.unpack_from(view, offset)[0], offset + 8
+
+    def _string(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        return self._string_value(view, offset)
+
+    def _xml(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        value, offset, reference = self._reference(view, offset)
+        if reference:
+            return self._objects[value], offset
+        rc: Xml = Xml(str(view[offset:offset + value], 'utf-8'))
+        self._objects.append(rc)
+        return rc, offset + value
+
+    def _date(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        value, offset, reference = self._reference(view, offset)
+        if reference:
+            return self._objects[value], offset
+        rc: Date = Date(_double.unpack_from(view, offset)[0])
+        self._objects.append(rc)
+        return rc, offset + 8
+
+    def _array(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        """Returns the dense part as a list. If the associative part is not empty, returns a dict of both,
+        dense items keyed by their indices"""
+        count, offset, reference = self._reference(view, offset)
+        if reference:
+            return self._objects[count], offset
+        index: int = len(self._objects)
+        self._objects.append(None)
+        associative: Dict[Any, Any] = {}
+        while True:
+            key, offset = self._string_value(view, offset)
+            if not key:
+                break
+            associative[key], offset = self.decode(view, offset)
+        dense: List[Any] = []
+        for _ in range(count):
+            item, offset = self.decode(view, offset)
+            dense.append(item)
+        if associative:
+            associative.update(enumerate(dense))
+            dense = associative
+        self._objects[index] = dense
+        return dense, offset
+
+    def _object(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        header, offset = self._u29(view, offset)
+        if not header & 1:
+            return self._objects[header >> 1], offset
+        if not header & 2:
+            class_name, dynamic, names = self._traits[header >> 2]
+        elif header & 4:
+            raise Amf3Exception('externalizable objects are not supported')
+        else:
+            dynamic = bool(header & 8)
+            class_name, offset = self._string_value(view, offset)
+            names = []
+            for _ in range(header >> 4):
+                name, offset = self._string_value(view, offset)
+                names.append(name)
+            self._traits.append((class_name, dynamic, names))
+        rc: Object = Object(class_name=class_name)
+        self._objects.append(rc)
+        for name in names:
+            rc[name], offset = self.decode(view, offset)
+        while dynamic:
+            name, offset = self._string_value(view, offset)
+            if not name:
+                break
+            rc[name], offset = self.decode(view, offset)
+        return rc, offset
+
+    def _byte_array(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        size, offset, reference = self._reference(view, offset)
+        if reference:
+            return self._objects[size], offset
+        rc: bytes = bytes(view[offset:offset + size])
+        self._objects.append(rc)
+        return rc, offset + size
+
+    def _vector(self, view: memoryview, offset: int, item: str, size: int) -> Tuple[Any, int]:
+        """Returns items of a fixed size vector, unpacked at once"""
+        count, offset, reference = self._reference(view, offset)
+        if reference:
+            return self._objects[count], offset
+        offset += 1  # fixed-length flag
+        rc: List[Any] = list(struct.unpack_from(f'>{count}{item}', view, offset))
+        self._objects.append(rc)
+        return rc, offset + count * size
+
+    def _vector_int(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        return self._vector(view, offset, 'i', 4)
+
+    def _vector_uint(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        return self._vector(view, offset, 'I', 4)
+
+    def _vector_double(self, view: memoryview, offset: int) -> Tuple[Any, int]:
+        return self._vector(view, offset, 'd', 8)
+
+    _readers: Dict[int, Callable] = {
+        TypeMarker.Undefined: _undefined,
+        TypeMarker.Null: _undefined,
+        TypeMarker.FalseValue: _false,
+        TypeMarker.TrueValue: _true,
+        TypeMarker.Integer: _integer,
+        TypeMarker.Double: _double,
+        TypeMarker.String: _string,
+        TypeMarker.XmlDoc: _xml,
+        TypeMarker.Date: _date,
+        TypeMarker.Array: _array,
+        TypeMarker.Object: _object,
+        TypeMarker.Xml: _xml,
+        TypeMarker.ByteArray: _byte_array,
+        TypeMarker.VectorInt: _vector_int,
+        TypeMarker.VectorUint: _vector_uint,
+        TypeMarker.VectorDouble: _vector_double,
+    }
+
+
+class Encoder:
+    """Encodes values of a message: None, bool, int, float, str, bytes, lists, dicts and the types above.
+    Strings repeated within the values encoded by the same encoder are written as references"""
+    def __init__(self) -> None:
+        self._strings: Dict[str, int] = {}
+
+    def encode(self, value: Any) -> bytes:
+        """Returns the value with its type marker"""
+        rc: List[bytes] = []
+        self._write(rc, value)
+        return b''.join(rc)
+
+    @staticmethod
+    def _u29(value: int) -> bytes:
+        """Returns variable length unsigned 29-bit integer"""
+        if value < 0x80:
+            return bytes((value,))
+        if value < 0x4000:
+            return bytes((value >> 7 | 0x80, value & 0x7f))
+        if value < 0x200000:
+            return bytes((value >> 14 | 0x80, value >> 7 & 0x7f | 0x80, value & 0x7f))
+        return bytes((value >> 22 | 0x80, value >> 15 & 0x7f | 0x80, value >> 8 & 0x7f | 0x80, value & 0xff))
+
+    def _write(self, rc: List[bytes], value: Any) -> None:
+        try:
+            writer: Callable = self._writers[type(value)]
+        except KeyError:
+            writer = next((w for t, w in self._writers.items() if isinstance(value, t)), None)
+            if writer is None:
+                raise Amf3Exception(f'unsupported value type {type(value).__name__}') from None
+        writer(self, rc, value)
+
+    def _write_string_value(self, rc: List[bytes], value: str) -> None:
+        if not value:
+            rc.append(b'\x01')
+            return
+        index = self._strings.get(value)
+        if index is not None:
+            rc.append(self._u29(index << 1))
+            return
+        self._strings[value] = len(self._strings)
+        data: bytes = value.encode('utf-8')
+        rc.extend((self._u29(len(data) << 1 | 1), data))
+
+    def _none(self, rc: List[bytes], value: Any) -> None:
+        rc.append(bytes((TypeMarker.Null,)))
+
+    def _bool(self, rc: List[bytes], value: bool) -> None:
+        rc.append(bytes((TypeMarker.TrueValue if value else TypeMarker.FalseValue,)))
+
+    def _int(self, rc: List[bytes], value: int) -> None:
+        if _integer_min <= value <= _integer_max:
+            rc.extend((bytes((TypeMarker.Integer,)), self._u29(value & 0x1fffffff)))
+        else:
+            rc.append(_marker_double.pack(TypeMarker.Double, value))
+
+    def _float(self, rc: List[bytes], value: float) -> None:
+        rc.append(_marker_double.pack(TypeMarker.Double, value))
+
+    def _date(self, rc: List[bytes], value: Date) -> None:
+        rc.extend((bytes((TypeMarker.Date, 1)), _double.pack(value)))
+
+    def _str(self, rc: List[bytes], value: str) -> None:
+        rc.append(bytes((TypeMarker.String,)))
+        self._write_string_value(rc, value)
+
+    def _xml(self, rc: List[bytes], value: Xml) -> None:
+        data: bytes = value.encode('utf-8')
+        rc.extend((bytes((TypeMarker.Xml,)), self._u29(len(data) << 1 | 1), data))
 
-class Type:
-    def __init__(self, data: bytes) -> None:
-        self._marker: TypeMarker = int(data[0])
-        {
-            TypeMarker.Integer: self._integer,
-            TypeMarker.Double: self._double
-        }.get(self._marker, self._no_information)(data[1:])
+    def _bytes(self, rc: List[bytes], value: bytes) -> None:
+        rc.extend((bytes((TypeMarker.ByteArray,)), self._u29(len(value) << 1 | 1), bytes(value)))
 
-    def _no_information(self, data: bytes):
-        pass
+    def _list(self, rc: List[bytes], value: list) -> None:
+        rc.extend((bytes((TypeMarker.Array,)), self._u29(len(value) << 1 | 1), b'\x01'))
+        for item in value:
+            self._write(rc, item)
 
-    def _integer(self, data: bytes):
-        self._value = int.from_bytes(data[:4], 'big')
+    def _dict(self, rc: List[bytes], value: dict) -> None:
+        """Writes dynamic object of the class name, if any, with no sealed members"""
+        rc.extend((bytes((TypeMarker.Object,)), b'\x0b'))  # inline dynamic traits, no sealed members
+        self._write_string_value(rc, getattr(value, 'class_name', ''))
+        for key, item in value.items():
+            self._write_string_value(rc, str(key))
+            self._write(rc, item)
+        rc.append(b'\x01')
 
-    def _double(self, data: bytes):
-        self._value = struct.unpack('d', data[:8])
+    _writers: Dict[type, Callable] = {
+        type(None): _none,
+        bool: _bool,
+        int: _int,
+        float: _float,
+        Date: _date,
+        str: _str,
+        Xml: _xml,
+        bytes: _bytes,
+        bytearray: _bytes,
+        list: _list,
+        tuple: _list,
+        dict: _dict,
+        Object: _dict,
+    }
@@ -17,6 +17,7 @@ class CommandStream:
 
 class Command:
     amf0_type_id = 20
+    amf3_type_id = 17
 
     @staticmethod
     def make(data: bytes, chunk_size: int) -> Optional[Command]:
@@ -28,6 +29,9 @@ class Command:
             'createStream': CreateStream,
             '_checkbw': CheckBandwidth,
             'publish': Publish,
+            'play': Play,
+            'FCUnpublish': FCUnpublish,
+            'deleteStream': DeleteStream,
         }.get(type_.value, lambda d, sz: None)(data, chunk_size)
 
     def __init__(self, chunk_size: int, data: bytes = None) -> None:
@@ -49,20 +53,14 @@ class Command:
         return self._type
 
     def from_bytes(self, data: bytes) -> None:
-        field: Amf0 = Amf0.make(data)
-        self._type = field.value
-        self._size = len(field)
-        field = Amf0.make(data[self._size:])
-        self._size += len(field)
-        self.transaction_id = field.value
-        field = Amf0.make(data[self._size:])
-        self._size += len(field)
+        self._size = 0
+        self._type = self._field(data).value
+        self.transaction_id = self._field(data).value
+        field: Amf0 = self._field(data)
         if field.marker == TypeMarker.Object:
             self._command_object = field.value
             if self._size < len(data):
-                field = Amf0.make(data[self._size:])
-                self._size += len(field)
-                self._optional_arguments = field.value
+                self._optional_arguments = self._field(data).value
 
     def to_bytes(self) -> bytes:
         bh: ChunkBasicHeader = ChunkBasicHeader(CommandStream.chunk_id, CommandStream.stream_id)
@@ -86,6 +84,11 @@ class Command:
             ret += self._optional_arguments.to_bytes()
         return header.to_bytes(bh) + self._bytes_to_chunk_size(ret + self._additional_fields)
 
+    def _field(self, data: bytes) -> Amf0:
+        """Returns the field that follows the ones read"""
+        field, self._size = Amf0.decode(memoryview(data), self._size)
+        return field
+
     def _bytes_to_chunk_size(self, data: bytes) -> bytes:
         if len(data) <= self._chunk_size:
             return data
@@ -117,8 +120,7 @@ class ReleaseStream(Command):
         super().__init__(chunk_size, data)
         if self._type != 'releaseStream':
             raise CommandMessageException(f'invalid type: {self._type}. Connect expected')
-        field: Amf0 = Amf0.make(data[self._size:])
-        self._size += len(field)
+        field: Amf0 = self._field(data)
         self._stream_name = field.value
 
     def __repr__(self):
@@ -130,8 +132,7 @@ class FCPublish(Command):
         super().__init__(chunk_size, data)
         if self._type != 'FCPublish':
             raise CommandMessageException(f'invalid type: {self._type}. Connect expected')
-        field: Amf0 = Amf0.make(data[self._size:])
-        self._size += len(field)
+        field: Amf0 = self._field(data)
         self._stream_name = field.value
 
     def __repr__(self):
@@ -163,11 +164,9 @@ class Publish(Command):
         super().__init__(chunk_size, data)
         if self._type != 'publish':
             raise CommandMessageException(f'invalid type: {self._type}. Connect expected')
-        field: Amf0 = Amf0.make(data[self._size:])
-        self._size += len(field)
+        field: Amf0 = self._field(data)
         self.publishing_name = field.value
-        field: Amf0 = Amf0.make(data[self._size:])
-        self._size += len(field)
+        field: Amf0 = self._field(data)
         self.publishing_type = field.value
 
     def __repr__(self):
@@ -175,6 +174,40 @@ class Publish(Command):
                f'(transaction={self.transaction_id}, name={self.publishing_name}, type={self.publishing_type})'
 
 
+class Play(Command):
+    def __init__(self, data: bytes, chunk_size: int) -> None:
+        super().__init__(chunk_size, data)
+        if self._type != 'play':
+            raise CommandMessageException(f'invalid type: {self._type}. play expected')
+        field: Amf0 = self._field(data)
+        self.stream_name = field.value
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(transaction={self.transaction_id}, name={self.stream_name})'
+
+
+class FCUnpublish(Command):
+    def __init__(self, data: bytes, chunk_size: int) -> None:
+        super().__init__(chunk_size, data)
+        if self._type != 'FCUnpublish':
+            raise CommandMessageException(f'invalid type: {self._type}. FCUnpublish expected')
+        field: Amf0 = self._field(data)
+        self._stream_name = field.value
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(transaction={self.transaction_id}, stream={str(self._stream_name)})'
+
+
+class DeleteStream(Command):
+    def __init__(self, data: bytes, chunk_size: int) -> None:
+        super().__init__(chunk_size, data)
+        if self._type != 'deleteStream':
+            raise CommandMessageException(f'invalid type: {self._type}. deleteStream expected')
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(transaction={self.transaction_id})'
+
+
 class ResultCommand(Command):
     def __init__(self, transaction_id: float, chunk_size: int, **kwargs) -> None:
         super().__init__(chunk_size)
@@ -168,14 +168,13 @@ class SetPeerBandwidth:
             self._window_size.to_bytes(4, byteorder='big') + self._limit_type.to_bytes(1, byteorder='big')
 
 
-UserControlEventType: IntEnum = IntEnum('UserControlEventType', ('StreamBegin',
-                                                                 'StreamEOF',
-                                                                 'StreamDry',
-                                                                 'SetBufferLength',
-                                                                 'StreamIsRecorded',
-                                                                 'PingRequest',
-                                                                 'PingResponse'),
-                                        start=0
+UserControlEventType: IntEnum = IntEnum('UserControlEventType', (('StreamBegin', 0),
+                                                                 ('StreamEOF', 1),
+                                                                 ('StreamDry', 2),
+                                                                 ('SetBufferLength', 3),
+                                                                 ('StreamIsRecorded', 4),
+                                                                 ('PingRequest', 6),
+                                                                 ('PingResponse', 7))
                                         )
 
 
@@ -191,9 +190,9 @@ class UserControlMessage:
 
     def from_bytes(self, data: bytes) -> UserControlMessage:
         self._event_type: UserControlEventType = int.from_bytes(data[:2], 'big')
-        self._event_data[0] = int.from_bytes(data[2:6], 'big')
+        self._event_data = [int.from_bytes(data[2:6], 'big'), 0]
         if self._event_type == UserControlEventType.SetBufferLength:
-            self._event_data[1] = int.from_bytes(data[2:6], 'big')
+            self._event_data[1] = int.from_bytes(data[6:10], 'big')
         return self
 
     @property
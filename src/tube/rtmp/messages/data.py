@@ -18,6 +18,7 @@ class DataMessageException(Exception):
 
 class Data:
     amf0_type_id = 18
+    amf3_type_id = 15
     audio_type_id = 8
     video_type_id = 9
 
@@ -75,7 +76,7 @@ class AVCDecoderConfigurationRecord:
             self.level_indication,\
             self.length_size,\
             number_of_sps = struct.unpack('=BBBBBB', data[:6])
-        self.length_size = self.length_size & 3 + 1
+        self.length_size = (self.length_size & 3) + 1
         self.sps: List[bytes] = [bytes() for _ in range(number_of_sps & 0x1f)]
         off: int = 6 + self._set_parameters(self.sps, data[6:])
         self.pps: List[bytes] = [bytes() for _ in range(int(data[off]))]
@@ -108,22 +109,25 @@ class AVCDecoderConfigurationRecord:
 
 
 class VideoData:
-    configuration: AVCDecoderConfigurationRecord = None
-
-    def __init__(self, data: bytes, timestamp: int, callback=lambda v, d: None) -> None:
+    """Video message of a stream. NAL units are split by the length size of the decoder configuration
+    of the stream, the one carried by the message if it is a sequence header"""
+    def __init__(self, data: bytes, timestamp: int, callback=lambda *_: None,
+                 configuration: Optional[AVCDecoderConfigurationRecord] = None) -> None:
+        self.configuration: Optional[AVCDecoderConfigurationRecord] = configuration
         if len(data) < 9:
             raise DataMessageException(f'message too short: {len(data)}')
         off: int = 0
         self._tag: VideoTag = VideoTag(data[off] >> 4, data[off] & 0x0f)
         if self._tag.codec_id == VideoCodecId.AVC:
-            self._avc_packet = AvcPacket(data[off+1], int.from_bytes(data[off+2:off+5], 'big'))
+            self._avc_packet = AvcPacket(data[off+1], int.from_bytes(data[off+2:off+5], 'big', signed=True))
             off += 5
         else:
             raise DataMessageException(f'type {self._tag.codec_id} not implemented')
+        self.payload: bytes = data[off:]
         if self._avc_packet.type == PacketType.SequenceHeader:
             self._on_sequence_header(data[off:], callback)
         elif self._avc_packet.type == PacketType.Payload:
-            if not self.__class__.configuration:
+            if not self.configuration:
                 raise DataMessageException('AVCDecoderConfigurationRecord has not been received')
             self._on_nalu(data[off:], timestamp, callback)
 
@@ -131,11 +135,19 @@ class VideoData:
     def type(self) -> PacketType:
         return self._avc_packet.type
 
+    @property
+    def keyframe(self) -> bool:
+        return self._tag.frame_type == 1
+
+    @property
+    def composition_time(self) -> int:
+        return self._avc_packet.composition_time
+
     def __repr__(self):
         return f'{self.__class__.__name__}(tag={self._tag} packet={self._avc_packet})'
 
     def _on_sequence_header(self, data: bytes, callback) -> None:
-        self.__class__.configuration = AVCDecoderConfigurationRecord(data)
+        self.configuration = AVCDecoderConfigurationRecord(data)
         callback(self._avc_packet.type, data)
 
     def _on_nalu(self, data: bytes, timestamp: int, callback):
@@ -145,8 +157,8 @@ class VideoData:
                 1: struct.unpack('B', data[off:off + 1])[0],
                 2: struct.unpack('>H', data[off:off + 2])[0],
                 4: struct.unpack('>I', data[off:off + 4])[0],
-            }.get(self.__class__.configuration.length_size)
-            off += self.__class__.configuration.length_size
+            }.get(self.configuration.length_size)
+            off += self.configuration.length_size
             callback(self._avc_packet.type, data[off:off + sz], timestamp)
             off += sz
 
@@ -187,11 +199,19 @@ AudioTag: namedtuple = namedtuple('AudioTag', 'format rate size type')
 
 
 class AudioData:
-    def __init__(self, data: bytes, callback) -> None:
+    def __init__(self, data: bytes, callback=lambda *_: None) -> None:
         self._tag: AudioTag = AudioTag(data[0] >> 4, (data[0] >> 2) & 3, (data[0] >> 1) & 1, data[0] & 1)
         self._packet_type: PacketType = data[1]
-        print(f'{self._tag} : {self._packet_type}')
+        self.payload: bytes = data[2:]
         callback(self._packet_type, data[2:])
 
+    @property
+    def type(self) -> PacketType:
+        return self._packet_type
+
+    @property
+    def format(self) -> SoundFormat:
+        return self._tag.format
+
     def __repr__(self):
         return f'{self.__class__.__name__}(tag={self._tag})'
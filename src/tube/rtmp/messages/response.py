@@ -0,0 +1,97 @@
+"""Server responses serialized once per process. Only transaction ids and stream names are put in per connection"""
+import struct
+from typing import Dict, List
+from .amf0 import Type as Amf0, Number, String, Object, Null
+from .command import Command, CommandStream
+from .control import SetChunkSize, WindowAcknowledgementSize, SetPeerBandwidth
+from .control import UserControlMessage, UserControlEventType
+from ..chunk import ChunkBasicHeader, ChunkMessageHeader
+
+_double: struct.Struct = struct.Struct('>d')
+_continuation: bytes = ChunkBasicHeader(3, CommandStream.stream_id).to_bytes()
+_object_end: bytes = Object().to_bytes()[1:]
+_stream_begin: bytes = UserControlMessage(UserControlEventType.StreamBegin, [1, 0]).to_bytes()
+
+
+def chunked(body: bytes, chunk_size: int = SetChunkSize().chunk_size) -> bytes:
+    """Returns command message of the body split into chunks of the server chunk size"""
+    header: ChunkMessageHeader = ChunkMessageHeader()
+    header.message_type_id = Command.amf0_type_id
+    header.message_length = len(body)
+    rc: List[bytes] = [header.to_bytes(ChunkBasicHeader(CommandStream.chunk_id, CommandStream.stream_id))]
+    for offset in range(0, len(body), chunk_size):
+        if offset:
+            rc.append(_continuation)
+        rc.append(body[offset:offset + chunk_size])
+    return b''.join(rc)
+
+
+def _body(name: str, object_: Dict[str, Amf0] = None, args: Dict[str, Amf0] = None, additional: bytes = b'') -> bytes:
+    return b''.join([String(name).to_bytes(),
+                     Number(0.).to_bytes(),
+                     Object(object_).to_bytes() if object_ else Null().to_bytes(),
+                     Object(args).to_bytes() if args else b'',
+                     additional])
+
+
+def _property(name: str) -> bytes:
+    return String(name).to_bytes()[1:]  # property names are strings with no type marker
+
+
+_description: bytes = _property('description')
+_details: bytes = _property('details')
+
+
+class CommandTemplate:
+    """Command message chunked once. The transaction id is written in place, it is in the first chunk"""
+    def __init__(self, name: str, object_: Dict[str, Amf0] = None, args: Dict[str, Amf0] = None,
+                 additional: bytes = b'', prefix: bytes = b'') -> None:
+        self._message: bytearray = bytearray(prefix + chunked(_body(name, object_, args, additional)))
+        self._offset: int = len(prefix) + 12 + len(String(name)) + 1  # past headers, name and number marker
+
+    def to_bytes(self, transaction_id: float = 0.) -> bytes:
+        _double.pack_into(self._message, self._offset, transaction_id)
+        return bytes(self._message)
+
+
+class StatusTemplate:
+    """onStatus message of a stream. The head of the body is serialized once, the stream name is put in"""
+    def __init__(self, code: str, description: str, prefix: bytes = b'') -> None:
+        head: bytes = _body('onStatus', args={'level': String('status'), 'code': String(code)})
+        self._head: bytes = head[:-3]  # with no object end, the name related properties follow
+        self._description: str = description
+        self._prefix: bytes = prefix
+
+    def to_bytes(self, stream_name: str) -> bytes:
+        """Returns the message of the stream, the description is formatted with its name"""
+        return b''.join([self._prefix,
+                         chunked(b''.join([self._head,
+                                           _description,
+                                           String(self._description.format(stream_name)).to_bytes(),
+                                           _details,
+                                           String(stream_name).to_bytes(),
+                                           _object_end]))])
+
+
+connect: CommandTemplate = CommandTemplate('_result',
+                                           object_={
+                                               'fmsVer': String('FMS/3,0,1,123'),
+                                               'capabilities': Number(31.)
+                                           },
+                                           args={
+                                               'level': String('status'),
+                                               'code': String('NetConnection.Connect.Success'),
+                                               'description': String('Connection succeeded.'),
+                                               'objectEncoding': Number(0.)
+                                           },
+                                           prefix=b''.join([WindowAcknowledgementSize().to_bytes(),
+                                                            SetPeerBandwidth().to_bytes(),
+                                                            UserControlMessage().to_bytes(),
+                                                            SetChunkSize().to_bytes()]))
+result: CommandTemplate = CommandTemplate('_result')
+create_stream: CommandTemplate = CommandTemplate('_result', additional=Number(1.).to_bytes())
+fc_publish: CommandTemplate = CommandTemplate('onFCPublish')
+fc_unpublish: CommandTemplate = CommandTemplate('onFCUnpublish')
+bandwidth_done: bytes = CommandTemplate('onBWDone', additional=Number(8192.).to_bytes()).to_bytes()
+publish: StatusTemplate = StatusTemplate('NetStream.Publish.Start', '{} is now published', prefix=_stream_begin)
+play: StatusTemplate = StatusTemplate('NetStream.Play.Start', '{} is now played', prefix=_stream_begin)
@@ -0,0 +1,153 @@
+"""Live streams published over RTMP and fanned out to players"""
+from typing import Dict, List
+from .chunk import ChunkBasicHeader, ChunkMessageHeader
+from .messages.control import UserControlMessage, UserControlEventType
+from .messages.data import Data
+
+
+class LiveStreamException(ValueError):
+    """Exception, raised on publishing errors"""
+    pass
+
+
+class LiveStream:
+    """Published stream played by any number of players. Every message is chunked once and
+    the same bytes are queued to all players. Metadata, sequence headers and messages since
+    the last key frame are kept, so that a new player starts on a key frame at once"""
+    chunk_size: int = 4096  # announced to players before media
+    message_stream_id: int = 1
+    chunk_stream_ids: dict = {Data.amf0_type_id: 5, Data.audio_type_id: 4, Data.video_type_id: 6}
+    gop_limit: int = 16 * 1024 * 1024  # bytes of the cached group of pictures
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.published: bool = False
+        self._players: list = []
+        self._metadata: bytes = b''
+        self._video_config: bytes = b''
+        self._audio_config: bytes = b''
+        self._gop: List[tuple] = []
+        self._gop_size: int = 0
+
+    def add_player(self, player) -> None:
+        """Starts the player with metadata, sequence headers and the cached group of pictures"""
+        for type_id, message in ((Data.amf0_type_id, self._metadata),
+                                 (Data.video_type_id, self._video_config),
+                                 (Data.audio_type_id, self._audio_config)):
+            if message:
+                player.send_message(message, True, type_id)
+        for message, keyframe, type_id in self._gop:
+            player.send_message(message, keyframe, type_id)
+        self._players.append(player)
+
+    def remove_player(self, player) -> None:
+        """Stops fanning out to the player"""
+        if player in self._players:
+            self._players.remove(player)
+
+    def on_metadata(self, payload: bytes) -> None:
+        """Takes in onMetaData message body"""
+        self._metadata = self._message(Data.amf0_type_id, 0, payload)
+        self._fan_out(self._metadata, True, Data.amf0_type_id)
+
+    def on_video(self, timestamp: int, payload: bytes, keyframe: bool, config: bool) -> None:
+        """Takes in video message body"""
+        message = self._message(Data.video_type_id, timestamp, payload)
+        if config:
+            self._video_config = message
+        else:
+            self._cache(message, keyframe, Data.video_type_id)
+        self._fan_out(message, keyframe or config, Data.video_type_id)
+
+    def on_audio(self, timestamp: int, payload: bytes, config: bool) -> None:
+        """Takes in audio message body"""
+        message = self._message(Data.audio_type_id, timestamp, payload)
+        if config:
+            self._audio_config = message
+        else:
+            self._cache(message, True, Data.audio_type_id)
+        self._fan_out(message, True, Data.audio_type_id)
+
+    def end(self) -> None:
+        """Tells players the stream is over and forgets cached messages of the publisher"""
+        self.published = False
+        self._metadata, self._video_config, self._audio_config = b'', b'', b''
+        self._gop, self._gop_size = [], 0
+        eof = UserControlMessage(UserControlEventType.StreamEOF, [self.message_stream_id, 0]).to_bytes()
+        for player in self._players:
+            player.send_message(eof, True, 0)
+
+    @property
+    def idle(self) -> bool:
+        """Verifies if the stream is neither published nor played"""
+        return not self.published and not self._players
+
+    def _cache(self, message: bytes, keyframe: bool, type_id: int) -> None:
+        if keyframe and type_id == Data.video_type_id:
+            self._gop, self._gop_size = [], 0
+        elif self._gop_size + len(message) > self.gop_limit:
+            return
+        self._gop.append((message, keyframe, type_id))
+        self._gop_size += len(message)
+
+    def _fan_out(self, message: bytes, keyframe: bool, type_id: int) -> None:
+        for player in self._players:
+            player.send_message(message, keyframe, type_id)
+
+    @classmethod
+    def _message(cls, type_id: int, timestamp: int, payload: bytes) -> bytes:
+        """Returns the message split into chunks of the player chunk size"""
+        chunk_stream_id = cls.chunk_stream_ids[type_id]
+        header: ChunkMessageHeader = ChunkMessageHeader()
+        header.message_type_id = type_id
+        header.message_length = len(payload)
+        header.message_stream_id = cls.message_stream_id
+        extended: bytes = b''
+        if timestamp >= 0xffffff:
+            extended = timestamp.to_bytes(4, 'big')
+            timestamp = 0xffffff
+        header.timestamp = timestamp
+        continuation: bytes = ChunkBasicHeader(3, chunk_stream_id).to_bytes() + extended
+        rc: List[bytes] = [header.to_bytes(ChunkBasicHeader(0, chunk_stream_id)), extended]
+        for offset in range(0, len(payload), cls.chunk_size):
+            if offset:
+                rc.append(continuation)
+            rc.append(payload[offset:offset + cls.chunk_size])
+        return b''.join(rc)
+
+
+_streams: Dict[str, LiveStream] = {}
+
+
+def publish(name: str) -> LiveStream:
+    """Returns the stream of the name to be published. Players waiting for it get it"""
+    stream = _streams.get(name)
+    if stream is None:
+        stream = _streams[name] = LiveStream(name)
+    elif stream.published:
+        raise LiveStreamException(f'{name} is already published')
+    stream.published = True
+    return stream
+
+
+def unpublish(stream: LiveStream) -> None:
+    """Ends publishing of the stream"""
+    stream.end()
+    if stream.idle:
+        _streams.pop(stream.name, None)
+
+
+def play(name: str, player) -> LiveStream:
+    """Adds the player to the stream of the name, published or not yet"""
+    stream = _streams.get(name)
+    if stream is None:
+        stream = _streams[name] = LiveStream(name)
+    stream.add_player(player)
+    return stream
+
+
+def stop(stream: LiveStream, player) -> None:
+    """Removes the player from the stream"""
+    stream.remove_player(player)
+    if stream.idle:
+        _streams.pop(stream.name, None)
@@ -0,0 +1,88 @@
+"""Shared cache of RTP payloads"""
+import os
+from collections import OrderedDict
+
+
+class PacketCache:
+    """Least recently used RTP payloads of samples of one title, bounded by size of samples in bytes"""
+    def __init__(self, limit: int):
+        self._entries = OrderedDict()
+        self._limit = limit
+        self.size = 0
+        self.hits, self.misses = 0, 0
+
+    def get(self, key):
+        """Returns cached payloads or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, payloads, size: int) -> None:
+        """Caches payloads, evicting least recently used ones beyond the limit"""
+        if size > self._limit:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous[1]
+        self._entries[key] = (payloads, size)
+        self.size += size
+        while self.size > self._limit:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drops least recently used payloads"""
+        _, (_, evicted_size) = self._entries.popitem(last=False)
+        self.size -= evicted_size
+
+
+class TitleCache(PacketCache):
+    """Packet cache of a title held by RTSP sessions playing it. Caches of all titles share the process limit,
+    least recently used titles give up their payloads first"""
+    process_limit: int = 256 * 1024 * 1024
+
+    def __init__(self, filename: str, mtime: float, limit: int, process_limit: int = 0):
+        super().__init__(limit)
+        self.filename = filename
+        self.mtime = mtime
+        self.holders = 0
+        self._process_limit = process_limit or TitleCache.process_limit
+
+    def put(self, key, payloads, size: int) -> None:
+        """Caches payloads, evicting ones of least recently used titles beyond the process limit"""
+        if _titles.get(self.filename) is self:  # not of a rewritten file
+            _titles.move_to_end(self.filename)
+        super().put(key, payloads, size)
+        total = sum(cache.size for cache in _titles.values())
+        for cache in _titles.values():
+            while total > self._process_limit and cache.size:
+                size = cache.size
+                cache.evict()
+                total -= size - cache.size
+
+
+_titles: 'OrderedDict[str, TitleCache]' = OrderedDict()
+
+
+def title_cache(filename: str, limit: int, process_limit: int = 0):
+    """Returns packet cache of the title shared by all sessions of the process, to be released by every session.
+    None if caching is off"""
+    if limit <= 0:
+        return None
+    mtime = os.path.getmtime(filename)
+    cache = _titles.get(filename)
+    if cache is None or cache.mtime != mtime:  # rewritten file gets a new cache
+        cache = _titles[filename] = TitleCache(filename, mtime, limit, process_limit)
+    _titles.move_to_end(filename)
+    cache.holders += 1
+    return cache
+
+
+def release(cache: TitleCache) -> None:
+    """Drops the cache of the title when no RTSP session holds it"""
+    cache.holders -= 1
+    if cache.holders <= 0 and _titles.get(cache.filename) is cache:
+        del _titles[cache.filename]
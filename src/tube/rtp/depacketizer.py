@@ -0,0 +1,264 @@
+"""RTP receiving side: payloads of a published stream put back together into access units"""
+import struct
+from typing import Callable, Optional
+
+_unit_length = struct.Struct('>I')
+
+
+class DepacketizerException(ValueError):
+    pass
+
+
+class RtpPacket:
+    """Fields of RTP header (rfc3550) and bounds of the payload within the packet"""
+    _format = struct.Struct('>BBHII')
+
+    def __init__(self, packet: memoryview) -> None:
+        if len(packet) < 12:
+            raise DepacketizerException(f'RTP packet too short: {len(packet)}')
+        first, second, self.sequence_number, self.timestamp, self.synchro_source = self._format.unpack_from(packet)
+        if first >> 6 != 2:
+            raise DepacketizerException(f'unsupported RTP version {first >> 6}')
+        self.marker: bool = bool(second & 0x80)
+        self.payload_type: int = second & 0x7f
+        self.start: int = 12 + (first & 0xf) * 4  # past CSRC list
+        self.end: int = len(packet) - (packet[-1] if first & 0x20 else 0)  # padding
+        if first & 0x10 and len(packet) >= self.start + 4:  # header extension
+            self.start += 4 + int.from_bytes(packet[self.start + 2:self.start + 4], 'big') * 4
+        if self.start > self.end:
+            raise DepacketizerException('RTP packet is shorter than its header')
+
+
+class Depacketizer:
+    """Puts access units together from payloads of RTP packets in place in a buffer reused for every unit,
+    so that data is copied once on the way from the network to the sink. Completed units are called back
+    with the RTP timestamp and a view of the buffer valid for the call only. A sequence number gap drops
+    the unit being put together"""
+    initial_size: int = 256 * 1024
+
+    def __init__(self, callback: Callable) -> None:
+        self._callback: Callable = callback
+        self._buffer: bytearray = bytearray(self.initial_size)
+        self._size: int = 0
+        self._timestamp: Optional[int] = None
+        self._sequence_number: Optional[int] = None
+        self.lost: int = 0  # packets missed
+        self.dropped: int = 0  # units dropped
+
+    def on_packet(self, packet: memoryview) -> None:
+        """Takes in RTP packet of the stream"""
+        header: RtpPacket = RtpPacket(packet)
+        if self._sequence_number is not None and header.sequence_number != (self._sequence_number + 1) & 0xffff:
+            self.lost += (header.sequence_number - self._sequence_number - 1) & 0xffff
+            self._drop()
+        self._sequence_number = header.sequence_number
+        if self._timestamp is not None and header.timestamp != self._timestamp:  # marker of the last unit is lost
+            self._complete()
+        self._timestamp = header.timestamp
+        if header.end > header.start:
+            self._on_payload(packet[header.start:header.end])
+        if header.marker:
+            self._complete()
+
+    def _on_payload(self, payload: memoryview) -> None:
+        pass
+
+    def _append(self, data) -> None:
+        end: int = self._size + len(data)
+        if end > len(self._buffer):
+            self._buffer.extend(bytes(max(end, 2 * len(self._buffer)) - len(self._buffer)))
+        self._buffer[self._size:end] = data
+        self._size = end
+
+    def _complete(self) -> None:
+        if self._size:
+            with memoryview(self._buffer) as view:
+                self._on_unit(self._timestamp, view[:self._size])
+        self._size = 0
+        self._timestamp = None
+
+    def _on_unit(self, timestamp: int, unit: memoryview) -> None:
+        self._callback(timestamp, unit)
+
+    def _drop(self) -> None:
+        if self._size:
+            self.dropped += 1
+        self._size = 0
+
+
+class VideoDepacketizer(Depacketizer):
+    """Puts NAL units of a picture together as length prefixed ones (4 bytes). Single NAL unit, aggregation
+    and fragmentation packets are taken in. Parameter sets are called back with on_parameter_set as they come"""
+    header_size: int = 1
+    aggregation_type: int = 0
+    fragmentation_type: int = 0
+
+    def __init__(self, callback: Callable, on_parameter_set: Callable = lambda *_: None) -> None:
+        super().__init__(callback)
+        self._on_parameter_set: Callable = on_parameter_set
+        self._fragment_start: int = -1  # offset of the length of the NAL unit being defragmented
+        self._keyframe: bool = False
+
+    def _on_payload(self, payload: memoryview) -> None:
+        if len(payload) <= self.header_size:
+            return
+        nal_type: int = self._type(payload[0])
+        if nal_type == self.aggregation_type:
+            self._on_aggregation(payload)
+        elif nal_type == self.fragmentation_type:
+            self._on_fragment(payload)
+        else:
+            self._on_nal_unit(payload)
+
+    def _on_aggregation(self, payload: memoryview) -> None:
+        offset, end = self.header_size, len(payload)
+        while offset + 2 <= end:
+            size: int = int.from_bytes(payload[offset:offset + 2], 'big')
+            offset += 2
+            if not size or offset + size > end:
+                break
+            self._on_nal_unit(payload[offset:offset + size])
+            offset += size
+
+    def _on_fragment(self, payload: memoryview) -> None:
+        fu_header: int = payload[self.header_size]
+        data: memoryview = payload[self.header_size + 1:]
+        if fu_header & 0x80:  # start
+            self._fragment_start = self._size
+            self._append(bytes(4))
+            self._append(self._fragmented_header(payload, fu_header & 0x3f))
+        if self._fragment_start < 0:  # start is lost
+            return
+        self._append(data)
+        if fu_header & 0x40:  # end
+            start, self._fragment_start = self._fragment_start, -1
+            _unit_length.pack_into(self._buffer, start, self._size - start - 4)
+            with memoryview(self._buffer) as view:
+                self._on_type(self._type(view[start + 4]), view[start + 4:self._size])
+
+    def _on_nal_unit(self, nal: memoryview) -> None:
+        self._append(_unit_length.pack(len(nal)))
+        self._append(nal)
+        self._on_type(self._type(nal[0]), nal)
+
+    def _on_type(self, nal_type: int, nal: memoryview) -> None:
+        if self._keyframe_type(nal_type):
+            self._keyframe = True
+        elif self._parameter_set_type(nal_type):
+            self._on_parameter_set(nal_type, bytes(nal))
+
+    def _on_unit(self, timestamp: int, unit: memoryview) -> None:
+        self._fragment_start = -1
+        keyframe, self._keyframe = self._keyframe, False
+        self._callback(timestamp, keyframe, unit)
+
+    def _drop(self) -> None:
+        super()._drop()
+        self._fragment_start = -1
+        self._keyframe = False
+
+    @staticmethod
+    def _type(first: int) -> int:
+        return first & 0x1f
+
+    @staticmethod
+    def _fragmented_header(payload: memoryview, nal_type: int) -> bytes:
+        return b''
+
+    @staticmethod
+    def _keyframe_type(nal_type: int) -> bool:
+        return False
+
+    @staticmethod
+    def _parameter_set_type(nal_type: int) -> bool:
+        return False
+
+
+class AvcDepacketizer(VideoDepacketizer):
+    """H.264 payload (rfc6184): single NAL unit, STAP-A and FU-A packets"""
+    aggregation_type: int = 24
+    fragmentation_type: int = 28
+
+    @staticmethod
+    def _fragmented_header(payload: memoryview, nal_type: int) -> bytes:
+        return bytes([(payload[0] & 0xe0) | (nal_type & 0x1f)])
+
+    @staticmethod
+    def _keyframe_type(nal_type: int) -> bool:
+        return nal_type == 5
+
+    @staticmethod
+    def _parameter_set_type(nal_type: int) -> bool:
+        return nal_type in (7, 8)
+
+
+class HevcDepacketizer(VideoDepacketizer):
+    """H.265 payload (rfc7798): single NAL unit, AP and FU packets. DONL fields are not expected"""
+    header_size: int = 2
+    aggregation_type: int = 48
+    fragmentation_type: int = 49
+
+    @staticmethod
+    def _type(first: int) -> int:
+        return (first >> 1) & 0x3f
+
+    @staticmethod
+    def _fragmented_header(payload: memoryview, nal_type: int) -> bytes:
+        return bytes([(payload[0] & 0x81) | (nal_type << 1), payload[1]])
+
+    @staticmethod
+    def _keyframe_type(nal_type: int) -> bool:
+        return 16 <= nal_type <= 21  # IRAP picture
+
+    @staticmethod
+    def _parameter_set_type(nal_type: int) -> bool:
+        return nal_type in (32, 33, 34)
+
+
+class AacDepacketizer(Depacketizer):
+    """MPEG-4 AAC payload (rfc3640): AU headers section followed by access units, a unit too big for one packet
+    is fragmented over packets up to the marker. Every unit is called back with the timestamp of its own"""
+    frame_length: int = 1024
+
+    def __init__(self, callback: Callable, size_length: int = 13, index_length: int = 3,
+                 index_delta_length: int = 3) -> None:
+        super().__init__(callback)
+        self._size_length: int = size_length
+        self._index_length: int = index_length
+        self._index_delta_length: int = index_delta_length
+        self._fragment_size: int = 0  # of the unit fragmented over packets
+
+    def _on_payload(self, payload: memoryview) -> None:
+        if len(payload) < 2:
+            return
+        headers_length: int = int.from_bytes(payload[:2], 'big')  # in bits
+        offset: int = 2 + (headers_length + 7) // 8
+        if offset > len(payload) or not self._size_length:
+            return
+        headers: int = int.from_bytes(payload[2:offset], 'big')
+        position: int = (offset - 2) * 8  # bits below the AU header to read
+        index_length: int = self._index_length
+        sizes: list = []
+        while headers_length >= self._size_length + index_length:
+            position -= self._size_length
+            sizes.append((headers >> position) & ((1 << self._size_length) - 1))
+            position -= index_length
+            headers_length -= self._size_length + index_length
+            index_length = self._index_delta_length
+        if len(sizes) == 1 and (self._size or offset + sizes[0] > len(payload)):  # fragment of the unit
+            if not self._size:
+                self._fragment_size = sizes[0]
+            self._append(payload[offset:])
+            return
+        for number, size in enumerate(sizes):
+            if offset + size > len(payload):
+                break
+            self._callback((self._timestamp + number * self.frame_length) & 0xffffffff, payload[offset:offset + size])
+            offset += size
+
+    def _on_unit(self, timestamp: int, unit: memoryview) -> None:
+        if len(unit) == self._fragment_size:
+            self._callback(timestamp, unit)
+        else:
+            self.dropped += 1
+        self._fragment_size = 0
@@ -0,0 +1,149 @@
+"""Precomputed RTP packetization of samples, kept the way an MP4 hint track describes packets"""
+import logging
+import os
+import struct
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class PacketizationPlan:
+    """Packet descriptors of samples of one title. Sample plan is a list of
+    (chunk offset, chunk size, chunk info, [(marker, payload header, start, end)]), offsets are relative to the sample.
+    Samples are planned per RTP payload size and kept packed as they are in the plan file, least recently used ones
+    beyond the limit in bytes are dropped. Is filled on first play and, if persistent, saved next to the title
+    once no session plays it"""
+    _magic = b'RTP2'
+    _file_header = struct.Struct('>4sQQI')  # magic, title size, title mtime in ns, number of samples
+    _sample_header = struct.Struct('>IQHH')  # track id, sample offset, payload size, number of chunks
+    _chunk_header = struct.Struct('>IIiH')  # offset, size, info, number of packets
+    _packet_header = struct.Struct('>BBII')  # marker, payload header size, start, end
+    limit: int = 16 * 1024 * 1024
+
+    def __init__(self, filename: str, persistent: bool = False, limit: int = 0):
+        self._filename = filename
+        self.mtime = os.path.getmtime(filename)
+        self.holders = 0  # sessions playing the title
+        self._persistent = persistent
+        self._limit = limit or PacketizationPlan.limit
+        self._samples: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self.size = 0
+        self._modified = False
+        if persistent and os.path.isfile(self.path):
+            try:
+                self._load()
+            except (OSError, ValueError, struct.error) as error:
+                logging.warning(f'{self.path}: {error}')
+                self._samples, self.size = OrderedDict(), 0
+
+    @property
+    def filename(self) -> str:
+        """Returns file name of the title"""
+        return self._filename
+
+    @property
+    def path(self) -> str:
+        """Returns plan file name"""
+        return self._filename + '.rtp'
+
+    def get(self, track_id, offset, payload_size):
+        """Returns plan of the sample or None"""
+        record = self._samples.get((track_id, offset, payload_size))
+        if record is None:
+            return None
+        self._samples.move_to_end((track_id, offset, payload_size))
+        chunks = self._sample_header.unpack_from(record, 0)[3]
+        position = self._sample_header.size
+        units = []
+        for _ in range(chunks):
+            chunk_offset, chunk_size, info, packet_count = self._chunk_header.unpack_from(record, position)
+            position += self._chunk_header.size
+            packets = []
+            for _ in range(packet_count):
+                marker, header_size, start, end = self._packet_header.unpack_from(record, position)
+                position += self._packet_header.size
+                packets.append((marker, record[position:position + header_size], start, end))
+                position += header_size
+            units.append((chunk_offset, chunk_size, info, packets))
+        return units
+
+    def put(self, track_id, offset, payload_size, units) -> None:
+        """Stores plan of the sample"""
+        rc = [self._sample_header.pack(track_id, offset, payload_size, len(units))]
+        for chunk_offset, size, info, packets in units:
+            rc.append(self._chunk_header.pack(chunk_offset, size, info, len(packets)))
+            for marker, header, start, end in packets:
+                rc.append(self._packet_header.pack(marker, len(header), start, end))
+                rc.append(header)
+        self._store((track_id, offset, payload_size), b''.join(rc))
+        self._modified = True
+
+    def save(self) -> None:
+        """Writes plan of the title if anything was added. The file is replaced at once, never written in place"""
+        if not self._persistent or not self._modified:
+            return
+        stat = os.stat(self._filename)
+        if stat.st_mtime != self.mtime:  # the title has been rewritten since
+            return
+        header = self._file_header.pack(self._magic, stat.st_size, stat.st_mtime_ns, len(self._samples))
+        with open(self.path + '.tmp', 'wb') as file:
+            file.write(header + b''.join(self._samples.values()))
+        os.replace(self.path + '.tmp', self.path)
+        self._modified = False
+
+    def _store(self, key: tuple, record: bytes) -> None:
+        previous = self._samples.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._samples[key] = record
+        self.size += len(record)
+        while self.size > self._limit:
+            _, evicted = self._samples.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _load(self):
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        magic, size, mtime, count = self._file_header.unpack_from(data, 0)
+        stat = os.stat(self._filename)
+        if magic != self._magic or size != stat.st_size or mtime != stat.st_mtime_ns:
+            raise ValueError('outdated packetization plan')
+        position = self._file_header.size
+        for _ in range(count):
+            start = position
+            track_id, offset, payload_size, chunks = self._sample_header.unpack_from(data, position)
+            position += self._sample_header.size
+            for _ in range(chunks):
+                packet_count = self._chunk_header.unpack_from(data, position)[3]
+                position += self._chunk_header.size
+                for _ in range(packet_count):
+                    position += self._packet_header.size + self._packet_header.unpack_from(data, position)[1]
+            if position > len(data):
+                raise ValueError('truncated packetization plan')
+            self._store((track_id, offset, payload_size), data[start:position])
+
+
+_titles: Dict[str, PacketizationPlan] = {}
+
+
+def title_plan(filename: str, persistent: bool) -> PacketizationPlan:
+    """Returns packetization plan of the title shared by all sessions of the process, to be released by every
+    session"""
+    plan = _titles.get(filename)
+    if plan is None or plan.mtime != os.path.getmtime(filename):  # rewritten file gets a new plan
+        plan = _titles[filename] = PacketizationPlan(filename, persistent)
+    plan.holders += 1
+    return plan
+
+
+def release(plan: Optional[PacketizationPlan]) -> None:
+    """Drops the plan of the title when no RTSP session holds it, a persistent one is saved to its file first"""
+    if plan is None:
+        return
+    plan.holders -= 1
+    if plan.holders <= 0:
+        try:
+            plan.save()
+        except OSError as error:
+            logging.warning(f'{plan.path}: {error}')
+        if _titles.get(plan.filename) is plan:
+            del _titles[plan.filename]
@@ -0,0 +1,112 @@
+"""RTCP sender and receiver reports: rfc3550"""
+import socket
+import struct
+import time
+from typing import List
+
+NTP_EPOCH_OFFSET = 2208988800  # seconds from 1900 to 1970
+
+
+def ntp_time(now: float) -> int:
+    """Returns 64-bit NTP timestamp of the wallclock time"""
+    return int((now + NTP_EPOCH_OFFSET) * (1 << 32)) & 0xffffffffffffffff
+
+
+class PacketType:  # pylint: disable=too-few-public-methods
+    """RTCP packet types"""
+    SR = 200
+    RR = 201
+    SDES = 202
+
+
+class SenderReport:
+    """Compound RTCP packet: sender report without report blocks followed by SDES with CNAME"""
+    _report = struct.Struct('>BBHIQIII')
+    _cname = socket.gethostname().encode()[:255]
+
+    def __init__(self, synchro_source, now, rtp_timestamp, packet_count, octet_count):
+        self.synchro_source = synchro_source
+        self.ntp_timestamp = ntp_time(now)
+        self.rtp_timestamp = rtp_timestamp & 0xffffffff
+        self.packet_count = packet_count & 0xffffffff
+        self.octet_count = octet_count & 0xffffffff
+
+    def to_bytes(self):
+        """Returns the report as bytestream, ready to be sent to socket"""
+        report = self._report.pack(0x80, PacketType.SR, 6,
+                                   self.synchro_source,
+                                   self.ntp_timestamp,
+                                   self.rtp_timestamp,
+                                   self.packet_count,
+                                   self.octet_count)
+        item = bytes([1, len(self._cname)]) + self._cname
+        item += bytes(4 - (len(item) + 4) % 4)  # null terminated and padded to 32-bit boundary
+        sdes = struct.pack('>BBHI', 0x81, PacketType.SDES, (len(item) + 4) // 4, self.synchro_source) + item
+        return report + sdes
+
+
+class ReportBlock:
+    """Reception report block of a sender or receiver report"""
+    _format = struct.Struct('>IIIIII')
+
+    def __init__(self, data, offset):
+        self.synchro_source, lost, self.highest_sequence_number, self.jitter, \
+            self.last_sender_report, self.delay_since_last_sender_report = self._format.unpack_from(data, offset)
+        self.fraction_lost = (lost >> 24) / 256.
+        self.cumulative_lost = lost & 0xffffff
+        if self.cumulative_lost & 0x800000:  # signed 24-bit
+            self.cumulative_lost -= 0x1000000
+
+    def round_trip_time(self, now):
+        """Returns round trip time in seconds or None if the receiver has not got any sender report yet"""
+        if not self.last_sender_report:
+            return None
+        arrival = (ntp_time(now) >> 16) & 0xffffffff
+        return ((arrival - self.last_sender_report - self.delay_since_last_sender_report) & 0xffffffff) / 65536.
+
+
+def report_blocks(data) -> List[ReportBlock]:
+    """Returns report blocks of all SR and RR packets of a compound RTCP packet"""
+    rc: List[ReportBlock] = []
+    offset = 0
+    while offset + 4 <= len(data):
+        count, packet_type = data[offset] & 0x1f, data[offset + 1]
+        length = (int.from_bytes(data[offset + 2:offset + 4], 'big') + 1) * 4
+        if data[offset] >> 6 != 2 or offset + length > len(data):
+            break
+        blocks = offset + 8
+        if packet_type == PacketType.SR:
+            blocks += 20
+        if packet_type in (PacketType.SR, PacketType.RR):
+            for i in range(count):
+                if blocks + 24 * (i + 1) > offset + length:
+                    break
+                rc.append(ReportBlock(data, blocks + 24 * i))
+        offset += length
+    return rc
+
+
+class ReceptionStatistics:
+    """Loss, jitter and round trip time of a stream as reported by the client"""
+    def __init__(self, clock_rate=90000):
+        self.clock_rate = clock_rate
+        self.fraction_lost = 0.
+        self.cumulative_lost = 0
+        self.jitter_sec = 0.
+        self.round_trip_time_sec = None
+        self.reports = 0
+
+    def update(self, block: ReportBlock, now=None):
+        """Takes in a report block about the stream"""
+        self.reports += 1
+        self.fraction_lost = block.fraction_lost
+        self.cumulative_lost = block.cumulative_lost
+        self.jitter_sec = block.jitter / self.clock_rate
+        rtt = block.round_trip_time(time.time() if now is None else now)
+        if rtt is not None:
+            self.round_trip_time_sec = rtt
+
+    def __str__(self):
+        rtt = f'{self.round_trip_time_sec * 1000:.1f}ms' if self.round_trip_time_sec is not None else '-'
+        return f'loss:{self.fraction_lost * 100:.1f}% lost:{self.cumulative_lost} ' \
+               f'jitter:{self.jitter_sec * 1000:.1f}ms rtt:{rtt}'
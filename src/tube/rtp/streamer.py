@@ -2,8 +2,10 @@
 import abc
 import time
 import random
+import struct
 import logging
 from ..bitreader import Reader as BitReader
+from .rtcp import SenderReport, ReceptionStatistics
 
 
 class AUHeaderSimpleSection:
@@ -20,48 +22,95 @@ class AUHeaderSimpleSection:
         return self._value >> 3
 
 
-class InterleavedHeader:
-    """RTP (+interleaved) header: rfc7826"""
-    _first_byte = bytes([0x80])
+class RtpHeader:
+    """RTP header: rfc3550"""
+    _format = struct.Struct('>BBHII')
+    size = 12
+    blocksize = 1472  # fits ethernet MTU without IP fragmentation
+    max_blocksize = 65507
 
-    def __init__(self, payload_type, channel, synchro_source):
+    def __init__(self, payload_type, synchro_source):
         self._sequence_number = 0
         self._payload_type = payload_type
-        self._interleaved_sign = bytes([0x24, channel])
-        self._synchro_source = synchro_source.to_bytes(4, 'big')
+        self._synchro_source = synchro_source
 
     @property
     def sequence_number(self):
         """Returns sequence number of a frame"""
         return self._sequence_number
 
+    @property
+    def synchro_source(self):
+        """Returns synchronization source identifier"""
+        return self._synchro_source
+
+    def control_prefix(self, size):
+        """Returns prefix of RTCP packet of the stream"""
+        return b''
+
+    def to_bytes(self, marker, timestamp, data_size):
+        """Returns the header as bytestream, ready to be sent to socket"""
+        ret = self._format.pack(0x80,
+                                marker << 7 | self._payload_type,
+                                self._sequence_number,
+                                timestamp & 0xffffffff,
+                                self._synchro_source)
+        self._sequence_number = (self._sequence_number + 1) & 0xffff
+        return ret
+
+
+class InterleavedHeader(RtpHeader):
+    """RTP (+interleaved) header: rfc7826"""
+    _format = struct.Struct('>BBHBBHII')
+    blocksize = 1486
+    max_blocksize = 65535
+
+    def __init__(self, payload_type, channel, synchro_source):
+        super().__init__(payload_type, synchro_source)
+        self._channel = channel
+
+    def control_prefix(self, size):
+        """Returns interleaved prefix of RTCP packet, sent on the channel next to RTP one"""
+        return bytes([0x24, self._channel + 1]) + size.to_bytes(2, 'big')
+
     def to_bytes(self, marker, timestamp, data_size):
         """Returns the header as bytestream, ready to be sent to socket.
            Data size includes media data + 12 bytes of rtp header"""
-        ret = self._interleaved_sign + \
-            (data_size+12).to_bytes(2, 'big') +\
-            self.__class__._first_byte + \
-            (marker << 7 | self._payload_type).to_bytes(1, 'big') + \
-            self._sequence_number.to_bytes(2, 'big') + \
-            timestamp.to_bytes(4, 'big') + \
-            self._synchro_source
-        self._sequence_number = (self._sequence_number + 1) % 0xffff
+        ret = self._format.pack(0x24,
+                                self._channel,
+                                data_size + 12,
+                                0x80,
+                                marker << 7 | self._payload_type,
+                                self._sequence_number,
+                                timestamp & 0xffffffff,
+                                self._synchro_source)
+        self._sequence_number = (self._sequence_number + 1) & 0xffff
         return ret
 
 
 class FragmentMaker:  # pylint: disable=too-few-public-methods
-    """Fragments data on Fragmented Units"""
+    """Fragments data on Fragmented Units. Yields (marker, data unit parts) without copying the sample"""
     def __init__(self, sample, offset, chunk_size=1472):
         self._sample = sample
         self._offset = offset
         self._chunk_size = chunk_size
 
     def __next__(self):
+        marker, header, start, end = self.next_descriptor()
+        data = memoryview(self._sample)[start:end]
+        return marker, (header, data) if header else (data,)
+
+    def __iter__(self):
+        return self
+
+    def next_descriptor(self):
+        """Returns next packet as (marker, FU header, start, end), start and end index the sample.
+           FU header is empty if the sample fits one packet"""
         if self._offset >= len(self._sample):
             raise StopIteration
         if len(self._sample) <= self._chunk_size:
             self._offset = len(self._sample)
-            return 1, self._sample
+            return 1, b'', 0, len(self._sample)
         next_size = self._chunk_size
         marker = 0
         if self._offset + next_size >= len(self._sample):
@@ -71,10 +120,16 @@ class FragmentMaker:  # pylint: disable=too-few-public-methods
         elif self._offset > 2:
             self._set_next()
         self._offset += next_size
-        return marker, self._to_bytes() + self._sample[self._offset-next_size:self._offset]
-
-    def __iter__(self):
-        return self
+        return marker, self._to_bytes(), self._offset - next_size, self._offset
+
+    def descriptors(self):
+        """Returns descriptors of all packets of the sample"""
+        ret = []
+        try:
+            while True:
+                ret.append(self.next_descriptor())
+        except StopIteration:
+            return ret
 
     @abc.abstractmethod
     def _set_next(self):
@@ -164,43 +219,103 @@ class TrickPlay:
 
 class Streamer:
     """Streams media data in RTP interleaved protocol"""
-    def __init__(self, payload_type, trick_play=TrickPlay()):
+    def __init__(self, payload_type, trick_play=None):
+        self.packet_cache = None
+        self.packetization_plan = None
         self._last_frame_time_sec, self._frame_duration_sec = 0., 0.
         self._position = 0.
         self._rtp_header = None
         self._decoding_time = random.randint(0, 0xffffffff)
+        self._timestamp_origin = self._decoding_time
         self._payload_type = payload_type
-        self.trick_play = trick_play
+        self.trick_play = trick_play or TrickPlay()
+        self.keyframe = True
+        self.packet_count, self.octet_count = 0, 0
+        self.reception = ReceptionStatistics()
+        self.loss_threshold = 0.
+        self._dropping_non_reference = False
+        self._clock_rate = 90000
+        self._last_rtp_timestamp = self._decoding_time
+        self._last_report_time = 0.
+        self._payload_size = RtpHeader.blocksize - RtpHeader.size
+        self._sync_reference, self._sync_distance = None, 0  # last sync sample sent in trick play
 
     def prev_frame(self, reader, track_id, start_time, verbal):
-        """Reads and returns previous frame from mp4 file"""
+        """Reads and returns previous frame from mp4 file as a list of RTP packets"""
         if self._rtp_header is None or self._position <= start_time:
-            return b''
+            return []
         return self._frame(reader, track_id, verbal)
 
     def next_frame(self, reader, track_id, end_time, verbal):
-        """Reads and returns next frame from mp4 file"""
+        """Reads and returns next frame from mp4 file as a list of RTP packets"""
         if not self._rtp_header or self._position >= end_time:
-            return b''
+            return []
         return self._frame(reader, track_id, verbal)
 
-    def to_bytes(self, marker, chunk, composition_time, verbal):
-        """Returns chunk as bytestream, ready to be sent to socket"""
-        ret = self._rtp_header.to_bytes(marker,
-                                        composition_time,
-                                        len(chunk)) + \
-            chunk
+    @property
+    def next_frame_time(self):
+        """Returns wallclock time (as time.time()) when the next frame is due"""
+        return self._last_frame_time_sec + self._frame_duration_sec / self.trick_play.scale
+
+    def to_packet(self, marker, parts, composition_time, verbal):
+        """Returns RTP packet as a tuple of buffers (header first), ready to be sent to socket.
+           Parts are not concatenated to avoid copying of payload"""
+        size = sum(len(part) for part in parts)
+        ret = (self._rtp_header.to_bytes(marker, composition_time, size),) + tuple(parts)
+        self.packet_count += 1
+        self.octet_count += size
         if verbal:
-            print(' '.join(map(lambda x, p=ret: '{:02x}'.format(p[x]), range(19))) +
-                  ' of ' + str(len(ret)))
+            data = b''.join(ret)
+            print(' '.join(map(lambda x, p=data: '{:02x}'.format(p[x]), range(19))) +
+                  ' of ' + str(len(data)))
         return ret
 
-    def set_transport(self, transport):
-        """Sets streamer stream transport"""
-        self._rtp_header = \
-            InterleavedHeader(self._payload_type,
-                              int(transport.split('interleaved=')[-1].split('-')[0]),
-                              random.randint(0, 0xffffffff))
+    def set_transport(self, transport, blocksize=0):
+        """Sets streamer stream transport: interleaved into RTSP connection or plain RTP over UDP.
+           Blocksize is the RTP packet size limit, transport default if 0. Returns the limit applied"""
+        if 'interleaved=' in transport:
+            self._rtp_header = \
+                InterleavedHeader(self._payload_type,
+                                  int(transport.split('interleaved=')[-1].split('-')[0]),
+                                  random.randint(0, 0xffffffff))
+        else:
+            self._rtp_header = RtpHeader(self._payload_type, random.randint(0, 0xffffffff))
+        blocksize = min(max(blocksize or self._rtp_header.blocksize, 256), self._rtp_header.max_blocksize)
+        self._payload_size = blocksize - RtpHeader.size
+        return blocksize
+
+    def report_due(self, now, interval=5.):
+        """Verifies if it is time to send RTCP sender report"""
+        return self._rtp_header is not None and self.packet_count > 0 and now - self._last_report_time >= interval
+
+    def sender_report(self, now):
+        """Returns RTCP sender report mapping wallclock time to RTP timestamp of the stream"""
+        self._last_report_time = now
+        rtp_timestamp = self._last_rtp_timestamp + int((now - self._last_frame_time_sec) * self._clock_rate)
+        report = SenderReport(self._rtp_header.synchro_source,
+                              now,
+                              rtp_timestamp,
+                              self.packet_count,
+                              self.octet_count).to_bytes()
+        return self._rtp_header.control_prefix(len(report)) + report
+
+    @property
+    def synchro_source(self):
+        """Returns synchronization source identifier of the stream or None if transport is not set"""
+        return self._rtp_header.synchro_source if self._rtp_header is not None else None
+
+    def on_report(self, block, now):
+        """Takes in client reception report. Starts dropping non-reference frames while loss exceeds the threshold"""
+        self.reception.update(block, now)
+        if self.loss_threshold > 0.:
+            if block.fraction_lost > self.loss_threshold:
+                self._dropping_non_reference = True
+            elif block.fraction_lost < self.loss_threshold / 2:
+                self._dropping_non_reference = False
+
+    def reset_transport(self):
+        """Stops streaming until transport is set again"""
+        self._rtp_header = None
 
     def is_nth_frame_in_group(self, group_size):
         """Returns frame number in a group of frames"""
@@ -217,22 +332,110 @@ class Streamer:
     def position(self, value):
         """Sets current position as duration of all written frames"""
         self._position = value
+        self._sync_reference = None
+
+    @abc.abstractmethod
+    def _frame_to_packets(self, reader, payloads, composition_time, verbal) -> list:
+        """Returns media sample payloads as a list of RTP packets, ready to be sent to socket"""
+        return []
 
     @abc.abstractmethod
-    def _frame_to_bytes(self, reader, sample, composition_time, verbal) -> bytes:
-        """Returns media sample as bytestream, ready to be sent to socket"""
+    def _descriptors(self, chunk) -> list:
+        """Returns packets of media sample chunk as a list of (marker, payload header, start, end)"""
+        return []
+
+    def _aggregation_header(self, units) -> bytes:
+        """Returns payload header of a packet aggregating NAL units, empty if the payload format has none"""
         return b''
 
+    def _reference(self, payloads) -> bool:
+        """Verifies if other frames may refer to the frame"""
+        return True
+
+    def _chunk_info(self, chunk) -> int:
+        """Returns codec specific information of the chunk needed while streaming"""
+        return -1
+
+    def _payloads(self, reader, track_id, sample):
+        """Returns sample as a list of (chunk, fragments, chunk info), fragment is (marker, payload parts).
+           Fragments carry no RTP header, so sessions playing the same file share them through the packet cache"""
+        key = (sample.offset, self._payload_size)
+        ret = self.packet_cache.get(key) if self.packet_cache is not None else None
+        if ret is None:
+            data = reader.sample(sample.offset, sample.size)
+            plan = self.packetization_plan
+            units = plan.get(track_id, sample.offset, self._payload_size) if plan is not None else None
+            if units is None:
+                units = self._plan(data, reader.samples_info[track_id].unit_size_bytes)
+                if plan is not None:
+                    plan.put(track_id, sample.offset, self._payload_size, units)
+            view = memoryview(data)
+            ret = [(view[offset:offset + size],
+                    [(marker, (header, view[start:end]) if header else (view[start:end],))
+                     for marker, header, start, end in packets],
+                    info) for offset, size, info, packets in units]
+            if self.packet_cache is not None:
+                self.packet_cache.put(key, ret, sample.size)
+        return ret
+
+    def _plan(self, data, unit_size_bytes):
+        """Returns packetization plan of sample data: (chunk offset, chunk size, chunk info, packet descriptors)"""
+        ret = []
+        offset = 0
+        while offset < len(data):
+            size = len(data)
+            if unit_size_bytes:
+                size = int.from_bytes(data[offset:offset + unit_size_bytes], 'big')
+                offset += unit_size_bytes
+            chunk = data[offset:offset + size]
+            ret.append((offset,
+                        size,
+                        self._chunk_info(chunk),
+                        [(marker, header, offset + start, offset + end)
+                         for marker, header, start, end in self._descriptors(chunk)]))
+            offset += size
+        return ret
+
+    def _to_packets(self, units, composition_time, verbal):
+        """Returns payload parts of NAL units as RTP packets of a video frame, only the last one is marked.
+           Single NAL units in a row go in one aggregation packet as long as they fit the payload size"""
+        header_size = len(self._aggregation_header(())) + 2
+        groups: list = []  # [aggregatable, NAL units or payload parts, payload size]
+        for parts in units:
+            if len(parts) == 1 and header_size > 2:
+                size = len(parts[0]) + 2
+                if groups and groups[-1][0] and groups[-1][2] + size <= self._payload_size:
+                    groups[-1][1].append(parts[0])
+                    groups[-1][2] += size
+                    continue
+                if header_size + size - 2 <= self._payload_size:
+                    groups.append([True, [parts[0]], header_size + size - 2])
+                    continue
+            groups.append([False, parts, 0])
+        ret = []
+        for index, (aggregatable, parts, _) in enumerate(groups):
+            if aggregatable and len(parts) > 1:
+                parts = [self._aggregation_header(parts)] + \
+                    [part for nal in parts for part in (len(nal).to_bytes(2, 'big'), nal)]
+            ret.append(self.to_packet(int(index == len(groups) - 1), parts, composition_time, verbal))
+        return ret
+
     def _frame(self, reader, track_id, verbal):
-        ret = b''
+        ret = []
         if self.trick_play.active and not self.trick_play.applicable:
             return ret
         current_time = time.time()
-        if current_time - self._last_frame_time_sec >= \
-                self._frame_duration_sec / self.trick_play.scale:
+        if reader.live or current_time - self._last_frame_time_sec >= \
+                self._frame_duration_sec / self.trick_play.scale:  # live frames go as they come
             timescale = reader.media_header[track_id].timescale
             timescale_multiplier = reader.samples_info[track_id].timescale_multiplier
-            sample = reader.next_sample(track_id, self.trick_play.forward)
+            if self.trick_play.active:
+                sample = self._sync_sample(reader, track_id)
+            else:
+                self._sync_reference = None
+                sample = reader.next_sample(track_id, self.trick_play.forward, read=False)
+            if sample is None:  # not ingested yet
+                return ret
             if verbal:
                 logging.info(str(sample))
             if self.trick_play.forward:
@@ -240,17 +443,41 @@ class Streamer:
             else:
                 self._position -= self._frame_duration_sec
             self._frame_duration_sec = sample.duration / timescale
+            self._clock_rate = timescale * timescale_multiplier
+            if sample.decoding_time is not None:  # frames dropped by a live source leave a gap in time
+                self._decoding_time = self._timestamp_origin + sample.decoding_time * timescale_multiplier
+            self._last_rtp_timestamp = self._decoding_time
+            self.reception.clock_rate = self._clock_rate
             composition_time = self._decoding_time
-            if sample.composition_time is not None:
+            if sample.composition_time is not None and not self.trick_play.active:
                 composition_time += sample.composition_time * timescale_multiplier
-            self._decoding_time += sample.duration * timescale_multiplier
+            self._decoding_time += sample.duration * timescale_multiplier // self.trick_play.scale
             self._last_frame_time_sec = current_time
-            if self.trick_play.active and not self.trick_play.forward:
-                if not reader.is_keyframe(sample):
-                    return ret
-            ret = self._frame_to_bytes(reader, sample, composition_time >> (self.trick_play.scale - 1), verbal)
+            payloads = self._payloads(reader, track_id, sample)
+            if self._dropping_non_reference and not self._reference(payloads):
+                return ret
+            ret = self._frame_to_packets(reader, payloads, composition_time, verbal)
         return ret
 
+    def _sync_sample(self, reader, track_id):
+        """Returns the next sync sample of trick play without reading any other one.
+           Its duration is the decoding time up to the sync sample after it, so frames are spaced by the scale"""
+        info = reader.samples_info[track_id]
+        forward = self.trick_play.forward
+        if self._sync_reference is None:
+            index = info.sync_sample(info.index - 1 if forward else info.index, forward)
+        else:
+            index = info.sync_sample(self._sync_reference, forward, self._sync_distance)
+        if index is None:
+            raise IndexError('sync samples depleted')
+        sample = reader.sync_sample(track_id, index)
+        self._sync_reference = index
+        self._sync_distance = sample.duration * self.trick_play.scale  # not faster than the normal frame rate
+        following = info.sync_sample(index, forward, self._sync_distance)
+        if following is not None:
+            sample.duration = abs(info.decoding_time(following) - info.decoding_time(index))
+        return sample
+
 
 class AvcStreamer(Streamer):
     """Streams video data in RTP interleaved protocol"""
@@ -272,21 +499,40 @@ class AvcStreamer(Streamer):
         br.golomb_u()  # pic_parameter_set_id
         return br.golomb_u()
 
-    def _frame_to_bytes(self, reader, sample, composition_time, verbal):
-        """Returns video sample as bytestream, ready to be sent to socket"""
-        ret: list = []
-        for chunk in sample:
+    def _frame_to_packets(self, reader, payloads, composition_time, verbal):
+        """Returns video sample payloads as a list of RTP packets, ready to be sent to socket"""
+        units: list = []
+        self.keyframe = False
+        for chunk, fragments, slice_pps_id in payloads:
             if chunk[0] & 0x1f == 5:
                 self.parameters_sent = []
-            ret.extend(self._parameters_to_bytes(reader, chunk, composition_time, verbal))
-            for marker, data_unit in AvcFragmentMaker(chunk):
-                ret.append(self.to_bytes(marker, data_unit, composition_time, verbal))
-        return b''.join(ret)
-
-    def _parameters_to_bytes(self, reader, chunk, composition_time, verbal):
+                self.keyframe = True
+            units.extend(self._parameters(reader, slice_pps_id))
+            units.extend(data_unit for _, data_unit in fragments)
+        return self._to_packets(units, composition_time, verbal)
+
+    def _descriptors(self, chunk):
+        return AvcFragmentMaker(chunk, self._payload_size - 2).descriptors()
+
+    def _aggregation_header(self, units):
+        """Returns STAP-A header: highest F and NRI of the aggregated NAL units"""
+        return bytes([24 | max((nal[0] & 0xe0 for nal in units), default=0)])
+
+    def _reference(self, payloads):
+        """Verifies if any slice of the frame has nonzero nal_ref_idc"""
+        slices = [chunk[0] for chunk, _, _ in payloads if chunk[0] & 0x1f in (1, 5)]
+        return not slices or any(header & 0x60 for header in slices)
+
+    def _chunk_info(self, chunk):
+        """Returns PPS id of a slice, -1 for other NAL units"""
+        if chunk and chunk[0] & 0x1f in (1, 5):
+            return self._pps_id(chunk)
+        return -1
+
+    def _parameters(self, reader, slice_pps_id):
+        """Returns SPS and PPS of the slice as payload parts unless already sent since the last IDR"""
         ret: list = []
-        if reader.video_configuration_box:
-            slice_pps_id: int = self._pps_id(chunk)
+        if reader.video_configuration_box and slice_pps_id >= 0:
             if slice_pps_id in self.parameters_sent:
                 return ret
             pps: bytes = reader.video_configuration_box.pps.get(slice_pps_id)
@@ -294,8 +540,8 @@ class AvcStreamer(Streamer):
                 self.parameters_sent.append(slice_pps_id)
                 sps: bytes = reader.video_configuration_box.sps.get(self._sps_id(pps))
                 if sps:
-                    ret.append(self.to_bytes(1, sps, composition_time, verbal))
-                ret.append(self.to_bytes(1, pps, composition_time, verbal))
+                    ret.append((sps,))
+                ret.append((pps,))
         return ret
 
 
@@ -305,21 +551,42 @@ class HevcStreamer(Streamer):
         super().__init__(payload_type, TrickPlay(True))
         self.param_sets = param_sets
 
-    def _frame_to_bytes(self, reader, sample, composition_time, verbal):
-        """Returns video sample as bytestream, ready to be sent to socket"""
-        ret = b''
-        for chunk in sample:
-            for marker, data_unit in HevcFragmentMaker(chunk):
-                ret += self.to_bytes(marker, data_unit, composition_time, verbal)
-        return ret
+    def _frame_to_packets(self, reader, payloads, composition_time, verbal):
+        """Returns video sample payloads as a list of RTP packets, ready to be sent to socket"""
+        units: list = []
+        self.keyframe = False
+        for chunk, fragments, _ in payloads:
+            if 16 <= (chunk[0] >> 1) & 0x3f <= 21:  # IRAP picture
+                self.keyframe = True
+            units.extend(data_unit for _, data_unit in fragments)
+        return self._to_packets(units, composition_time, verbal)
+
+    def _descriptors(self, chunk):
+        return HevcFragmentMaker(chunk, self._payload_size - 3).descriptors()
+
+    def _aggregation_header(self, units):
+        """Returns AP payload header: F bit, lowest LayerId and TID of the aggregated NAL units"""
+        layer_id = min((((nal[0] & 1) << 5) | (nal[1] >> 3) for nal in units), default=0)
+        tid = min((nal[1] & 7 for nal in units), default=1)
+        return bytes([(48 << 1) | max((nal[0] & 0x80 for nal in units), default=0) | (layer_id >> 5),
+                      ((layer_id & 0x1f) << 3) | tid])
+
+    def _reference(self, payloads):
+        """Verifies if the frame is not a sub-layer non-reference picture (even VCL NAL unit types below 16)"""
+        types = [(chunk[0] >> 1) & 0x3f for chunk, _, _ in payloads]
+        slices = [nal_type for nal_type in types if nal_type < 32]
+        return not slices or any(nal_type >= 16 or nal_type & 1 for nal_type in slices)
 
 
 class AudioStreamer(Streamer):
     """Streams audio data in RTP interleaved protocol"""
-    def _frame_to_bytes(self, reader, sample, composition_time, verbal):
-        """Returns audio sample as bytestream, ready to be sent to socket"""
-        ret = b''
-        for chunk in sample:
-            data_unit = AUHeaderSimpleSection(0, len(chunk)).to_bytes() + chunk
-            ret += self.to_bytes(1, data_unit, composition_time, verbal)
+    def _frame_to_packets(self, reader, payloads, composition_time, verbal):
+        """Returns audio sample payloads as a list of RTP packets, ready to be sent to socket"""
+        ret: list = []
+        for _, fragments, _ in payloads:
+            for marker, data_unit in fragments:
+                ret.append(self.to_packet(marker, data_unit, composition_time, verbal))
         return ret
+
+    def _descriptors(self, chunk):
+        return [(1, AUHeaderSimpleSection(0, len(chunk)).to_bytes(), 0, len(chunk))]
@@ -0,0 +1,103 @@
+"""RTP over UDP unicast/multicast transport"""
+import socket
+import struct
+import sys
+from typing import List, Tuple
+
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103 if sys.platform.startswith('linux') else None)
+
+
+class UdpTransport:
+    """Pair of UDP sockets of one stream: RTP on even server port, RTCP on the next odd one.
+    Runs of equally sized RTP packets are sent with one sendmsg call using UDP segmentation offload"""
+    first_port: int = 6970
+    last_port: int = 65534
+    max_segments: int = 64
+    max_train_size: int = 65000
+
+    def __init__(self, host: str, client_ports: Tuple[int, int], ttl: int = 0):
+        self.rtp, self.rtcp = self._bind()
+        if ttl:  # multicast group as destination
+            self.rtp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+            self.rtcp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.server_ports = (self.rtp.getsockname()[1], self.rtcp.getsockname()[1])
+        self.rtp.connect((host, client_ports[0]))
+        self.rtcp.connect((host, client_ports[1]))
+        self.dropped_packets = 0
+        self._segmentation = UDP_SEGMENT is not None
+
+    @staticmethod
+    def client_ports(transport: str) -> Tuple[int, int]:
+        """Returns client RTP and RTCP ports of RTSP Transport header"""
+        ports = transport.split('client_port=')[1].split(';')[0].split('-')
+        rtp_port = int(ports[0])
+        return rtp_port, int(ports[1]) if len(ports) > 1 else rtp_port + 1
+
+    def send(self, packets: List[tuple]) -> None:
+        """Sends RTP packets (tuples of buffers) to the client"""
+        sizes = [sum(len(part) for part in packet) for packet in packets]
+        start = 0
+        while start < len(packets):
+            end = start + 1
+            if self._segmentation:
+                # every datagram of a train but the last one must have the same size
+                while end < len(packets) and end - start < self.max_segments and \
+                        sizes[end] <= sizes[start] and (end - start + 1) * sizes[start] <= self.max_train_size:
+                    end += 1
+                    if sizes[end - 1] < sizes[start]:
+                        break
+            self._send(packets[start:end], sizes[start])
+            start = end
+
+    def send_report(self, report: bytes) -> None:
+        """Sends RTCP packet to the client"""
+        try:
+            self.rtcp.send(report)
+        except OSError:
+            pass
+
+    def receive_reports(self) -> List[bytes]:
+        """Returns RTCP packets received from the client"""
+        rc: List[bytes] = []
+        while True:
+            try:
+                rc.append(self.rtcp.recv(2048))
+            except (BlockingIOError, ConnectionRefusedError):
+                return rc
+
+    def close(self) -> None:
+        """Closes RTP and RTCP sockets"""
+        self.rtp.close()
+        self.rtcp.close()
+
+    def _send(self, packets, size):
+        buffers = [part for packet in packets for part in packet]
+        try:
+            if len(packets) > 1:
+                self.rtp.sendmsg(buffers, [(socket.SOL_UDP, UDP_SEGMENT, struct.pack('=H', size))])
+            else:
+                self.rtp.sendmsg(buffers)
+        except (BlockingIOError, ConnectionRefusedError):
+            self.dropped_packets += len(packets)
+        except OSError:
+            if len(packets) == 1:
+                raise
+            self._segmentation = False  # not supported by the kernel or the interface
+            for packet in packets:
+                self._send([packet], size)
+
+    def _bind(self):
+        for port in range(self.first_port, self.last_port, 2):
+            rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            rtcp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                rtp.bind(('', port))
+                rtcp.bind(('', port + 1))
+            except OSError:
+                rtp.close()
+                rtcp.close()
+                continue
+            rtp.setblocking(False)
+            rtcp.setblocking(False)
+            return rtp, rtcp
+        raise OSError('no free UDP port pair')
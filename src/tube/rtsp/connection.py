@@ -2,7 +2,13 @@
 import os
 from datetime import datetime
 from typing import List
-from .session import Session as RtspSession
+from . import multicast
+from ..rtp import cache, plan
+from .output import OutputQueue
+from .parser import Parser, InterleavedPacket
+from .record import RecordSession
+from .session import Session as RtspSession, LiveSession
+from .. import livesource
 from ..authentication import AuthenticationContainer, Authentication, AuthenticationException
 
 
@@ -28,9 +34,21 @@ class Connection:
     def __init__(self, address, params):
         self._session = None
         self._playing = False
+        self._recording = False
+        self._params = params
         self._root = params.get("root", ".")
         self._verbal = params.get("verb", False)
         self._address = address
+        self._parser = Parser()
+        self._output = OutputQueue(params.get('queue_limit', 4 * 1024 * 1024), params.get('drop_policy', 'wait'))
+        self._multicast = params.get('multicast')
+        self._packet_cache_limit = params.get('packet_cache', (64 * 1024 * 1024, 0))
+        self._persistent_plan = params.get('cache', False)
+        self._loss_threshold = params.get('loss_threshold', 0.)
+        self._blocksize = params.get('blocksize', 0)
+        self._channel = None
+        self._channel_streams = set()
+        self._title = None  # packet cache and packetization plan held by the session
         print(f'RTSP connect from {self._address}')
         self._auth = None
         try:
@@ -40,32 +58,80 @@ class Connection:
 
     def on_read_event(self, key, data):
         """Manager read socket event"""
-        if data:
-            key.data.inb += data
-            if key.data.inb.find(bytes([0x0d, 0x0a, 0x0d, 0x0a])):
-                self._on_rtsp_directive(key.data)
-                key.data.inb = b''
-                return
-        raise EOFError()
+        if not data:
+            raise EOFError()
+        self._parser.feed(data)
+        for message in self._parser:
+            if isinstance(message, InterleavedPacket):
+                self._on_interleaved(message)
+            else:
+                self._on_rtsp_directive(message, key.data)
 
     def on_write_event(self, key):
         """Manager write socket event"""
-        if key.data.outb:
-            sent = key.fileobj.send(key.data.outb)  # Should be ready to write
-            key.data.outb = key.data.outb[sent:]
-        if self._session and self._playing:
-            try:
-                key.data.outb = self._session.get_next_frame()
-            except:  # noqa # pylint: disable=bare-except
-                self._playing = False
-
-    def _on_rtsp_directive(self, data):
-        """Manages RTSP directive"""
+        self._output.push(key.data.outb)
+        key.data.outb = b''
+        if self.playing and self._output.writable:
+            for stream, packets, keyframe in self.get_next_frames():
+                self._output.push_frame(stream, packets, keyframe)
+        if self._output:
+            self._output.send(key.fileobj)  # Should be ready to write
+
+    @property
+    def playing(self):
+        """Verifies if media is being streamed to the client"""
+        return self._session is not None and self._playing
+
+    def next_frame_time(self):
+        """Returns wallclock time when the next media frame is due"""
+        if self._channel_streams:
+            return self._channel.next_frame_time()
+        return self._session.next_frame_time()
+
+    def reading(self):
+        """Verifies if the connection may be read, reads of a recording one pause while writes are over budget"""
+        return not self._recording or self._session.reading()
+
+    def close(self):
+        """Releases UDP transports and multicast channel of the connection, ends recording"""
+        self._close_session()
+
+    @property
+    def frame_filter(self):
+        """Returns frame drop policy holder of the connection"""
+        return self._output.filter
+
+    def get_next_frames(self):
+        """Returns next frame of every stream as (track id, RTP packets, keyframe) if time has come"""
+        try:
+            if self._channel_streams:
+                self._channel.pump()
+                return []
+            return self._session.get_next_frames()
+        except:  # noqa # pylint: disable=bare-except
+            self._playing = False
+        return []
+
+    def _on_interleaved(self, packet):
+        """Manages binary data interleaved by the client (RTP of the recording or RTCP reports)"""
+        if self._recording:
+            self._session.on_packet(packet.channel, packet.payload)
+        elif self._session:
+            self._session.on_rtcp(packet.channel, bytes(packet.payload))
+
+    def _on_rtsp_directive(self, request, data):
+        """Manages RTSP directive. Replies to pipelined requests are queued one after another"""
+        pending, data.outb = data.outb, b''
+        try:
+            self._on_request(request, data)
+        finally:
+            data.outb = pending + data.outb
+
+    def _on_request(self, request, data):
         headers = []
         try:
-            directive = data.inb.decode('utf-8')
-            print(directive)
-            headers = directive.split('\r\n')
+            print(request.text)
+            headers = request.headers
             if headers[0][:8] == 'OPTIONS ':
                 self._on_options(headers, data)
             else:
@@ -100,13 +166,17 @@ class Connection:
         """Manager OPTIONS RTSP directive"""
         data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
                              self._sequence_number(headers),
-                             'Public: OPTIONS, DESCRIBE, SETUP, TEARDOWN, PLAY, PAUSE\r\n\r\n']).encode()
+                             'Public: OPTIONS, DESCRIBE, ANNOUNCE, SETUP, TEARDOWN, PLAY, PAUSE, RECORD, '
+                             'GET_PARAMETER, SET_PARAMETER\r\n\r\n']).encode()
 
     def _on_describe(self, headers, data):
         """Manager DESCRIBE RTSP directive"""
         content_base = headers[0].split()[1]
         filename = os.path.join(self._root, content_base.split('/')[-1] + '.mp4')
-        if not os.path.isfile(filename):
+        source = livesource.find(content_base.split('/')[-1])  # a recording of the name may be older
+        if source is not None and not source.described:
+            source = None
+        if source is None and not os.path.isfile(filename):
             data.outb = str.encode('RTSP/1.0 404 Not Found\r\n\r\n')
             return
         accept = [k for k in headers if 'Accept: ' in k]
@@ -115,7 +185,7 @@ class Connection:
                                  self._sequence_number(headers),
                                  '\r\n']).encode()
             return
-        sdp = self._prepare_sdp(content_base, filename)
+        sdp = self._prepare_sdp(content_base, filename, source)
         data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
                              self._sequence_number(headers),
                              self._datetime(),
@@ -125,11 +195,22 @@ class Connection:
                              sdp]).encode()
 
     def _on_announce(self, headers, data):
-        """Manager ANNOUNCE RTSP directive"""
-        pass
+        """Manager ANNOUNCE RTSP directive: the stream to be recorded is described by SDP of the body"""
+        self._close_session()
+        self._session = RecordSession(headers[0].split()[1],
+                                      '\r\n'.join(headers).partition('\r\n\r\n')[2],
+                                      self._params,
+                                      self._verbal)
+        data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
+                             self._sequence_number(headers),
+                             self._datetime(),
+                             '\r\n']).encode()
 
     def _on_get_parameter(self, headers, data):
         """Manages GET_PARAMETER RTSP directive"""
+        if self._session is None:
+            self._on_session_error(data, headers)
+            return
         rc: List[str] = ['RTSP/1.0 200 OK\r\n',
                          self._sequence_number(headers),
                          self._session.identification(),
@@ -144,16 +225,28 @@ class Connection:
         print(data.outb)
 
     def _on_set_parameter(self, headers, data):
-        """Manager GET_PARAMETER RTSP directive"""
-        pass
+        """Manager SET_PARAMETER RTSP directive, parameters are not supported but it keeps the session alive"""
+        data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
+                             self._sequence_number(headers),
+                             self._session.identification() if self._session else '',
+                             self._datetime(),
+                             '\r\n']).encode()
 
     def _on_setup(self, headers, data):
         """Manager SETUP RTSP directive"""
-        if [k for k in headers if 'Session: ' in k] and \
+        if self._session is None or [k for k in headers if 'Session: ' in k] and \
                 not self._session.valid_session(headers):
             self._on_session_error(data, headers)
+        elif isinstance(self._session, RecordSession):
+            self._on_record_setup(headers, data)
         else:
-            transport = self._session.add_stream(headers)
+            transport = [k for k in headers if 'Transport: ' in k]
+            if self._channel and transport and ';multicast' in transport[0]:
+                track_id = int(headers[0].split()[1].split('/')[-1])
+                self._channel_streams.add(track_id)
+                transport = self._channel.transport(track_id)
+            else:
+                transport = self._session.add_stream(headers, self._address[0])
             data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
                                  self._sequence_number(headers),
                                  self._datetime(),
@@ -161,9 +254,27 @@ class Connection:
                                  transport,
                                  '\r\n\r\n']).encode()
 
+    def _on_record_setup(self, headers, data):
+        """Sets up announced media to be received, interleaved into the connection only"""
+        transport = self._session.add_stream(headers)
+        if not transport:
+            data.outb = ''.join(['RTSP/1.0 461 Unsupported Transport\r\n',
+                                 self._sequence_number(headers),
+                                 '\r\n']).encode()
+            return
+        data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
+                             self._sequence_number(headers),
+                             self._datetime(),
+                             self._session.identification(';timeout=60'),
+                             transport,
+                             '\r\n\r\n']).encode()
+
     def _on_play(self, headers, data):
         """Manager PLAY RTSP directive"""
-        if self._session.valid_request(headers):
+        if self._session and self._session.valid_request(headers):
+            if self._channel_streams:
+                self._on_multicast_play(headers, data)
+                return
             scale = int(Connection._scale(headers)[7:])
             data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
                                  self._sequence_number(headers),
@@ -176,44 +287,107 @@ class Connection:
         else:
             self._on_session_error(data, headers)
 
+    def _on_multicast_play(self, headers, data):
+        """Joins the multicast channel, scale is not applicable to the shared stream"""
+        data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
+                             self._sequence_number(headers),
+                             self._channel.join(headers),
+                             self._datetime(),
+                             self._session.identification(),
+                             '\r\n']).encode()
+        self._playing = True
+
     def _on_pause(self, headers, data):
         """Manager PAUSE RTSP directive"""
-        if self._session.valid_request(headers):
+        if self._session and self._session.valid_request(headers):
             data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
                                  self._sequence_number(headers),
                                  self._datetime(),
                                  self._session.identification(),
                                  '\r\n']).encode()
             self._playing = False
+        else:
+            self._on_session_error(data, headers)
 
     def _on_record(self, headers, data):
         """Manager RECORD RTSP directive"""
-        pass
+        if isinstance(self._session, RecordSession) and self._session.valid_request(headers):
+            self._session.record()
+            self._recording = True
+            data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
+                                 self._sequence_number(headers),
+                                 self._datetime(),
+                                 self._session.identification(),
+                                 '\r\n']).encode()
+        else:
+            self._on_session_error(data, headers)
 
     def _on_redirect(self, headers, data):
         """Manager REDIRECT RTSP directive"""
         pass
 
     def _on_teardown(self, headers, data):
-        """Manager TEARDOWN RTSP directive"""
-        if self._session.valid_request(headers):
+        """Manager TEARDOWN RTSP directive, later requests of the session get 454"""
+        if self._session and self._session.valid_request(headers):
             data.outb = ''.join(['RTSP/1.0 200 OK\r\n',
                                  self._sequence_number(headers),
                                  self._datetime(),
                                  self._session.identification(),
                                  '\r\n']).encode()
-            self._playing = False
+            self._close_session()
+        else:
+            self._on_session_error(data, headers)
 
     def _on_session_error(self, data, headers):
         data.outb = ''.join(['RTSP/1.0 454 Session Not Found\r\n',
                              self._sequence_number(headers),
                              '\r\n']).encode()
 
-    def _prepare_sdp(self, content_base, filename):
-        self._session = RtspSession(content_base, filename, self._verbal)
+    def _release_channel(self):
+        if self._channel:
+            multicast.release(self._channel)
+            self._channel = None
+        self._channel_streams = set()
+
+    def _close_session(self):
+        """Closes the session of the connection, if any, before it gets another one"""
+        self._playing = self._recording = False
+        if self._session:
+            self._session.close()
+            self._session = None
+        self._release_channel()
+        self._release_title()
+
+    def _release_title(self):
+        if self._title:
+            packet_cache, packetization_plan = self._title
+            if packet_cache is not None:
+                cache.release(packet_cache)
+            plan.release(packetization_plan)
+            self._title = None
+
+    def _prepare_sdp(self, content_base, filename, source=None):
+        self._close_session()
+        if source is not None:  # live stream published over rtmp
+            self._session = LiveSession(content_base, source, self._verbal, self._loss_threshold, self._blocksize)
+        else:
+            packet_cache = cache.title_cache(filename, *self._packet_cache_limit)
+            packetization_plan = plan.title_plan(filename, self._persistent_plan) \
+                if self._persistent_plan or packet_cache is not None else None
+            self._title = packet_cache, packetization_plan
+            self._session = RtspSession(content_base,
+                                        filename,
+                                        self._verbal,
+                                        *self._title,
+                                        self._loss_threshold,
+                                        self._blocksize)
+        connection, sdp = 'c=IN IP4 0.0.0.0\r\n', self._session.sdp
+        if self._multicast and source is None:
+            self._channel = multicast.acquire(filename, *self._multicast, self._verbal)
+            connection, sdp = f'c=IN IP4 {self._channel.group}/{self._channel.ttl}\r\n', self._channel.sdp
         return ''.join(['v=0\r\n',
                         'o=- 0 0 IN IP4 ', self._address[0], '\r\n',
                         's=No Title\r\n',
-                        'c=IN IP4 0.0.0.0\r\n',
+                        connection,
                         't=0 0\r\n',
-                        self._session.sdp])
+                        sdp])
@@ -0,0 +1,77 @@
+"""Shared multicast delivery of RTSP media"""
+import ipaddress
+import re
+from typing import Dict
+from .session import Session
+
+
+class Channel:
+    """Streams one file to a multicast group once for all RTSP sessions joined to it.
+    The first session to play sets the start position, later ones join the broadcast in progress"""
+    first_port: int = 5004
+
+    def __init__(self, filename, group, ttl, verbal):
+        self.filename = filename
+        self.group = group
+        self.ttl = ttl
+        self.holders = 0
+        self._started = False
+        self._session = Session('rtsp://' + group + '/', filename, verbal)
+        self._ports = self._session.add_multicast_streams(group, ttl, self.first_port)
+        ports = iter(self._ports.values())
+        self.sdp = re.sub(r'^m=(\w+) 0 ',
+                          lambda match: f'm={match.group(1)} {next(ports, (0,))[0]} ',
+                          self._session.sdp,
+                          flags=re.MULTILINE)
+
+    def transport(self, track_id) -> str:
+        """Returns Transport header of the track stream"""
+        rtp_port, rtcp_port = self._ports[track_id]
+        return f'Transport: RTP/AVP;multicast;destination={self.group};port={rtp_port}-{rtcp_port};ttl={self.ttl}'
+
+    def join(self, headers) -> str:
+        """Starts the broadcast if not started yet. Returns Range header"""
+        if not self._started:
+            self._started = True
+            play_range = self._session.set_play_range(headers, 0)
+            if play_range:
+                return play_range
+        return 'Range: npt={:.03f}-\r\n'.format(self._session.get_position())
+
+    def pump(self) -> None:
+        """If time has come sends next frames to the group"""
+        if self._started:
+            self._session.get_next_frames()
+
+    def next_frame_time(self) -> float:
+        """Returns wallclock time when the next media frame is due"""
+        return self._session.next_frame_time()
+
+    def close(self) -> None:
+        """Releases multicast sockets"""
+        self._session.close()
+
+
+_channels: Dict[str, Channel] = {}
+
+
+def acquire(filename, group, ttl, verbal) -> Channel:
+    """Returns channel of the file. Every file gets its own group, counting up from the configured one"""
+    channel = _channels.get(filename)
+    if channel is None:
+        used = {c.group for c in _channels.values()}
+        address = ipaddress.IPv4Address(group)
+        while str(address) in used:
+            address += 1
+        channel = Channel(filename, str(address), ttl, verbal)
+        _channels[filename] = channel
+    channel.holders += 1
+    return channel
+
+
+def release(channel: Channel) -> None:
+    """Closes the channel when no RTSP session holds it"""
+    channel.holders -= 1
+    if channel.holders <= 0:
+        channel.close()
+        _channels.pop(channel.filename, None)
@@ -0,0 +1,86 @@
+"""Outgoing data of RTSP connection"""
+import itertools
+from collections import deque
+
+
+class FrameFilter:
+    """Decides which media frames are given to a slow client.
+    Policy 'wait' pauses frame production while the client is congested,
+    policy 'drop' keeps the pace and drops frames of a stream up to its next keyframe"""
+    policies = ('wait', 'drop')
+
+    def __init__(self, policy='wait'):
+        if policy not in self.policies:
+            raise ValueError(f'unknown frame drop policy {policy}')
+        self.policy = policy
+        self.dropped_frames = 0
+        self._waiting_keyframe = set()
+
+    def accept(self, stream, keyframe, congested) -> bool:
+        """Verifies if the frame of the stream should be sent"""
+        if congested:
+            if self.policy == 'wait':
+                return True
+            self._waiting_keyframe.add(stream)
+        elif stream in self._waiting_keyframe and keyframe:
+            self._waiting_keyframe.discard(stream)
+        if stream in self._waiting_keyframe:
+            self.dropped_frames += 1
+            return False
+        return True
+
+
+class OutputQueue:
+    """Queue of buffers flushed to socket with scatter-gather sendmsg.
+    Partially sent buffers are kept as memoryviews, so no data is copied"""
+    max_iov = 512
+
+    def __init__(self, limit=4 * 1024 * 1024, policy='wait'):
+        self._buffers = deque()
+        self.limit = limit
+        self.size = 0
+        self.filter = FrameFilter(policy)
+
+    def __bool__(self):
+        return self.size > 0
+
+    @property
+    def congested(self) -> bool:
+        """Verifies if queued data exceeds the limit"""
+        return self.size >= self.limit
+
+    @property
+    def writable(self) -> bool:
+        """Verifies if more media frames can be produced"""
+        return not self.congested or self.filter.policy != 'wait'
+
+    def push(self, data) -> None:
+        """Queues RTSP reply or any other data that can not be dropped"""
+        if data:
+            self._buffers.append(data)
+            self.size += len(data)
+
+    def push_frame(self, stream, packets, keyframe) -> bool:
+        """Queues media frame as a list of RTP packets if frame drop policy allows it"""
+        if not self.filter.accept(stream, keyframe, self.congested):
+            return False
+        for packet in packets:
+            for part in packet:
+                self._buffers.append(part)
+                self.size += len(part)
+        return True
+
+    def send(self, sock) -> int:
+        """Sends as much queued data as socket accepts. Returns number of bytes sent"""
+        sent = sock.sendmsg(list(itertools.islice(self._buffers, self.max_iov)))
+        self.size -= sent
+        rest = sent
+        while rest:
+            buffer = self._buffers[0]
+            if len(buffer) <= rest:
+                rest -= len(buffer)
+                self._buffers.popleft()
+            else:
+                self._buffers[0] = memoryview(buffer)[rest:]
+                rest = 0
+        return sent
@@ -0,0 +1,100 @@
+"""Incremental framing of RTSP client stream: requests and interleaved binary data"""
+from typing import Iterator, List, Union
+
+
+class ParserException(ValueError):
+    pass
+
+
+class Request:
+    """RTSP request as a list of header lines followed by body lines"""
+    def __init__(self, header: bytes, body: bytes):
+        self.text: str = (header + body).decode('utf-8')
+        self.headers: List[str] = self.text.split('\r\n')
+
+
+class InterleavedPacket:
+    """Binary data interleaved into RTSP connection ($, channel, 16-bit length, data)"""
+    def __init__(self, channel: int, payload: memoryview):
+        self.channel: int = channel
+        self.payload: memoryview = payload  # valid until next Parser.feed call
+
+
+class Parser:
+    """Splits RTSP connection stream into requests and interleaved packets.
+    Keeps partial data until more arrives, supports pipelined requests and Content-Length bodies"""
+    max_header_size: int = 64 * 1024
+    max_body_size: int = 64 * 1024  # SDP of ANNOUNCE or parameters
+
+    def __init__(self):
+        self._buffer: bytearray = bytearray()
+        self._offset: int = 0
+
+    def feed(self, data: bytes) -> None:
+        """Appends received network data to the buffer"""
+        if self._offset:
+            try:
+                del self._buffer[:self._offset]
+            except BufferError:  # previous interleaved payload is still referenced
+                self._buffer = bytearray(memoryview(self._buffer)[self._offset:])
+            self._offset = 0
+        self._buffer += data
+
+    def __iter__(self) -> Iterator[Union[Request, InterleavedPacket]]:
+        while True:
+            message = self._next_message()
+            if message is None:
+                return
+            yield message
+
+    def _next_message(self):
+        buffer = self._buffer
+        # skip CRLF between messages, allowed by RFC 2326 and sent by some clients
+        while self._offset < len(buffer) and buffer[self._offset] in (0x0d, 0x0a):
+            self._offset += 1
+        if self._offset >= len(buffer):
+            return None
+        if buffer[self._offset] == 0x24:  # '$'
+            return self._next_packet()
+        return self._next_request()
+
+    def _next_packet(self):
+        start = self._offset + 4
+        if len(self._buffer) < start:
+            return None
+        end = start + int.from_bytes(self._buffer[self._offset + 2:start], 'big')
+        if len(self._buffer) < end:
+            return None
+        channel = self._buffer[self._offset + 1]
+        self._offset = end
+        return InterleavedPacket(channel, memoryview(self._buffer)[start:end])
+
+    def _next_request(self):
+        header_end = self._buffer.find(b'\r\n\r\n', self._offset)
+        if header_end < 0:
+            if len(self._buffer) - self._offset > self.max_header_size:
+                raise ParserException('RTSP header is too long')
+            return None
+        header_end += 4
+        header = bytes(self._buffer[self._offset:header_end])
+        body_end = header_end + self._content_length(header)
+        if len(self._buffer) < body_end:
+            return None
+        body = bytes(self._buffer[header_end:body_end])
+        self._offset = body_end
+        return Request(header, body)
+
+    def _content_length(self, header: bytes) -> int:
+        for line in header.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    raise ParserException('invalid Content-Length')
+                if length < 0:
+                    raise ParserException('invalid Content-Length')
+                if length > self.max_body_size:
+                    raise ParserException('RTSP body is too long')
+                return length
+        return 0
@@ -0,0 +1,374 @@
+"""RTSP session of a stream pushed by the client with ANNOUNCE and RECORD. RTP interleaved into the connection
+is put back together into access units and handed to the sinks of RTMP ingest"""
+import base64
+import heapq
+import random
+import string
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from ..atom import avcc, hvcc
+from ..bitreader import Reader as BitReader, ReaderException
+from ..diskwriter import DiskWriter, IngestBudget
+from ..livesink import LiveSink
+from ..livesource import LiveSource
+from ..mp4sink import Mp4Sink, FragmentedMp4Sink
+from ..rtp.depacketizer import AvcDepacketizer, HevcDepacketizer, AacDepacketizer, DepacketizerException
+
+
+class RecordException(ValueError):
+    pass
+
+
+class MediaDescription:
+    """Media of the announced SDP: m= line and its rtpmap, fmtp and control attributes"""
+    def __init__(self, line: str) -> None:
+        fields: List[str] = line[2:].split()
+        self.media: str = fields[0]
+        self.payload_type: int = int(fields[3]) if len(fields) > 3 and fields[3].isdigit() else -1
+        self.encoding: str = ''
+        self.clock_rate: int = 90000
+        self.channels: int = 1
+        self.fmtp: Dict[str, str] = {}
+        self.control: str = ''
+
+    def add_attribute(self, line: str) -> None:
+        """Takes in a= line of the media"""
+        name, _, value = line[2:].partition(':')
+        if name == 'rtpmap':
+            encoding: List[str] = value.split(maxsplit=1)[-1].split('/')
+            self.encoding = encoding[0].upper()
+            if len(encoding) > 1:
+                self.clock_rate = int(encoding[1])
+            if len(encoding) > 2:
+                self.channels = int(encoding[2])
+        elif name == 'fmtp':
+            for parameter in value.split(maxsplit=1)[-1].split(';'):
+                key, _, parameter_value = parameter.strip().partition('=')
+                if key:
+                    self.fmtp[key.lower()] = parameter_value.strip()
+        elif name == 'control':
+            self.control = value.strip()
+
+    def controlled_by(self, url: str) -> bool:
+        """Verifies if SETUP url is the one of the media"""
+        if self.control.startswith('rtsp://'):
+            return url.rstrip('/') == self.control.rstrip('/')
+        return bool(self.control) and url.rstrip('/').endswith('/' + self.control.strip('/'))
+
+
+def parse_sdp(text: str) -> List[MediaDescription]:
+    """Returns media of the session description"""
+    rc: List[MediaDescription] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('m='):
+            rc.append(MediaDescription(line))
+        elif line.startswith('a=') and rc:
+            rc[-1].add_attribute(line)
+    return rc
+
+
+def avc_dimensions(sps: bytes) -> tuple:
+    """Returns picture width and height of H.264 SPS"""
+    rbsp: bytes = sps[1:].replace(b'\x00\x00\x03', b'\x00\x00')
+    reader: BitReader = BitReader(rbsp[3:])
+    reader.golomb_u()  # seq_parameter_set_id
+    chroma_format: int = 1
+    if rbsp[0] in (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135):  # profiles of chroma format
+        chroma_format = reader.golomb_u()
+        if chroma_format == 3:
+            reader.bit()  # separate_colour_plane_flag
+        reader.golomb_u()  # bit_depth_luma_minus8
+        reader.golomb_u()  # bit_depth_chroma_minus8
+        reader.bit()  # qpprime_y_zero_transform_bypass_flag
+        if reader.bit():  # seq_scaling_matrix_present_flag
+            for index in range(8 if chroma_format != 3 else 12):
+                if reader.bit():
+                    last, next_ = 8, 8
+                    for _ in range(16 if index < 6 else 64):
+                        if next_:
+                            next_ = (last + reader.golomb_s() + 256) % 256
+                        last = next_ or last
+    reader.golomb_u()  # log2_max_frame_num_minus4
+    order_type: int = reader.golomb_u()
+    if order_type == 0:
+        reader.golomb_u()  # log2_max_pic_order_cnt_lsb_minus4
+    elif order_type == 1:
+        reader.bit()  # delta_pic_order_always_zero_flag
+        reader.golomb_s()  # offset_for_non_ref_pic
+        reader.golomb_s()  # offset_for_top_to_bottom_field
+        for _ in range(reader.golomb_u()):
+            reader.golomb_s()
+    reader.golomb_u()  # max_num_ref_frames
+    reader.bit()  # gaps_in_frame_num_value_allowed_flag
+    width, height = (reader.golomb_u() + 1) * 16, reader.golomb_u() + 1
+    frame_mbs_only: int = reader.bit()
+    height *= (2 - frame_mbs_only) * 16
+    if not frame_mbs_only:
+        reader.bit()  # mb_adaptive_frame_field_flag
+    reader.bit()  # direct_8x8_inference_flag
+    if reader.bit():  # frame_cropping_flag
+        left, right, top, bottom = (reader.golomb_u() for _ in range(4))
+        crop_x = 2 if chroma_format in (1, 2) else 1
+        crop_y = (2 if chroma_format == 1 else 1) * (2 - frame_mbs_only)
+        width, height = width - crop_x * (left + right), height - crop_y * (top + bottom)
+    return width, height
+
+
+class RecordTrack:
+    """Media set up to be recorded. RTP time is turned into ms of ingest: the first packet takes wallclock
+    time since recording has started, the ones to follow add elapsed RTP time, wraparound included.
+    RTP time of pictures is presentation one: pictures are held back by a window to get decode times, which
+    are presentation ones put in ascending order, and presentation times are delayed to stay after them"""
+    reorder_window = 4  # pictures held back, covers the reordering of B-frames
+
+    def __init__(self, description: MediaDescription, depacketizer) -> None:
+        self.description: MediaDescription = description
+        self.depacketizer = depacketizer
+        self.parameter_sets: Dict[int, bytes] = {}  # of video by NAL unit type
+        self.configured: bool = False
+        self._timestamp: Optional[int] = None
+        self._elapsed: int = 0
+        self._offset: int = 0
+        self._pending: Deque[Tuple[int, bool, bytes]] = deque()  # pictures in arrival order
+        self._presentation: List[int] = []  # heap of presentation times not taken as decode ones yet
+        self._delay: Optional[int] = None  # of presentation times, ms
+        self._decode: Optional[int] = None
+
+    @property
+    def video(self) -> bool:
+        """Verifies if pictures of the track are recorded"""
+        return self.description.encoding in RecordSession.video_encodings and self.depacketizer is not None
+
+    def on_parameter_set(self, nal_type: int, nal: bytes) -> None:
+        """Keeps the latest parameter set of the type"""
+        self.parameter_sets[nal_type] = nal
+
+    def time(self, timestamp: int, start: float) -> int:
+        """Returns ms of ingest of RTP timestamp"""
+        if self._timestamp is None:
+            self._timestamp, self._offset = timestamp, int((time.monotonic() - start) * 1000)
+        self._elapsed += ((timestamp - self._timestamp + 0x80000000) & 0xffffffff) - 0x80000000
+        self._timestamp = timestamp
+        return self._offset + self._elapsed * 1000 // self.description.clock_rate
+
+    def reorder(self, presentation: int, keyframe: bool, unit: memoryview) -> List[Tuple[int, int, bool, bytes]]:
+        """Takes in picture in arrival order. Returns pictures to be recorded as (decode time, composition offset,
+        keyframe, unit), times are in ms
+
+        >>> track = RecordTrack(MediaDescription('m=video 0 RTP/AVP 96'), None)
+        >>> [picture[:2] for time_ in (0, 66, 33, 100, 166, 133) for picture in track.reorder(time_, False, b'')]
+        [(0, 33), (33, 66)]
+        >>> [picture[:2] for picture in track.flush()]
+        [(66, 0), (100, 33), (133, 66), (166, 0)]
+        """
+        self._pending.append((presentation, keyframe, bytes(unit)))
+        heapq.heappush(self._presentation, presentation)
+        rc: List[Tuple[int, int, bool, bytes]] = []
+        while len(self._pending) > self.reorder_window:
+            rc.append(self._release())
+        return rc
+
+    def flush(self) -> List[Tuple[int, int, bool, bytes]]:
+        """Returns pictures held back"""
+        return [self._release() for _ in range(len(self._pending))]
+
+    def _release(self) -> Tuple[int, int, bool, bytes]:
+        if self._delay is None:  # the delay keeps pictures of the first window presented after they are decoded
+            self._delay = max(max(decode - picture[0]
+                                  for decode, picture in zip(sorted(self._presentation), self._pending)), 0)
+        presentation, keyframe, unit = self._pending.popleft()
+        decode: int = heapq.heappop(self._presentation)
+        if self._decode is not None and decode <= self._decode:
+            decode = self._decode + 1
+        self._decode = decode
+        return decode, presentation + self._delay - decode, keyframe, unit
+
+
+class RecordSession:
+    """Session of a stream announced by the client, tracks are set up over interleaved transport only.
+    Recorded as RTMP ingest is: into <root>/<name>.mp4 (fragmented with -g), the live playlist and the live
+    source. H.264 and H.265 pictures are taken in from the first key frame with parameter sets known
+    of SDP or in band, AAC units with the config of SDP. Reads pause while writes are over the budget"""
+    video_encodings = {'H264': AvcDepacketizer, 'H265': HevcDepacketizer}
+    parameter_set_types = {'H264': (7, 8), 'H265': (32, 33, 34)}
+
+    def __init__(self, content_base: str, sdp: str, params: dict, verbal: bool = False) -> None:
+        self._session_id: str = ''
+        self._content_base: str = content_base if content_base.endswith('/') else content_base + '/'
+        self.name: str = content_base.split('?')[0].rstrip('/').split('/')[-1]
+        self._verbal: bool = verbal
+        self._media: List[MediaDescription] = parse_sdp(sdp)
+        if not self._media:
+            raise RecordException('no media announced')
+        self._tracks: Dict[int, RecordTrack] = {}  # by RTP channel
+        self._start: float = 0.
+        self._recording: bool = False
+        self._errors: int = 0
+        root: str = params.get('root', '.')
+        self._budget: IngestBudget = IngestBudget(*params.get('ingest_limit', ()))
+        self._writer: DiskWriter = DiskWriter(self._budget)
+        self._sinks: list = [
+            FragmentedMp4Sink(root, *params['fragmented'], writer=self._writer) if 'fragmented' in params
+            else Mp4Sink(root, params.get('faststart', False), self._writer),
+            LiveSink(root, float(params.get('segment', 6.)), float(params.get('part', .5)), self._writer),
+            LiveSource()
+        ]
+
+    @property
+    def content_base(self) -> str:
+        """Returns content base URL"""
+        return self._content_base
+
+    def identification(self, params: str = '') -> str:
+        """Returns session identification"""
+        if not self._session_id:
+            source = string.ascii_letters + string.digits
+            self._session_id = ''.join(map(lambda x: random.choice(source), range(16)))
+        return ''.join(['Session: ', self._session_id, params, '\r\n'])
+
+    def valid_request(self, headers) -> bool:
+        """Verifies content and session identity"""
+        content = headers[0].split()[1]
+        if content[-1] != '/':
+            content += '/'
+        return content == self._content_base and self.valid_session(headers)
+
+    def valid_session(self, headers) -> bool:
+        """Verifies session identity"""
+        session_id = [k for k in headers if 'Session: ' in k][0][9:]
+        return session_id.split(';')[0] == self._session_id
+
+    def add_stream(self, headers) -> str:
+        """Sets up announced media to be received. Returns Transport header of the reply, empty if the transport
+        is not interleaved"""
+        url: str = headers[0].split()[1]
+        media: List[MediaDescription] = [item for item in self._media if item.controlled_by(url)]
+        if not media and len(self._media) == 1:
+            media = self._media
+        if not media:
+            raise RecordException(f'no media of {url}')
+        transport: str = [k for k in headers if 'Transport: ' in k][0]
+        if 'interleaved=' not in transport:
+            return ''
+        channel: int = int(transport.split('interleaved=')[-1].split(';')[0].split('-')[0])
+        self._tracks[channel] = self._make_track(media[0])
+        return transport
+
+    def record(self) -> None:
+        """Starts recording of the tracks set up"""
+        if self._recording:
+            return
+        self._recording, self._start = True, time.monotonic()
+        for sink in self._sinks:
+            sink.on_publish(self.name)
+        for track in self._tracks.values():
+            config: str = track.description.fmtp.get('config', '')
+            if track.description.encoding == 'MPEG4-GENERIC' and config:
+                for sink in self._sinks:
+                    sink.on_audio_config(bytes.fromhex(config))
+
+    def on_packet(self, channel: int, packet: memoryview) -> None:
+        """Takes in RTP packet interleaved on the channel, RTCP ones are skipped"""
+        track: Optional[RecordTrack] = self._tracks.get(channel)
+        if track is None or track.depacketizer is None or not self._recording:
+            return
+        try:
+            track.depacketizer.on_packet(packet)
+        except (DepacketizerException, ReaderException) as ex:
+            self._errors += 1
+            if self._verbal:
+                print(f'RTSP record {self.name}: {ex}')
+
+    def reading(self) -> bool:
+        """Verifies if ingest may be read, that is data waiting to be written is within budget"""
+        if self._budget.exceeded:
+            self._budget.throttle()
+            return False
+        if self._budget.throttled:
+            self._budget.resume()
+        return True
+
+    def close(self) -> None:
+        """Ends recording, live playlist and live source. Writes queued are made after the session is gone"""
+        if self._recording:
+            self._recording = False
+            for track in self._tracks.values():
+                self._record_pictures(track.flush())
+            for sink in self._sinks:
+                sink.close()
+            self._writer.close()
+            if self._budget.throttled:
+                self._budget.resume()
+            for channel, track in self._tracks.items():
+                if track.depacketizer is not None and (track.depacketizer.lost or track.depacketizer.dropped):
+                    print(f'RTSP record {self.name} channel {channel}: {track.depacketizer.lost} packets lost, '
+                          f'{track.depacketizer.dropped} units dropped')
+            if self._budget.throttles or self._errors:
+                print(f'RTSP record {self.name}: reads throttled {self._budget.throttles} times '
+                      f'for {self._budget.throttled_time:.3f}s, {self._errors} packets malformed')
+
+    def _make_track(self, description: MediaDescription) -> RecordTrack:
+        track: RecordTrack = RecordTrack(description, None)
+        fmtp: Dict[str, str] = description.fmtp
+        if description.encoding in self.video_encodings:
+            track.depacketizer = self.video_encodings[description.encoding](
+                lambda timestamp, keyframe, unit: self._on_picture(track, timestamp, keyframe, unit),
+                track.on_parameter_set)
+            for key in ('sprop-parameter-sets', 'sprop-vps', 'sprop-sps', 'sprop-pps'):
+                for item in fmtp.get(key, '').split(','):
+                    nal: bytes = base64.b64decode(item) if item else b''
+                    if nal:
+                        track.on_parameter_set(nal[0] & 0x1f if description.encoding == 'H264'
+                                               else (nal[0] >> 1) & 0x3f, nal)
+        elif description.encoding == 'MPEG4-GENERIC' and ('aac' in fmtp.get('mode', '').lower() or
+                                                          'sizelength' in fmtp):
+            track.depacketizer = AacDepacketizer(lambda timestamp, unit: self._on_audio(track, timestamp, unit),
+                                                 int(fmtp.get('sizelength', 13)),
+                                                 int(fmtp.get('indexlength', 3)),
+                                                 int(fmtp.get('indexdeltalength', 3)))
+        else:
+            print(f'RTSP record {self.name}: {description.media} of {description.encoding or "unknown"} '
+                  f'encoding is not recorded')
+        return track
+
+    def _on_picture(self, track: RecordTrack, timestamp: int, keyframe: bool, unit: memoryview) -> None:
+        if not track.configured:
+            if not keyframe or not self._configure(track):
+                return
+        self._record_pictures(track.reorder(track.time(timestamp, self._start), keyframe, unit))
+
+    def _record_pictures(self, pictures: List[Tuple[int, int, bool, bytes]]) -> None:
+        for decode, composition, keyframe, unit in pictures:
+            for sink in self._sinks:
+                sink.on_video_frame(decode, composition, keyframe, unit)
+
+    def _on_audio(self, track: RecordTrack, timestamp: int, unit: memoryview) -> None:
+        if any(item.video and not item.configured for item in self._tracks.values()):
+            return  # sinks fix their tracks with the first samples, video ones have to be known by then
+        time_: int = track.time(timestamp, self._start)
+        for sink in self._sinks:
+            sink.on_audio_frame(time_, unit)
+
+    def _configure(self, track: RecordTrack) -> bool:
+        """Hands decoder configuration of parameter sets to the sinks. Returns False if some are missing"""
+        encoding: str = track.description.encoding
+        if any(nal_type not in track.parameter_sets for nal_type in self.parameter_set_types[encoding]):
+            return False
+        if encoding == 'H264':
+            sps, pps = track.parameter_sets[7], track.parameter_sets[8]
+            box = avcc.Box(initial=b'\x01' + sps[1:4], u_length=4, sps=[sps], pps=[pps])
+            try:
+                width, height = avc_dimensions(sps)
+            except ReaderException:
+                width, height = 0, 0
+        else:
+            box = hvcc.Box(vps=[track.parameter_sets[32]], sps=[track.parameter_sets[33]],
+                           pps=[track.parameter_sets[34]])
+            width, height = box.width, box.height
+        for sink in self._sinks:
+            sink.on_metadata({'width': float(width), 'height': float(height)})
+            sink.on_video_config(box)
+        track.configured = True
+        return True
@@ -1,11 +1,16 @@
 """Network RTSP service session"""
+import math
 import random
 import string
 import logging
+import time
 from datetime import datetime
-from typing import List
+from typing import List, Tuple
 from ..reader import Reader
+from ..livesource import LiveSource, LiveReader
 from ..rtp.streamer import AvcStreamer, HevcStreamer, AudioStreamer
+from ..rtp.udp import UdpTransport
+from ..rtp.rtcp import report_blocks
 from ..atom.hvcc import NetworkUnitType
 
 
@@ -70,13 +75,17 @@ class PlayRange:
 
 class Session:
     """RTSP Session parameters"""
-    def __init__(self, content_base, filename, verbal):
+    def __init__(self, content_base, filename, verbal, packet_cache=None, packetization_plan=None, loss_threshold=0.,
+                 blocksize=0):
         self._session_id = ''
+        self._blocksize = blocksize
         self._streamers = {}
+        self._udp_transports = {}
+        self._rtcp_channels = {}
         self._sdp = ''
         self._play_range = None
         self._content_base = content_base if content_base.endswith('/') else content_base + '/'
-        self._reader = Reader(filename)
+        self._reader = self._open(filename)
         self._verbal = verbal
         if self._verbal:
             logging.info(self._reader)
@@ -87,17 +96,67 @@ class Session:
                 self._sdp += self._make_video_sdp(track_id, box.entries)
             elif box.handler == 'soun':
                 self._sdp += self._make_audio_sdp(track_id, box.entries)
+        for streamer in self._streamers.values():
+            streamer.packet_cache = packet_cache
+            streamer.packetization_plan = packetization_plan
+            streamer.loss_threshold = loss_threshold
 
-    def add_stream(self, headers):
-        """Adds a controlled stream"""
+    def add_stream(self, headers, host):
+        """Adds a controlled stream. Returns Transport (and Blocksize if asked for) header of the reply"""
         stream = int(headers[0].split()[1].split('/')[-1])
         transport = ''
         streamer = self._streamers.get(stream, None)
         if streamer is not None:
             transport = [k for k in headers if 'Transport: ' in k][0]
-            streamer.set_transport(transport)
+            requested = [k for k in headers if 'Blocksize: ' in k]
+            blocksize = int(requested[0].split(':')[1]) if requested else 0
+            if not blocksize and 'interleaved=' in transport:
+                blocksize = self._blocksize
+            blocksize = streamer.set_transport(transport, blocksize)
+            if 'client_port=' in transport and 'interleaved=' not in transport:
+                udp = self._udp_transports.pop(stream, None)
+                udp and udp.close()
+                udp = UdpTransport(host, UdpTransport.client_ports(transport))
+                self._udp_transports[stream] = udp
+                transport += ';server_port={}-{}'.format(*udp.server_ports)
+            elif 'interleaved=' in transport:
+                channels = transport.split('interleaved=')[-1].split(';')[0].split('-')
+                rtcp_channel = int(channels[1]) if len(channels) > 1 else int(channels[0]) + 1
+                self._rtcp_channels[rtcp_channel] = stream
+            if requested:
+                transport += f'\r\nBlocksize: {blocksize}'
         return transport
 
+    def on_rtcp(self, channel, data):
+        """Manages RTCP packet interleaved by the client"""
+        track_id = self._rtcp_channels.get(channel)
+        if track_id is not None:
+            self._on_reports(track_id, data)
+
+    def reception_statistics(self):
+        """Returns loss, jitter and round trip time of every stream reported by the client"""
+        return {key: streamer.reception for key, streamer in self._streamers.items() if streamer.reception.reports}
+
+    def add_multicast_streams(self, group, ttl, first_port):
+        """Directs all streams to the multicast group. Returns {track id: (RTP port, RTCP port)}"""
+        rc = {}
+        for index, track_id in enumerate(self._streamers):
+            ports = (first_port + 2 * index, first_port + 2 * index + 1)
+            self._streamers[track_id].set_transport('RTP/AVP;multicast')
+            self._udp_transports[track_id] = UdpTransport(group, ports, ttl)
+            rc[track_id] = ports
+        return rc
+
+    def close(self):
+        """Stops streaming and releases UDP transports"""
+        for key, statistics in self.reception_statistics().items():
+            logging.info(f'session {self._session_id} track {key}: {statistics}')
+        for streamer in self._streamers.values():
+            streamer.reset_transport()
+        for udp in self._udp_transports.values():
+            udp.close()
+        self._udp_transports = {}
+
     def valid_request(self, headers):
         """Verifies content and session identity"""
         content = headers[0].split()[1]
@@ -112,7 +171,41 @@ class Session:
 
     def get_next_frame(self) -> bytes:
         """If time has come writes next media frame"""
-        return self._get_frame()
+        return b''.join(part for _, packets, _ in self.get_next_frames() for packet in packets for part in packet)
+
+    def get_next_frames(self) -> List[Tuple[int, List[tuple], bool]]:
+        """If time has come returns next frame of every interleaved stream as (track id, RTP packets, keyframe).
+           Frames of UDP streams are sent right away"""
+        rc = []
+        now = time.time()
+        for key in self._streamers:
+            streamer = self._streamers[key]
+            if streamer.trick_play.forward:
+                packets = streamer.next_frame(self._reader, key, self._play_range.npt_range[1], self._verbal)
+            else:
+                packets = streamer.prev_frame(self._reader, key, self._play_range.npt_range[0], self._verbal)
+            udp = self._udp_transports.get(key)
+            if udp is not None:
+                for report in udp.receive_reports():
+                    self._on_reports(key, report)
+            if not packets:
+                continue
+            report = streamer.sender_report(now) if streamer.report_due(now) else None
+            if udp is not None:
+                udp.send(packets)
+                report and udp.send_report(report)
+            else:
+                if report:
+                    packets.append((report,))
+                rc.append((key, packets, streamer.keyframe))
+        return rc
+
+    def next_frame_time(self) -> float:
+        """Returns wallclock time when the next media frame of any stream set up and not skipped by trick play
+        is due, now if there is none"""
+        return min((streamer.next_frame_time for streamer in self._streamers.values()
+                    if streamer.synchro_source is not None and
+                    (streamer.trick_play.applicable or not streamer.trick_play.active)), default=time.time())
 
     def set_play_range(self, headers, scale):
         """Returns media duration in Clock or NPT format"""
@@ -166,6 +259,14 @@ class Session:
         """Returns video duration"""
         return self._reader.media_duration_sec
 
+    def _open(self, filename):
+        return Reader(filename)
+
+    def _play_range_sdp(self, track_id):
+        """Sets play range of the track. Returns it as SDP attribute"""
+        self._play_range = PlayRange(track_id, self._reader.media_duration_sec)
+        return 'a=range:' + self._play_range.clock
+
     def _make_video_sdp(self, track_id, stsd_boxes):
         rc: List[str] = []
         if stsd_boxes:
@@ -181,18 +282,17 @@ class Session:
 
     def _make_avc_sdp(self, track_id, avc_box):
         self._streamers[track_id] = AvcStreamer(96, (avc_box.sps, avc_box.pps))
-        self._play_range = PlayRange(track_id, self._reader.media_duration_sec)
         ret = 'a=rtpmap:96 H264/90000\r\n' + \
               'a=fmtp:96 packetization-mode=1' + \
               ';sprop-parameter-sets=' + avc_box.sprop_parameter_sets + \
               ';profile-level-id=' + \
               avc_box.profile_level_id + '\r\n' + \
-              'a=range:' + self._play_range.clock
+              self._play_range_sdp(track_id)
         return ''.join([ret, 'a=control:', str(track_id), '\r\n'])
 
     def _make_hevc_sdp(self, track_id, hevc_box):
         self._streamers[track_id] = HevcStreamer(96)
-        self._play_range = PlayRange(track_id, self._reader.media_duration_sec)
+        self._play_range_sdp(track_id)
         rc: List[str] = ['a=rtpmap:96 H265/90000\r\na=fmtp:96 ']
         for sprop_set in hevc_box.config_sets:
             if sprop_set.type.nal_unit_type == NetworkUnitType.VPS_NUT:
@@ -216,6 +316,15 @@ class Session:
                    'a=control:' + str(track_id) + '\r\n'
         return ''
 
+    def _on_reports(self, track_id, data):
+        streamer = self._streamers[track_id]
+        now = time.time()
+        for block in report_blocks(data):
+            if block.synchro_source == streamer.synchro_source:
+                streamer.on_report(block, now)
+                if self._verbal:
+                    logging.info(f'session {self._session_id} track {track_id}: {streamer.reception}')
+
     def _set_play_range_as_npt(self, values):
         """Returns media duration in NPT format"""
         self._play_range.npt = values.split('-')
@@ -236,17 +345,40 @@ class Session:
         for key in self._streamers:
             self._streamers[key].position = self._play_range.npt_range[fwd]
 
-    def _get_frame(self) -> bytes:
-        rc: List[bytes] = []
-        for key in self._streamers:
-            if self._streamers[key].trick_play.forward:
-                rc.append(self._streamers[key].next_frame(self._reader,
-                                                          key,
-                                                          self._play_range.npt_range[1],
-                                                          self._verbal))
-            else:
-                rc.append(self._streamers[key].prev_frame(self._reader,
-                                                          key,
-                                                          self._play_range.npt_range[0],
-                                                          self._verbal))
-        return b''.join(rc)
+
+class LiveSession(Session):
+    """RTSP Session of a stream published live. Frames are sent as soon as they are ingested from the latest
+    key frame on, so there is no play range to choose, no trick play and no seeking"""
+    poll_interval: float = .01  # seconds to look for new frames again
+
+    def __init__(self, content_base, source: LiveSource, verbal, loss_threshold=0., blocksize=0):
+        super().__init__(content_base, source, verbal, source.packet_cache, None, loss_threshold, blocksize)
+        if self._play_range is None and self._streamers:  # audio only
+            self._play_range_sdp(next(iter(self._streamers)))
+
+    def next_frame_time(self) -> float:
+        """Returns now if a frame of any stream set up has come, a poll interval later otherwise"""
+        streams = [key for key, streamer in self._streamers.items() if streamer.synchro_source is not None]
+        return time.time() + (0. if self._reader.pending(streams) else self.poll_interval)
+
+    def set_play_range(self, headers, scale):
+        """Starts from the latest key frame whatever range is asked"""
+        self._reader.rewind()
+        return 'Range: npt=now-\r\n'
+
+    def set_scale(self, scale):
+        """Live stream is played at normal rate only"""
+        return ''
+
+    @property
+    def duration(self):
+        """Returns live stream duration, that is unknown"""
+        return 0.
+
+    def _open(self, filename):
+        return LiveReader(filename)
+
+    def _play_range_sdp(self, track_id):
+        self._play_range = PlayRange(track_id, 0.)
+        self._play_range.npt_range[1] = math.inf
+        return 'a=range:npt=now-\r\n'
@@ -5,13 +5,14 @@ import platform
 import math
 from .reader import Reader
 from .writer import Writer
-from .atom import mdat
+from .atom import mdat, stsd
 
 
 class Segment:
     """HLS segment instance"""
     def __init__(self, sequence_number, duration):
         self.moof = []
+        self.size = 0
         self._sequence_number = sequence_number
         self._duration = duration
 
@@ -47,9 +48,14 @@ class SegmentMaker:
         kwargs['segment_url'] = path
         self._segment_duration = kwargs.get('segment_duration', 6.)
         self.media_segments = []
+        self.iframes = []  # (segment index, offset in segment, size of moof up to the key frame, duration)
         if os.path.isfile(self._filename+'.cache'):
             self._read_cache()
         self.reader = Reader(filename)
+        self.tracks = kwargs.get('tracks')  # ids of tracks to segment, all if None
+        if kwargs.get('handlers'):
+            self.tracks = set(self.track_ids(*kwargs['handlers']))
+        kwargs['tracks'] = self.tracks
         verbal = kwargs.get('verbal', False)
         if verbal:
             logging.info(self.reader)
@@ -67,39 +73,192 @@ class SegmentMaker:
         """Returns prepared MP4 metadata boxes"""
         return self.writer.initializer
 
-    def segment(self, index):
-        """Return prepared indexed segment"""
+    def iframe_playlist(self):
+        """Returns prepared HLS I-frame playlist: byte ranges of key frames within segments"""
+        return self._iframe_playlist
+
+    def master_playlist(self):
+        """Returns HLS master playlist of the media and I-frame playlists"""
+        return '#EXTM3U\n#EXT-X-VERSION:5\n#EXT-X-INDEPENDENT-SEGMENTS\n' + self.stream_inf() + self.iframe_stream_inf()
+
+    def stream_inf(self, audio=()):
+        """Returns master playlist entry of the media playlist. Audio renditions, if any, form group 'audio'"""
+        codecs = [self.codecs()] + sorted({maker.codecs() for maker in audio})
+        codecs = ','.join(codecs) if all(codecs) else ''
+        resolution = self.resolution
+        bandwidth = self.bandwidth() + max((maker.bandwidth() for maker in audio), default=0)
+        average_bandwidth = self.average_bandwidth() + max((maker.average_bandwidth() for maker in audio), default=0)
+        return f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},AVERAGE-BANDWIDTH={average_bandwidth}' + \
+            (f',CODECS="{codecs}"' if codecs else '') + \
+            (f',RESOLUTION={resolution}' if resolution else '') + \
+            (',AUDIO="audio"' if audio else '') + '\n' + \
+            self.segment_url + '.m3u8\n'
+
+    def media_inf(self, name, default=False):
+        """Returns master playlist entry of the audio playlist as a rendition of group 'audio'"""
+        language = self.language
+        return f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="{name}"' + \
+            (f',LANGUAGE="{language}"' if language and language != 'und' else '') + \
+            f',DEFAULT={"YES" if default else "NO"},AUTOSELECT=YES,URI="{self.segment_url}.m3u8"\n'
+
+    def iframe_stream_inf(self):
+        """Returns master playlist entry of the I-frame playlist, empty if there is no video"""
+        if not self.iframes:
+            return ''
+        codecs, resolution = self.codecs(('vide',)), self.resolution
+        return f'#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH={self._iframe_bandwidth()}' + \
+            (f',CODECS="{codecs}"' if codecs else '') + \
+            (f',RESOLUTION={resolution}' if resolution else '') + \
+            f',URI="{self.segment_url}_iframes.m3u8"\n'
+
+    def codecs(self, handlers=('vide', 'soun')):
+        """Returns codecs of the tracks as rfc6381 describes them, empty if any of them is not known"""
+        rc = []
+        for box in self._boxes('stsd'):
+            if box.handler not in handlers:
+                continue
+            if box.handler == 'vide' and box.video_stream_type == stsd.VideoCodecType.AVC:
+                rc.append('avc1.' + box.video_configuration_box().profile_level_id)
+            elif box.handler == 'soun' and box.entries and box.entries[0].type == 'mp4a' and box.entries[0].config:
+                rc.append('mp4a.40.' + str(int(box.entries[0].config[:2], 16) >> 3))
+            else:
+                return ''
+        return ','.join(rc)
+
+    @property
+    def dimensions(self):
+        """Returns video width and height, zeroes if there is no video"""
+        for hdlr, tkhd in zip(self._boxes('hdlr'), self._boxes('tkhd')):
+            if hdlr.handler_type == 'vide':
+                return tkhd.width >> 16, tkhd.height >> 16
+        return 0, 0
+
+    @property
+    def language(self):
+        """Returns language of the first segmented audio track, empty if there is no audio"""
+        for hdlr, mdhd in zip(self._boxes('hdlr'), self._boxes('mdhd')):
+            if hdlr.handler_type == 'soun':
+                return mdhd.language
+        return ''
+
+    def track_ids(self, *handlers):
+        """Returns ids of tracks of the handler types in the file"""
+        return [track.find_inner_boxes('tkhd')[0].track_id for track in self.reader.find_box('trak')
+                if track.find_inner_boxes('hdlr')[0].handler_type in handlers]
+
+    def _boxes(self, box_type):
+        """Returns boxes of the type, one for every segmented track"""
+        return [track.find_inner_boxes(box_type)[0] for track in self.reader.find_box('trak')
+                if self.tracks is None or track.find_inner_boxes('tkhd')[0].track_id in self.tracks]
+
+    @property
+    def resolution(self):
+        """Returns video resolution as WIDTHxHEIGHT, empty if there is no video"""
+        width, height = self.dimensions
+        return f'{width}x{height}' if width else ''
+
+    def segment_size(self, index):
+        """Returns size of indexed segment"""
         if index >= len(self.media_segments):
             raise ValueError
-        ret = bytes()
-        for moof in self.media_segments[index].moof:
-            ret += moof.to_bytes()
+        return self.media_segments[index].size
+
+    def segment(self, index, start=0, end=None):
+        """Return prepared indexed segment or its byte range. Only samples within the range are read"""
+        if index >= len(self.media_segments):
+            raise ValueError
+        segment = self.media_segments[index]
+        end = segment.size if end is None else min(end, segment.size)
+        rc = []
+        position = 0
+        for moof in segment.moof:
+            samples = [sample for trun in moof.find_inner_boxes('trun') for sample in trun.samples]
             mdat_box = mdat.Box(type='mdat')
-            trun_box = moof.find_inner_boxes('trun')
-            for trun in trun_box:
-                for sample in trun.samples:
-                    mdat_box.append(self.reader.sample(sample.initial_offset, sample.size))
-            ret += mdat_box.to_bytes()
-        return ret
+            mdat_box.size += sum(sample.size for sample in samples)
+            header = moof.to_bytes() + mdat_box.to_bytes()
+            for piece, size in [(header, len(header))] + [(sample, sample.size) for sample in samples]:
+                if position >= end:
+                    return b''.join(rc)
+                if position + size > start:
+                    first, last = max(start - position, 0), min(end - position, size)
+                    if isinstance(piece, bytes):
+                        rc.append(piece[first:last])
+                    else:
+                        rc.append(self.reader.sample(piece.initial_offset + first, last - first))
+                position += size
+        return b''.join(rc)
+
+    def bandwidth(self):
+        """Returns peak bit rate of segments"""
+        return max((int(segment.size * 8 / segment.duration) for segment in self.media_segments if segment.duration),
+                   default=0)
+
+    def average_bandwidth(self):
+        """Returns average bit rate of segments"""
+        duration = sum(segment.duration for segment in self.media_segments)
+        return int(sum(segment.size for segment in self.media_segments) * 8 / duration) if duration else 0
+
+    def _iframe_bandwidth(self):
+        """Returns peak bit rate of I-frame playlist"""
+        return max((int(size * 8 / duration) for _, _, size, duration in self.iframes if duration), default=0)
 
     def _prepare_playlist(self, **kwargs):
         self.writer = Writer(self.reader, **kwargs)
-        segment = Segment(0, .0)
+        self._fragments = []  # (moof, mdat size, duration)
         while True:
             try:
                 moof_box, mdat_box, duration = self.writer.fragment_moof()
-                if mdat_box.size > 0:
-                    segment.moof.append(moof_box)
-                    segment.duration += duration
-                    if segment.duration > self._segment_duration or self.writer.last_chunk is True:
-                        if self.target_duration < segment.duration:
-                            self.target_duration = segment.duration
-                        self.media_segments.append(segment)
-                        segment = Segment(segment.sequence_number + 1, .0)
+                if not mdat_box.empty():
+                    self._fragments.append((moof_box, mdat_box.size, duration))
                 if self.writer.last_chunk:
                     break
             except StopIteration:
                 break
+        if not kwargs.get('deferred'):
+            self.split()
+
+    def fragment_durations(self):
+        """Returns durations of fragments in seconds"""
+        return [duration for _, _, duration in self._fragments]
+
+    def fragment_ends(self):
+        """Returns end times of fragments in milliseconds, every one is a key frame time of the next fragment"""
+        rc, end = [], 0.
+        for _, _, duration in self._fragments:
+            end += duration
+            rc.append(round(end * 1000))
+        return rc
+
+    def split(self, boundaries=None):
+        """Groups fragments into segments and prepares playlists. Segments end with the first fragments reaching
+           the boundaries (times in milliseconds) if given, else as soon as they are longer than the floor"""
+        self.media_segments, self.iframes, self.target_duration = [], [], .0
+        video = any(box.handler_type == 'vide' for box in self._boxes('hdlr'))
+        pending = iter(sorted(boundaries)) if boundaries is not None else None
+        boundary = next(pending, None) if pending is not None else None
+        segment = Segment(0, .0)
+        ends = self.fragment_ends()
+        for (moof_box, mdat_size, duration), end in zip(self._fragments, ends):
+            trun_box = moof_box.find_inner_boxes('trun')
+            if video and trun_box and trun_box[0].samples:  # fragment starts with a key frame of video
+                self.iframes.append((len(self.media_segments),
+                                     segment.size,
+                                     moof_box.full_size() + 8 + trun_box[0].samples[0].size,
+                                     duration))
+            segment.moof.append(moof_box)
+            segment.size += moof_box.full_size() + mdat_size
+            segment.duration += duration
+            if pending is None:
+                complete = segment.duration > self._segment_duration
+            else:
+                complete = boundary is not None and end >= boundary
+                while boundary is not None and end >= boundary:
+                    boundary = next(pending, None)
+            if complete or end == ends[-1]:
+                if self.target_duration < segment.duration:
+                    self.target_duration = segment.duration
+                self.media_segments.append(segment)
+                segment = Segment(segment.sequence_number + 1, .0)
         self._media_playlist = '#EXTM3U\n#EXT-X-VERSION:5\n' \
             '#EXT-X-TARGETDURATION:'+str(math.ceil(self.target_duration)) + \
             '\n#EXT-X-PLAYLIST-TYPE:VOD\n' + \
@@ -109,6 +268,16 @@ class SegmentMaker:
                 '#EXTINF:' + "{:.3f}".format(segment.duration) + '\n' + \
                 self.segment_url + '_sn' + str(segment.sequence_number) + '.m4s\n'
         self._media_playlist += '#EXT-X-ENDLIST\n'
+        self._iframe_playlist = '#EXTM3U\n#EXT-X-VERSION:5\n' \
+            '#EXT-X-TARGETDURATION:' + str(math.ceil(max((k[3] for k in self.iframes), default=0))) + \
+            '\n#EXT-X-PLAYLIST-TYPE:VOD\n#EXT-X-I-FRAMES-ONLY\n' + \
+            '#EXT-X-MAP:URI='+self.segment_url+'_init.mp4\n'
+        for index, offset, size, duration in self.iframes:
+            self._iframe_playlist += \
+                '#EXTINF:' + "{:.3f}".format(duration) + ',\n' + \
+                '#EXT-X-BYTERANGE:' + str(size) + '@' + str(offset) + '\n' + \
+                self.segment_url + '_sn' + str(self.media_segments[index].sequence_number) + '.m4s\n'
+        self._iframe_playlist += '#EXT-X-ENDLIST\n'
 
     def _cache(self):
         with open(self._filename+'.cache', 'wb') as file:
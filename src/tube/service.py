@@ -1,5 +1,6 @@
 """Network service to receive requests"""
 import getopt
+import ipaddress
 import logging
 import multiprocessing
 import  platform
@@ -10,6 +11,8 @@ from .handler import handler
 from http.server import HTTPServer
 from socketserver import ThreadingMixIn
 from .tcp.service import Service as TcpService
+from .tcp.aio_service import Service as AioTcpService
+from .rtsp.output import FrameFilter
 
 
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
@@ -47,21 +50,36 @@ class Service:
         print("params:\n\t-p(--ports) ports to bind[http,https,rtsp] (def 4555,4556,4557)\n\t"
               "-r(--root) files directory(req)\n\t"
               "-s(--segment) segment duration floor\n\t"
-              "-c(--cache) cache segmentation as .*.cache files\n\t"
+              "-c(--cache) cache segmentation as .*.cache files and rtp packetization as .*.rtp files\n\t"
+              "-t(--part) ll-hls part duration of live rtmp ingest (def 0.5)\n\t"
+              "-f(--faststart) write moov of mp4 recordings of rtmp ingest before media data\n\t"
+              "-g(--fragmented) sec[:MB] record rtmp ingest as fragmented mp4 rotated by duration or size, 0 - never\n\t"
+              "-i(--ingest) MB[:MB] rtmp ingest waiting to be written per connection[:process] to pause reads (def 32:256)\n\t"
+              "-x(--demux) serve audio and video of hls master playlists and mpeg-dash apart\n\t"
               "-b(--basic) user:password@realm (use Basic Authorization)\n\t"
               "-d(--digest) user:password@realm (use Digest Authorization)\n\t"
               "-k(--keys) directory with key.pem and cert.pem files (req. for https)\n\t"
+              "-e(--engine) rtsp network engine: selector|asyncio (def selector)\n\t"
+              "-m(--multicast) group[/ttl] first multicast group of rtsp broadcast (def ttl 16)\n\t"
+              "-a(--packets) MB[:MB] rtp packet cache per file[:process], 0 - off (def 64:256)\n\t"
+              "-z(--blocksize) rtp packet size over rtsp interleaved tcp (def 1486)\n\t"
+              "-l(--loss) percent of reported rtp loss to drop non-reference video frames (def off)\n\t"
+              "-q(--queue) rtsp client output limit in KB[:wait|drop] (def 4096:wait)\n\t"
               "-v(--verb) be verbose\n\t"
               "-h(--help) this help")
 
     def __init__(self):
         self.segment_makers = {}
+        self.ladders = {}
 
     def run(self, ports, params, server_class=ThreadedHTTPServer):
         """Starts http server"""
         logging.basicConfig(level=logging.INFO)
         params['segment_makers'] = self.segment_makers
-        tcp_server = TcpService(('', ports[2]), params)
+        params['ladders'] = self.ladders
+        params['rtsp_port'] = ports[2]
+        tcp_service_class = AioTcpService if params.get('engine') == 'asyncio' else TcpService
+        tcp_server = tcp_service_class(('', ports[2]), params)
         http_server = server_class(('', ports[0]), handler(params))
         ssl_key_folder = params.get('keys')
         https_server = None
@@ -86,7 +104,7 @@ def start():
     argv = sys.argv[1:]
     try:
         opts, args = getopt.getopt(argv,
-                                   "hp:r:s:b:d:ck:v",
+                                   "hp:r:s:b:d:ck:ve:q:m:a:l:z:xt:fg:i:",
                                    ["help",
                                     "ports=",
                                     "root=",
@@ -94,8 +112,19 @@ def start():
                                     "basic=",
                                     "digest=",
                                     "cache",
+                                    "demux",
+                                    "part=",
+                                    "faststart",
+                                    "fragmented=",
+                                    "ingest=",
                                     "keys=",
-                                    "verb"])
+                                    "verb",
+                                    "engine=",
+                                    "queue=",
+                                    "multicast=",
+                                    "packets=",
+                                    "loss=",
+                                    "blocksize="])
         if args:
             Service.print_options()
             sys.exit()
@@ -128,6 +157,41 @@ def start():
                 params['keys'] = arg
             elif opt in ('-v', '--verb'):
                 params['verb'] = True
+            elif opt in ('-e', '--engine'):
+                if arg not in ('selector', 'asyncio'):
+                    raise ValueError(f'unknown engine {arg}')
+                params['engine'] = arg
+            elif opt in ('-q', '--queue'):
+                limit, _, policy = arg.partition(':')
+                params['queue_limit'] = int(limit) * 1024
+                if policy:
+                    if policy not in FrameFilter.policies:
+                        raise ValueError(f'unknown frame drop policy {policy}')
+                    params['drop_policy'] = policy
+            elif opt in ('-m', '--multicast'):
+                group, _, ttl = arg.partition('/')
+                if not ipaddress.IPv4Address(group).is_multicast:
+                    raise ValueError(f'{group} is not a multicast address')
+                params['multicast'] = (group, int(ttl) if ttl else 16)
+            elif opt in ('-l', '--loss'):
+                params['loss_threshold'] = float(arg) / 100.
+            elif opt in ('-z', '--blocksize'):
+                params['blocksize'] = int(arg)
+            elif opt in ('-t', '--part'):
+                params['part'] = float(arg)
+            elif opt in ('-f', '--faststart'):
+                params['faststart'] = True
+            elif opt in ('-g', '--fragmented'):
+                duration, _, size = arg.partition(':')
+                params['fragmented'] = (float(duration), int(size or 0) * 1024 * 1024)
+            elif opt in ('-i', '--ingest'):
+                connection, _, process = arg.partition(':')
+                params['ingest_limit'] = (int(connection) * 1024 * 1024, int(process or 0) * 1024 * 1024)
+            elif opt in ('-x', '--demux'):
+                params['demux'] = True
+            elif opt in ('-a', '--packets'):
+                file, _, process = arg.partition(':')
+                params['packet_cache'] = (int(file) * 1024 * 1024, int(process or 0) * 1024 * 1024)
     except ValueError as error:
         print(error)
         Service.print_options()
@@ -0,0 +1,148 @@
+"""Network RTSP service based on asyncio event loop"""
+import asyncio
+import itertools
+import logging
+import time
+import types
+from .connection import Connection
+from .service import Service as SelectorService
+
+
+class Protocol(asyncio.Protocol):
+    """Manages RTSP protocol network activity of one connection on asyncio transport"""
+    write_buffer_high: int = 1024 * 1024
+    write_buffer_low: int = 256 * 1024
+    read_poll_interval: float = .01  # seconds to check if paused reads may resume
+
+    def __init__(self, params):
+        self._params = params
+        self._loop = asyncio.get_event_loop()
+        self._transport = None
+        self._key = None
+        self._connection = None
+        self._timer = None
+        self._writing_paused = False
+        self._reading_paused = False
+
+    def connection_made(self, transport):
+        """Prepares connection to manage network activity"""
+        self._transport = transport
+        self._transport.set_write_buffer_limits(high=self.write_buffer_high, low=self.write_buffer_low)
+        address = transport.get_extra_info('peername')
+        self._key = types.SimpleNamespace(fileobj=None,
+                                          data=types.SimpleNamespace(addr=address,
+                                                                     inb=b'',
+                                                                     outb=b'',
+                                                                     transport=transport))
+        self._connection = Connection(address, self._params)
+
+    def data_received(self, data):
+        """Manages read transport event"""
+        try:
+            self._connection.on_data(self._key, data)
+        except Exception as e:  # noqa # pylint: disable=bare-except
+            print(f'Exception: {e}')
+            self._transport.close()
+            return
+        self._flush()
+        self._schedule()
+        if not self._reading_paused and not self._connection.reading():
+            self._transport.pause_reading()
+            self._reading_paused = True
+            self._loop.call_later(self.read_poll_interval, self._resume_reading)
+
+    def connection_lost(self, exc):
+        """Stops streaming on closed transport"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._connection.close()
+        print('connection to', self._key.data.addr, 'closed')
+
+    def pause_writing(self):
+        """Stops streaming (or starts dropping frames) while transport write buffer is above high watermark"""
+        self._writing_paused = True
+        if not self._dropping() and self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def resume_writing(self):
+        """Continues streaming as transport write buffer drains below low watermark"""
+        self._writing_paused = False
+        self._schedule()
+
+    def _resume_reading(self):
+        """Resumes reads once the connection may read, checks again later otherwise"""
+        if self._transport.is_closing():
+            return
+        if self._connection.reading():
+            self._reading_paused = False
+            self._transport.resume_reading()
+        else:
+            self._loop.call_later(self.read_poll_interval, self._resume_reading)
+
+    def _flush(self):
+        if self._key.data.outb:
+            self._transport.write(self._key.data.outb)
+            self._key.data.outb = b''
+
+    def _streaming(self):
+        specific = self._connection.specific
+        return specific is not None and getattr(specific, 'playing', False)
+
+    def _dropping(self):
+        frame_filter = getattr(self._connection.specific, 'frame_filter', None)
+        return frame_filter is not None and frame_filter.policy == 'drop'
+
+    def _schedule(self, idle=False):
+        """Plans next frame sending in accordance with frame timing"""
+        if self._timer or not self._streaming():
+            return
+        if self._writing_paused and not self._dropping():
+            return
+        delay = self._connection.specific.next_frame_time() - time.time()
+        if delay <= 0. and idle:  # nothing was due or play range is over
+            delay = .01
+        self._timer = self._loop.call_at(self._loop.time() + max(delay, 0.), self._on_frame_time)
+
+    def _on_frame_time(self):
+        self._timer = None
+        if self._transport.is_closing() or not self._streaming():
+            return
+        specific = self._connection.specific
+        frames = specific.get_next_frames()
+        for stream, packets, keyframe in frames:
+            if specific.frame_filter.accept(stream, keyframe, self._writing_paused):
+                self._transport.writelines(itertools.chain.from_iterable(packets))
+        if getattr(specific, 'finished', False):  # the stream has ended, queued data is sent before closing
+            self._transport.close()
+            return
+        self._schedule(idle=not frames)
+
+
+class Service(SelectorService):
+    """Manages RTSP protocol network activity on asyncio event loop"""
+    def run(self) -> None:
+        """Starts managing RTSP protocol network activity"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = None
+        while server is None:
+            try:
+                server = loop.run_until_complete(
+                    loop.create_server(lambda: Protocol(self._params), *self._bind_address)
+                )
+            except OSError:
+                time.sleep(2)
+        logging.info('Ok')
+        try:
+            loop.run_until_complete(self._serve())
+        except KeyboardInterrupt:
+            self._stop()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+    async def _serve(self):
+        while self._is_running():
+            await asyncio.sleep(.5)
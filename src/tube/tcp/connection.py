@@ -1,21 +1,75 @@
 """Base class for any protocol connection"""
 from ..rtsp.connection import Connection as RtspConnection
 from ..rtmp.connection import Connection as RtmpConnection
+from ..fmp4.connection import Connection as Fmp4Connection
 
 
 class Connection:
+    """Reads the socket into a reusable buffer. Reads grow up to max_read_size while they come full
+    and shrink back while they come mostly empty. Protocol connections get a memoryview of the buffer,
+    valid until the next read, and copy whatever they keep"""
+    min_read_size: int = 2048
+    max_read_size: int = 256 * 1024
+    shrink_after: int = 16  # mostly empty reads in a row
+
     def __init__(self, address, params):
         self._address = address
         self._params = params
         self._specific = None
+        self._prefix = b''
+        self._buffer = bytearray(self.min_read_size)
+        self._view = memoryview(self._buffer)
+        self._short_reads = 0
 
     def on_read_event(self, key):
-        data = key.fileobj.recv(2048)  # Should be ready to read
+        size = key.fileobj.recv_into(self._view)  # Should be ready to read
+        self.on_data(key, self._view[:size])
+        self._adapt_read_size(size)
+
+    def _adapt_read_size(self, size):
+        """Doubles the buffer on a full read, halves it after a run of reads filling less than a quarter"""
+        capacity = len(self._buffer)
+        if size == capacity:
+            self._short_reads = 0
+            if capacity < self.max_read_size:
+                self._resize(min(capacity * 2, self.max_read_size))
+        elif size < capacity // 4 and capacity > self.min_read_size:
+            self._short_reads += 1
+            if self._short_reads >= self.shrink_after:
+                self._short_reads = 0
+                self._resize(max(capacity // 2, self.min_read_size))
+        else:
+            self._short_reads = 0
+
+    def _resize(self, size):
+        self._buffer = bytearray(size)  # a new one, views handed out may still be referenced
+        self._view = memoryview(self._buffer)
+
+    def on_data(self, key, data):
         if not self._specific:
+            if not data:
+                raise EOFError()
+            # the first request may arrive split into several reads
+            data = self._prefix + data
             self._guess_protocol(data)
+            self._prefix = data[:4096] if not self._specific and data.find(b'\r\n\r\n') < 0 else b''
         if self._specific:
             self._specific.on_read_event(key, data)
 
+    def close(self):
+        close = getattr(self._specific, 'close', None)
+        if close:
+            close()
+
+    @property
+    def specific(self):
+        return self._specific
+
+    def reading(self):
+        """Verifies if the socket may be read, the protocol connection may pause reads of ingest over budget"""
+        reading = getattr(self._specific, 'reading', None)
+        return reading() if reading else True
+
     def on_write_event(self, key):
         if self._specific:
             self._specific.on_write_event(key)
@@ -23,5 +77,7 @@ class Connection:
     def _guess_protocol(self, data):
         if data.find(b'RTSP/1.') > 0:
             self._specific = RtspConnection(self._address, self._params)
+        elif data.find(b'HTTP/1.') > 0:
+            self._specific = Fmp4Connection(self._address, self._params)
         elif data[0] == 3 and len(data) == 1537:
             self._specific = RtmpConnection(self._address, self._params)
@@ -13,6 +13,7 @@ class Service(multiprocessing.Process):
     def __init__(self, bind_address, params):
         self._running = True
         self._connections = {}
+        self._paused = {}  # sockets of connections with reads paused by address
         super().__init__()
         self._bind_address = bind_address
         self._params = params
@@ -34,6 +35,7 @@ class Service(multiprocessing.Process):
         logging.info('Ok')
         while self._is_running():
             try:
+                self._resume_reads(selector)
                 for key, mask in selector.select(timeout=.01):
                     if key.data is None:
                         sock, address = key.fileobj.accept()
@@ -45,11 +47,13 @@ class Service(multiprocessing.Process):
                     else:
                         try:
                             self._on_event(key, mask)
+                            self._pause_reads(selector, key)
                         except Exception as e:  # noqa # pylint: disable=bare-except
                             print(f'Exception: {e}')
                             selector.unregister(key.fileobj)
                             key.fileobj.close()
-                            del self._connections[key.data.addr]
+                            self._paused.pop(key.data.addr, None)
+                            self._connections.pop(key.data.addr).close()
                             print('connection to', key.data.addr, 'closed')
             except KeyboardInterrupt:
                 self._stop()
@@ -72,6 +76,20 @@ class Service(multiprocessing.Process):
         with self._lock:
             self._running = False
 
+    def _pause_reads(self, selector, key):
+        """Drops read interest of the connection while it may not read"""
+        connect = self._connections.get(key.data.addr, None)
+        if connect and key.data.addr not in self._paused and not connect.reading():
+            selector.modify(key.fileobj, selectors.EVENT_WRITE, key.data)
+            self._paused[key.data.addr] = key.fileobj
+
+    def _resume_reads(self, selector):
+        """Restores read interest of connections that may read again"""
+        for address, sock in list(self._paused.items()):
+            if self._connections[address].reading():
+                selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, selector.get_key(sock).data)
+                del self._paused[address]
+
     def _on_event(self, key, mask):
         """Manages event read/write on socket"""
         connect = self._connections.get(key.data.addr, None)
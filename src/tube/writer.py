@@ -11,6 +11,9 @@ class Writer:
         self._sequence_number = 0
         self._initializer = {}
         self._reader = reader
+        self._tracks = kwargs.get('tracks')  # ids of tracks to write, all if None
+        self._fragment_durations = iter(kwargs.get('fragment_durations', ()))  # cut fragments without video track
+        self._fragment_ends, self._track_times = {}, {}  # audio track times in seconds
         self._initializer = self._set_ftyp(kwargs.get('brands')) + self._set_moov()
         self.adaptation_set.segment_url = kwargs.get('segment_url')
         self.first_video_frame = trun.Frame()
@@ -51,6 +54,8 @@ class Writer:
         self._stts_params = {}  # (track_id, hdlr, stts)
         stts_params_key = 1
         for track in self._reader.find_box('trak'):
+            if self._tracks is not None and track.find_inner_boxes('tkhd')[0].track_id not in self._tracks:
+                continue
             moov.add_inner_box(self._set_track(track, stts_params_key))
             if stts_params_key in self._stts_params.keys():
                 stts_params_key += 1
@@ -75,6 +80,8 @@ class Writer:
                                     hdlr.handler_type,
                                     initial_track.find_inner_boxes('stts')[0])
         elif hdlr.handler_type == 'soun' or hdlr.handler_type == 'text':
+            if hdlr.handler_type == 'soun' and not hasattr(self, 'adaptation_set'):
+                self.adaptation_set = AdaptationSet(tkhd, mdhd_box, 'audio/mp4')
             self._stts_params[stts_params_key] = (tkhd.track_id,
                                                   hdlr.handler_type,
                                                   initial_track.find_inner_boxes('stts')[0])
@@ -109,6 +116,8 @@ class Writer:
             tfhd.Flags.DEFAULT_SAMPLE_FLAGS_PRESENT
         trun_boxes = {}
         mdat_size = {}
+        if 0 not in self._stts_params:  # no video track to cut fragment by its key frames
+            chunk_duration = next(self._fragment_durations, float('inf'))
         for key in sorted(self._stts_params.keys()):
             track_id, hdlr, stts_box = self._stts_params[key]
             traf_box = Box(type='traf')
@@ -147,10 +156,12 @@ class Writer:
                                           trun_boxes[track_id],
                                           mdat_box)
             elif hdlr == 'soun':
-                mdat_size[track_id] = self._set_audio_sample(track_id,
-                                                             trun_boxes[track_id],
-                                                             mdat_box,
-                                                             chunk_duration)
+                mdat_size[track_id], audio_duration = self._set_audio_sample(track_id,
+                                                                             trun_boxes[track_id],
+                                                                             mdat_box,
+                                                                             chunk_duration)
+                if 0 not in self._stts_params:
+                    chunk_duration = audio_duration
             elif hdlr == 'text':
                 mdat_size[track_id] = self._set_text_sample(track_id,
                                                             trun_boxes[track_id],
@@ -178,6 +189,7 @@ class Writer:
                                     initial_offset=self.first_video_frame.offset)
             fragment_mdat.append(self.first_video_frame.data)
             chunk_size += self.first_video_frame.size
+            chunk_duration += self.first_video_frame.duration
         while True:
             try:
                 video_frame = self._reader.next_sample(track_id)
@@ -205,21 +217,28 @@ class Writer:
         return chunk_size, chunk_duration
 
     def _set_audio_sample(self, track_id, trun_box, fragment_mdat, chunk_duration):
+        """Takes audio up to the end of the fragment counted from the track start, so that audio does not drift
+           from video. Returns size and duration of the samples"""
         sample_size = 0
         duration = 0
-        while duration < chunk_duration:
+        timescale = self._reader.media_header[track_id].timescale
+        self._fragment_ends[track_id] = self._fragment_ends.get(track_id, 0.) + chunk_duration
+        while self._track_times.get(track_id, 0.) < self._fragment_ends[track_id]:
             try:
                 sample = self._reader.next_sample(track_id)
                 if not self.last_chunk:
-                    duration += sample.duration / self._reader.media_header[track_id].timescale
+                    self._track_times[track_id] = self._track_times.get(track_id, 0.) + sample.duration / timescale
                 trun_box.add_sample(size=sample.size,
                                     duration=sample.duration,
                                     initial_offset=sample.offset)
                 fragment_mdat.append(sample.data)
                 sample_size += sample.size
+                duration += sample.duration / timescale
             except IndexError:
+                if 0 not in self._stts_params:
+                    self.last_chunk = True
                 break
-        return sample_size
+        return sample_size, duration
 
     def _set_text_sample(self, track_id, trun_box, fragment_mdat, chunk_duration):
         size = 0
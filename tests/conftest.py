@@ -0,0 +1,40 @@
+"""Titles and services shared by tests"""
+import socket
+import pytest
+from tube.atom import avcc
+from tube.mp4sink import Mp4Sink
+
+SPS = b'\x67\x42\xc0\x1e\xd9\x00\xa0\x47\xfe\xc8'
+PPS = b'\x68\xce\x3c\x80'
+IDR_SLICE = b'\x65\x88\x80\x00'  # first macroblock 0, slice type 7, picture parameter set 0
+P_SLICE = b'\x41\x9a\x80\x00'  # slice type 5
+
+
+def video_config():
+    """Returns avcC box of the test stream"""
+    return avcc.Box(initial=b'\x01' + SPS[1:4], u_length=4, sps=[SPS], pps=[PPS])
+
+
+def publish_video(sink, frames=100):
+    """Feeds the sink 25 fps of video, a key frame a second"""
+    sink.on_video_config(video_config())
+    for i in range(frames):
+        keyframe = i % 25 == 0
+        sink.on_video_frame(i * 40, 0, keyframe, b'\x00\x00\x00\x04' + (IDR_SLICE if keyframe else P_SLICE))
+
+
+@pytest.fixture
+def title(tmp_path):
+    """Records <tmp_path>/clip.mp4 of four seconds of video, returns the root"""
+    sink = Mp4Sink(str(tmp_path))
+    sink.on_publish('clip')
+    publish_video(sink)
+    sink.close()
+    return str(tmp_path)
+
+
+@pytest.fixture
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,54 @@
+"""AMF0 and AMF3 values"""
+import pytest
+from tube.rtmp.messages import amf0, amf3
+
+
+@pytest.mark.parametrize('value', [None, True, False, 0, -1, 2.5, '', 'name', 'чат',
+                                   b'\x00\x01', [1, 'a', None], amf3.Date(1.5e12), amf3.Xml('<a/>'),
+                                   {'width': 1280, 'codec': 'avc1', 'nested': {'codec': 'avc1'}}])
+def test_amf3_round_trip(value):
+    data = amf3.Encoder().encode(value)
+    decoded, end = amf3.Decoder().decode(memoryview(data))
+    assert decoded == value and end == len(data)
+
+
+def test_amf3_integers_out_of_29_bits_are_doubles():
+    for value in (1 << 28, -(1 << 28) - 1):
+        decoded, _ = amf3.Decoder().decode(memoryview(amf3.Encoder().encode(value)))
+        assert decoded == value and isinstance(decoded, float)
+    assert isinstance(amf3.Decoder().decode(memoryview(amf3.Encoder().encode((1 << 28) - 1)))[0], int)
+
+
+def test_amf3_repeated_strings_are_references():
+    data = amf3.Encoder().encode(['codec', 'codec'])
+    assert data.count(b'codec') == 1
+    assert amf3.Decoder().decode(memoryview(data))[0] == ['codec', 'codec']
+
+
+def test_amf3_object_keeps_class_name():
+    decoded, _ = amf3.Decoder().decode(memoryview(amf3.Encoder().encode(amf3.Object({'a': 1}, class_name='Point'))))
+    assert decoded == {'a': 1} and decoded.class_name == 'Point'
+
+
+@pytest.mark.parametrize('data', [b'\xff', b'\x06'])
+def test_amf3_malformed_data_is_rejected(data):
+    with pytest.raises((amf3.Amf3Exception, IndexError)):
+        amf3.Decoder().decode(memoryview(data))
+
+
+def test_amf0_values_decode_at_offsets():
+    values = [amf0.String('connect'), amf0.Number(1.), amf0.Object({'app': amf0.String('live')}), amf0.Null(),
+              amf0.Boolean(True)]
+    data = b''.join(value.to_bytes() for value in values)
+    offset, decoded = 0, []
+    while offset < len(data):
+        value, offset = amf0.Type.decode(memoryview(data), offset)
+        decoded.append(value)
+    assert [type(value) for value in decoded] == [type(value) for value in values]
+    assert [len(value) for value in decoded] == [len(value.to_bytes()) for value in values]
+    assert decoded[0].value == 'connect' and decoded[1].value == 1. and decoded[2].value['app'].value == 'live'
+
+
+def test_amf0_unsupported_marker_is_rejected():
+    with pytest.raises(amf0.Amf0Exception):
+        amf0.Type.make(b'\x7f')
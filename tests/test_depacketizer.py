@@ -0,0 +1,66 @@
+"""Access units put back together from RTP packets"""
+import struct
+import pytest
+from tube.rtp.depacketizer import AacDepacketizer, AvcDepacketizer, DepacketizerException, HevcDepacketizer
+
+SPS = b'\x67\x42\xc0\x1e\xd9\x00\xa0\x47\xfe\xc8'
+PPS = b'\x68\xce\x3c\x80'
+
+
+def _packet(sequence_number, timestamp, payload, marker=False):
+    return memoryview(struct.pack('>BBHII', 0x80, 96 | (0x80 if marker else 0), sequence_number, timestamp, 1)
+                      + payload)
+
+
+class Units:
+    def __init__(self):
+        self.units, self.parameter_sets = [], []
+
+    def __call__(self, *args):
+        self.units.append(tuple(bytes(arg) if isinstance(arg, memoryview) else arg for arg in args))
+
+    def on_parameter_set(self, nal_type, nal):
+        self.parameter_sets.append((nal_type, nal))
+
+
+def test_avc_aggregation_and_fragmentation():
+    units = Units()
+    depacketizer = AvcDepacketizer(units, units.on_parameter_set)
+    stap_a = b'\x18' + len(SPS).to_bytes(2, 'big') + SPS + len(PPS).to_bytes(2, 'big') + PPS
+    idr = b'\x65' + bytes(range(200))
+    depacketizer.on_packet(_packet(1, 3000, stap_a))
+    depacketizer.on_packet(_packet(2, 3000, b'\x7c\x85' + idr[1:100]))  # FU-A start
+    depacketizer.on_packet(_packet(3, 3000, b'\x7c\x45' + idr[100:], True))  # FU-A end
+    assert units.parameter_sets == [(7, SPS), (8, PPS)]
+    assert units.units == [(3000, True, b''.join(len(nal).to_bytes(4, 'big') + nal for nal in (SPS, PPS, idr)))]
+
+
+def test_avc_sequence_gap_drops_the_unit():
+    units = Units()
+    depacketizer = AvcDepacketizer(units)
+    depacketizer.on_packet(_packet(1, 3000, b'\x7c\x85' + bytes(10)))
+    depacketizer.on_packet(_packet(3, 3000, b'\x7c\x45' + bytes(10), True))
+    depacketizer.on_packet(_packet(4, 6000, b'\x41\x9a', True))
+    assert depacketizer.lost == 1 and depacketizer.dropped == 1
+    assert units.units == [(6000, False, b'\x00\x00\x00\x02\x41\x9a')]
+
+
+def test_hevc_single_nal_unit():
+    units = Units()
+    depacketizer = HevcDepacketizer(units)
+    depacketizer.on_packet(_packet(1, 3000, b'\x26\x01\xaf', True))  # IDR_W_RADL
+    assert units.units == [(3000, True, b'\x00\x00\x00\x03\x26\x01\xaf')]
+
+
+def test_aac_access_units_of_one_packet():
+    units = Units()
+    depacketizer = AacDepacketizer(units)
+    frames = [b'\x21' * 5, b'\x22' * 7]
+    headers = b''.join((len(frame) << 3).to_bytes(2, 'big') for frame in frames)
+    depacketizer.on_packet(_packet(1, 1024, (len(headers) * 8).to_bytes(2, 'big') + headers + b''.join(frames), True))
+    assert units.units == [(1024, frames[0]), (2048, frames[1])]
+
+
+def test_malformed_rtp_is_rejected():
+    with pytest.raises(DepacketizerException):
+        AvcDepacketizer(Units()).on_packet(memoryview(bytes(8)))
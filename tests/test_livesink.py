@@ -0,0 +1,16 @@
+"""Live playlist of ingest"""
+import os
+from conftest import publish_video
+from tube.livesink import LiveSink
+
+
+def test_republished_stream_is_cut_again(tmp_path):
+    sink = LiveSink(str(tmp_path), 1., .5)
+    for _ in range(2):
+        sink.on_publish('cam')
+        publish_video(sink, 30)
+        sink.close()
+    with open(os.path.join(str(tmp_path), 'cam.live', LiveSink.playlist)) as f:
+        playlist = f.read()
+    assert '#EXT-X-PART:' in playlist and playlist.endswith('#EXT-X-ENDLIST\n')
+    assert os.path.isfile(os.path.join(str(tmp_path), 'cam.live', '0.m4s'))
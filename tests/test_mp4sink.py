@@ -0,0 +1,22 @@
+"""Recording of ingest through a writer thread"""
+import os
+import time
+from conftest import publish_video
+from tube.diskwriter import DiskWriter, IngestBudget
+from tube.mp4sink import FragmentedMp4Sink
+
+
+def test_fragmented_publish_through_writer_thread(tmp_path):
+    writer = DiskWriter(IngestBudget())
+    sink = FragmentedMp4Sink(str(tmp_path), writer=writer)
+    sink.on_publish('live/cam')
+    publish_video(sink, 60)
+    sink.close()
+    writer.close()
+    filename = os.path.join(str(tmp_path), 'live', 'cam.mp4')
+    for _ in range(100):
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            break
+        time.sleep(.01)
+    with open(filename, 'rb') as f:
+        assert f.read(8)[4:] == b'ftyp'
@@ -0,0 +1,29 @@
+"""Packetization plans of titles"""
+import os
+from tube.rtp import plan
+
+UNITS = [(4, 100, 5, [(0, b'\x7c\x85', 5, 50), (1, b'\x7c\x45', 50, 104)])]
+
+
+def test_plan_is_saved_once_released(tmp_path):
+    title = os.path.join(str(tmp_path), 'a.mp4')
+    with open(title, 'wb') as f:
+        f.write(bytes(1000))
+    packetization_plan = plan.title_plan(title, True)
+    packetization_plan.put(1, 0, 1400, UNITS)
+    assert packetization_plan.get(1, 0, 1400) == UNITS
+    assert not os.path.exists(title + '.rtp')
+    plan.release(packetization_plan)
+    assert plan.title_plan(title, True).get(1, 0, 1400) == UNITS
+
+
+def test_plan_is_bounded(tmp_path):
+    title = os.path.join(str(tmp_path), 'a.mp4')
+    with open(title, 'wb') as f:
+        f.write(bytes(1000))
+    packetization_plan = plan.PacketizationPlan(title, limit=100)
+    for offset in range(5):
+        packetization_plan.put(1, offset, 1400, UNITS)
+    assert packetization_plan.size <= 100
+    assert packetization_plan.get(1, 0, 1400) is None
+    assert packetization_plan.get(1, 4, 1400) == UNITS
@@ -0,0 +1,23 @@
+"""RTMP media messages"""
+import pytest
+from conftest import PPS, SPS
+from tube.rtmp.messages.data import DataMessageException, PacketType, VideoData
+
+
+def _sequence_header(length_size):
+    record = bytes([1, SPS[1], SPS[2], SPS[3], 0xfc | (length_size - 1), 0xe1]) + len(SPS).to_bytes(2, 'big') + SPS + \
+        b'\x01' + len(PPS).to_bytes(2, 'big') + PPS
+    return b'\x17\x00\x00\x00\x00' + record
+
+
+def test_streams_split_nal_units_by_configurations_of_their_own():
+    first = VideoData(_sequence_header(4), 0).configuration
+    second = VideoData(_sequence_header(2), 0).configuration
+    units = []
+    VideoData(b'\x27\x01\x00\x00\x00\x00\x00\x00\x02\x41\x9a', 40, lambda *args: units.append(args[1]), first)
+    VideoData(b'\x27\x01\x00\x00\x00\x00\x02\x41\x9a', 40, lambda *args: units.append(args[1]), second)
+    assert first.length_size == 4 and second.length_size == 2
+    assert units == [b'\x41\x9a', b'\x41\x9a']
+    with pytest.raises(DataMessageException):
+        VideoData(b'\x27\x01\x00\x00\x00\x00\x00\x00\x02\x41\x9a', 40)
+    assert VideoData(_sequence_header(4), 0).type == PacketType.SequenceHeader
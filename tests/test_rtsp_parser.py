@@ -0,0 +1,44 @@
+"""Incremental framing of RTSP client stream"""
+import pytest
+from tube.rtsp.parser import InterleavedPacket, Parser, ParserException, Request
+
+OPTIONS = b'OPTIONS rtsp://host/clip RTSP/1.0\r\nCSeq: 1\r\n\r\n'
+ANNOUNCE = b'ANNOUNCE rtsp://host/cam RTSP/1.0\r\nCSeq: 2\r\nContent-Length: 5\r\n\r\nv=0\r\n'
+
+
+def test_request_split_over_reads():
+    parser = Parser()
+    messages = []
+    for offset in range(len(ANNOUNCE)):
+        parser.feed(ANNOUNCE[offset:offset + 1])
+        messages.extend(parser)
+    assert len(messages) == 1 and isinstance(messages[0], Request)
+    assert messages[0].headers[0] == 'ANNOUNCE rtsp://host/cam RTSP/1.0'
+    assert messages[0].text.endswith('\r\n\r\nv=0\r\n')
+
+
+def test_pipelined_requests_and_interleaved_packets():
+    parser = Parser()
+    parser.feed(OPTIONS + b'$\x01\x00\x03abc' + b'\r\n' + ANNOUNCE + b'$\x00\x00')
+    messages = list(parser)
+    assert [type(message) for message in messages] == [Request, InterleavedPacket, Request]
+    assert messages[1].channel == 1 and bytes(messages[1].payload) == b'abc'
+    parser.feed(b'\x01x')
+    packet, = list(parser)
+    assert packet.channel == 0 and bytes(packet.payload) == b'x'
+
+
+@pytest.mark.parametrize('header', [b'Content-Length: -1', b'Content-Length: x',
+                                    f'Content-Length: {Parser.max_body_size + 1}'.encode()])
+def test_invalid_body_length_is_rejected(header):
+    parser = Parser()
+    parser.feed(b'ANNOUNCE rtsp://host/cam RTSP/1.0\r\n' + header + b'\r\n\r\n')
+    with pytest.raises(ParserException):
+        list(parser)
+
+
+def test_endless_header_is_rejected():
+    parser = Parser()
+    parser.feed(b'OPTIONS ' + bytes(Parser.max_header_size + 1))
+    with pytest.raises(ParserException):
+        list(parser)
@@ -0,0 +1,86 @@
+"""RTP over UDP unicast of RTSP sessions, over loopback"""
+import socket
+import time
+import pytest
+from tube.tcp.service import Service
+
+
+class Client:
+    """RTSP client of one connection"""
+    def __init__(self, port, name):
+        self.url = f'rtsp://127.0.0.1:{port}/{name}'
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+        self._cseq = 0
+        self._pending = b''
+
+    def request(self, method, url, *headers):
+        self._cseq += 1
+        self.sock.sendall(''.join([f'{method} {url} RTSP/1.0\r\nCSeq: {self._cseq}\r\n'] +
+                                  [f'{header}\r\n' for header in headers] + ['\r\n']).encode())
+        while b'\r\n\r\n' not in self._pending:
+            self._pending += self.sock.recv(65536)
+        head, _, self._pending = self._pending.partition(b'\r\n\r\n')
+        head = head.decode()
+        length = [int(k.split(':')[1]) for k in head.split('\r\n') if k.lower().startswith('content-length')]
+        while length and len(self._pending) < length[0]:
+            self._pending += self.sock.recv(65536)
+        body, self._pending = self._pending[:length[0] if length else 0], self._pending[length[0] if length else 0:]
+        return head, body.decode()
+
+
+@pytest.fixture
+def service(title, free_port):
+    rtsp = Service(('127.0.0.1', free_port), {'root': title})
+    rtsp.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', free_port)).close()
+            break
+        except OSError:
+            time.sleep(.05)
+    yield free_port
+    rtsp.terminate()
+    rtsp.join()
+
+
+def _udp_pair():
+    while True:
+        rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rtp.bind(('127.0.0.1', 0))
+        if rtp.getsockname()[1] % 2 == 0:
+            rtcp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                rtcp.bind(('127.0.0.1', rtp.getsockname()[1] + 1))
+                return rtp, rtcp
+            except OSError:
+                rtcp.close()
+        rtp.close()
+
+
+def test_rtp_and_sender_reports_arrive_on_client_ports(service):
+    rtp, rtcp = _udp_pair()
+    rtp.settimeout(5)
+    rtcp.settimeout(5)
+    client = Client(service, 'clip')
+    head, sdp = client.request('DESCRIBE', client.url)
+    assert head.startswith('RTSP/1.0 200')
+    track = [k.split(':')[1] for k in sdp.split('\r\n') if k.startswith('a=control:')][0]
+    port = rtp.getsockname()[1]
+    head, _ = client.request('SETUP', f'{client.url}/{track}',
+                             f'Transport: RTP/AVP;unicast;client_port={port}-{port + 1}')
+    assert head.startswith('RTSP/1.0 200') and 'server_port=' in head
+    session = [k for k in head.split('\r\n') if k.startswith('Session: ')][0].split(';')[0]
+    head, _ = client.request('PLAY', client.url, session, 'Range: npt=0.000-')
+    assert head.startswith('RTSP/1.0 200')
+
+    start = time.time()
+    packets = [rtp.recv(2048) for _ in range(10)]
+    assert all(packet[0] >> 6 == 2 and packet[1] & 0x7f == 96 for packet in packets)
+    assert time.time() - start > .2  # paced at 25 fps, not sent at once
+    report = rtcp.recv(2048)
+    assert report[0] >> 6 == 2 and report[1] == 200  # sender report
+
+    head, _ = client.request('TEARDOWN', client.url, session)
+    assert head.startswith('RTSP/1.0 200')
+    head, _ = client.request('PLAY', client.url, session, 'Range: npt=0.000-')
+    assert head.startswith('RTSP/1.0 454')
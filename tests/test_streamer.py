@@ -0,0 +1,8 @@
+"""RTP streaming of tracks"""
+from tube.rtp.streamer import AudioStreamer
+
+
+def test_audio_streamers_keep_scale_of_their_own():
+    fast, regular = AudioStreamer(97), AudioStreamer(97)
+    fast.trick_play.scale = 8
+    assert fast.trick_play.active and not regular.trick_play.active